@@ -1,21 +1,130 @@
+import copy
 import json
 import os
 import dashscope
 from tools.logger import logger
 
+# 运行中重新加载后可以直接生效的配置 (新的轮次使用新值), 其他配置需要重启服务
+HOT_RELOAD_KEYS = frozenset({
+    "ACCESS_TOKEN", "ALIYUN_API_KEY", "SYSTEM_PROMPT", "ai_persona",
+    "CHAT_MODEL", "INTENT_MODEL", "INTENT_MODE", "LOCAL_INTENT_ENABLED", "LOCAL_INTENT_THRESHOLD",
+    "HISTORY_MAX_TOKENS", "HISTORY_KEEP_TURNS", "HISTORY_SUMMARY_MODEL", "HISTORY_SUMMARY_MAX_CHARS",
+    "TTS_CHUNK_ENABLED", "TTS_CHUNK_FIRST_MIN_CHARS", "TTS_CHUNK_MIN_CHARS", "TTS_CHUNK_MAX_CHARS",
+    "VAD_MAX_BUFFER_MS", "VAD_NO_SPEECH_TIMEOUT_MS", "VAD_POST_SPEECH_BUFFER_MS",
+    "WS_BATCH_MAX_BYTES", "WS_BATCH_MAX_DELAY_MS",
+    "LOG_FORMAT", "LOG_LEVEL", "LOG_RATE_LIMITS", "LOG_SAMPLE_EVERY", "LOG_MAX_BYTES", "LOG_BACKUP_COUNT",
+    "LOG_COMPRESS", "CONFIG_WATCH_INTERVAL",
+})
+
 class Settings:
     def __init__(self):
         # 1. 设置默认值
         self.ACCESS_TOKEN = "123456"
         self.DEVICE_ID = "00:11:22:33:44:55"
         self.PROTOCOL_VERSION = 2
+        self.SUPPORTED_PROTOCOL_VERSIONS = [2, 3]  # 允许客户端协商的协议版本, v3 增加序列号和时间戳
+
+        # 合并发送 (客户端通过 Frame-Batching 请求头开启)
+        self.WS_BATCH_MAX_BYTES = 8192     # 单个容器消息的最大负载字节数
+        self.WS_BATCH_MAX_DELAY_MS = 20    # 首条消息入队后最多等待多久再发送
+
+        # 蓝绿重启: 新旧进程通过 SO_REUSEPORT 共用端口 (仅 Linux 等支持的平台);
+        # 旧进程收到 SIGUSR1 后停止接受新连接, 当前轮次结束 (最多等待 DRAIN_TIMEOUT 秒) 后关闭连接并退出
+        self.WS_REUSE_PORT = True
+        self.DRAIN_TIMEOUT = 30
+
+        # 流水线队列容量与溢出策略
+        # block: 阻塞上游 (超时后丢弃新数据), drop_oldest: 丢弃最旧的音频, cancel_turn: 取消当前轮次
+        self.TTS_TEXT_QUEUE_MAXSIZE = 64
+        self.TTS_TEXT_QUEUE_POLICY = "block"
+        self.AUDIO_QUEUE_MAXSIZE = 128       # TTS 生成的 PCM 片段
+        self.AUDIO_QUEUE_POLICY = "block"
+        self.WS_SEND_QUEUE_MAXSIZE = 256     # 约 10 秒的 opus 帧 (40ms/帧)
+        self.WS_SEND_QUEUE_POLICY = "drop_oldest"
+        self.QUEUE_BLOCK_TIMEOUT = 2         # block 策略的最长阻塞时间 (秒)
         
         self.ALIYUN_API_KEY = None  # 将从配置加载
         
         # 模型选择
         self.INTENT_MODEL = "qwen-turbo"       # 专门用于意图识别
         self.CHAT_MODEL = "qwen-turbo"         # 用于常规对话
+        # 意图识别方式: two_pass (先调用意图模型, 再调用对话模型) / tool_call (对话模型原生 tools, 单次调用)
+        # tool_call 调用失败时自动回退到 two_pass
+        self.INTENT_MODE = "two_pass"
+        # 本地意图快速匹配 (jieba 分词 + 示例语句索引), 有把握时跳过 LLM 意图识别
+        self.LOCAL_INTENT_ENABLED = True
+        self.LOCAL_INTENT_THRESHOLD = 0.8
+        # 意图识别结果缓存 (归一化语句 -> 函数调用列表), 注册函数变化时失效
+        self.INTENT_CACHE_SIZE = 256
+        self.INTENT_CACHE_TTL = 600  # 秒
         self.SYSTEM_PROMPT = "你是一个桌面机器人，名为Echo，友好简洁地回答用户问题。"
+        # 对话历史 token 预算: 超出后保留最近几轮, 更早的轮次在后台压缩为摘要
+        self.HISTORY_MAX_TOKENS = 2000
+        self.HISTORY_KEEP_TURNS = 4
+        self.HISTORY_SUMMARY_MODEL = ""   # 为空时使用 INTENT_MODEL
+        self.HISTORY_SUMMARY_MAX_CHARS = 200
+        # LLM 输出送入 TTS 前按标点分段: 第一段尽早送出, 之后按句聚合
+        self.TTS_CHUNK_ENABLED = True
+        self.TTS_CHUNK_FIRST_MIN_CHARS = 4
+        self.TTS_CHUNK_MIN_CHARS = 16
+        self.TTS_CHUNK_MAX_CHARS = 80
+        # 每轮延迟追踪: 写入 logs/trace_YYYYMMDD.log, 每隔若干轮输出各阶段 p50/p95/p99
+        self.TRACE_ENABLED = True
+        self.TRACE_SUMMARY_EVERY = 20
+        self.TRACE_CHROME_PATH = ""   # 例如 "./logs/trace_chrome.json", 为空时不导出
+        self.TRACE_CHROME_MAX_TURNS = 200
+        self.TRACE_CHROME_INTERVAL = 5.0   # 秒, 两次导出 Chrome trace 的最短间隔
+        # TTS 后端: dashscope (CosyVoice) / local (离线模拟, 输出确定性的音调)
+        self.TTS_BACKEND = "dashscope"
+        self.TTS_MODEL = "cosyvoice-v1"
+        self.TTS_VOICE = "longxiaochun"
+        self.TTS_LOCAL_RTF = 0.1                    # 合成耗时 / 音频时长
+        self.TTS_LOCAL_FIRST_CHUNK_DELAY_MS = 150
+        self.TTS_LOCAL_CHUNK_MS = 100
+        # 预热的 TTS 合成器池: 提前打开 ws 连接, 空闲超时后丢弃重建 (0 表示不使用)
+        self.TTS_POOL_SIZE = 2
+        self.TTS_POOL_MAX_IDLE = 10  # 秒
+        self.TTS_POOL_KEEP_WARM = 300  # 秒, 最近一次连接或轮次之后保持预热的时长, 之后不再补充, 避免空闲时反复建连
+        # 短语级 TTS 缓存: 缓存短回复编码好的 Opus 包, 磁盘目录为空时只用内存
+        self.TTS_CACHE_ENABLED = True
+        self.TTS_CACHE_SIZE = 256
+        self.TTS_CACHE_MAX_CHARS = 20
+        self.TTS_CACHE_DIR = ""
+        self.TTS_CACHE_DISK_MAX_ENTRIES = 2000
+        # 日志: 调用线程只入队, 后台线程格式化和写入; 可输出 JSON 行 (包含会话和轮次)
+        self.LOG_FORMAT = "text"        # text / json
+        self.LOG_LEVEL = "INFO"
+        self.LOG_RATE_LIMITS = {}       # {模块名: 每秒最多输出的 INFO/DEBUG 行数}, 例如 {"audio_handler": 5}
+        self.LOG_SAMPLE_EVERY = {}      # {模块名: N}, 每 N 行 INFO/DEBUG 日志只输出 1 行
+        # 日志文件按天切分, 超过大小上限时再按序号切分; 旧文件 gzip 压缩, 每种日志只保留最近的若干个
+        self.LOG_MAX_BYTES = 50 * 1024 * 1024
+        self.LOG_BACKUP_COUNT = 30
+        self.LOG_COMPRESS = True
+        # Prometheus 指标: 与 WebSocket 服务同进程, GET /metrics 抓取
+        self.METRICS_ENABLED = True
+        self.METRICS_HOST = "0.0.0.0"
+        self.METRICS_PORT = 8001
+        self.EVENT_LOOP_LAG_INTERVAL = 0.5  # 事件循环延迟的采样间隔 (秒)
+        # 仪表盘快照: 以 UDP 发送到本机的 config_ui (与其 METRICS_PUBLISH_PORT 环境变量一致)
+        self.METRICS_PUBLISH_ENABLED = True
+        self.METRICS_PUBLISH_PORT = 8003
+        self.METRICS_PUBLISH_INTERVAL = 0.25  # 秒
+
+        # LLM 提供方: dashscope (阿里云百炼) / openai (OpenAI 兼容接口, 如本地推理服务) / mock (离线模拟)
+        self.LLM_PROVIDER = "dashscope"
+        self.OPENAI_BASE_URL = "http://127.0.0.1:8002/v1"
+        self.OPENAI_API_KEY = ""
+        # mock 提供方: 以固定的首 token 延迟和速率流式返回预设回复
+        self.MOCK_LLM_RESPONSE = "你好，我是Echo，很高兴和你聊天。今天有什么可以帮你的吗？"
+        self.MOCK_LLM_COMPLETION = '{"function_call": {"name": "continue_chat"}}'  # 非流式调用 (意图识别) 的回复
+        self.MOCK_LLM_FIRST_TOKEN_DELAY_MS = 300
+        self.MOCK_LLM_TOKENS_PER_SECOND = 30
+
+        # 异步 LLM 客户端 (OpenAI 兼容接口, 共享 keep-alive 连接池, 需要 aiohttp)
+        self.LLM_ASYNC = True              # 关闭或未安装 aiohttp 时, 使用线程池 + 同步调用
+        self.LLM_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"  # dashscope 的兼容模式地址
+        self.LLM_MAX_CONCURRENCY = 32      # 同时进行的 LLM 请求上限
+        self.LLM_POOL_SIZE = 32            # HTTP 连接池大小
 
         # device
         self.ASR_DEVICE = "cpu"            # ASR 模型使用的设备
@@ -23,6 +132,13 @@ class Settings:
         
         # 其他模型配置
         self.VAD_MODEL_PATH = "models/FunAudioLLM/iic/speech_fsmn_vad_zh-cn-16k-common-pytorch"
+        # VAD 判定参数 (毫秒), 可热加载
+        self.VAD_MAX_BUFFER_MS = 15000          # 单次语音的最大长度
+        self.VAD_NO_SPEECH_TIMEOUT_MS = 3000    # 无语音活动的超时时间
+        self.VAD_POST_SPEECH_BUFFER_MS = 200    # 语音结束后的静音时长
+
+        # 配置热加载: 收到 SIGHUP 或配置文件修改后重新读取, 每隔多少秒检查一次文件 (0 表示只响应信号)
+        self.CONFIG_WATCH_INTERVAL = 2
 
         # 超时设置
         self.API_TIMEOUT = 10  # 秒
@@ -65,6 +181,24 @@ class Settings:
             logger.error(f"Failed to load config from {config_path}: {e}")
             raise
 
+    def reload_from_json(self, config_path: str):
+        """
+        运行中重新加载配置文件
+        - HOT_RELOAD_KEYS 中的配置立即生效
+        - 其他配置需要重启服务才能生效, 暂时保留当前值, 避免只有部分模块使用新值
+        - 先读入副本, 只把可以热加载的配置复制回来, 其他线程不会看到需要重启的配置被临时修改
+        :return: (已生效的配置名列表, 需要重启的配置名列表)
+        """
+        fresh = copy.deepcopy(self)
+        fresh.load_from_json(config_path)
+        current = vars(self)
+        changed = [key for key, value in vars(fresh).items() if current.get(key) != value]
+        applied = [key for key in changed if key in HOT_RELOAD_KEYS]
+        restart_required = [key for key in changed if key not in HOT_RELOAD_KEYS]
+        for key in applied:
+            setattr(self, key, getattr(fresh, key))
+        return applied, restart_required
+
     def Set_API_Key(self, api_key: str):
         """设置 API Key (保留此方法以向后兼容)"""
         logger.warning("Set_API_Key() is deprecated. Use ALIYUN_API_KEY in config.json instead.")
@@ -1,24 +1,38 @@
 """
 AIChat Server 配置管理 UI
 Web 界面用于配置 AI Persona、API 密钥等信息
-支持启动、停止、重启 Python 服务
+支持启动、停止、重启 Python 服务 (支持蓝绿方式的零停机重启)
+守护主服务: 意外退出时按指数退避自动重启, 记录每次运行的时长、峰值内存和 CPU, 可设置内存上限
+保存配置后通知主服务热加载, 只有修改了需要重启的配置时才提示重启
 实现实时日志流式传输到 WebSocket 客户端
+按时间范围、级别、会话和关键字搜索历史日志 (/api/logs/search)
+接收主服务发布的指标快照, 通过 /ws/metrics 推送给仪表盘页面
 """
 import uvicorn
 import json
 import os
+
+# 配置 UI 自己的日志写入 config_ui_YYYYMMDD.log, assistant_*.log 只由主服务切分和归档 (需在导入 logger 之前设置)
+os.environ["LOG_FILE_PREFIX"] = "config_ui"
 import subprocess
 import signal
 import time
 import threading
-import queue
 import asyncio
+import socket
+import tempfile
+import uuid
 from fastapi import FastAPI, Form, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, ValidationError
 from typing import Optional, Dict, List
 from tools.logger import logger
+from tools.log_fanout import LogFanout
+from tools.supervisor import ServiceSupervisor
+from tools.log_search import LogSearch, LEVELS
+from config.settings import HOT_RELOAD_KEYS
+from datetime import datetime
 
 app = FastAPI(title="AIChat Server Configuration UI", version="2.0.0")
 # 默认使用当前工作目录下的 ./config/config.json，允许通过 CONFIG_PATH 环境变量覆盖
@@ -30,17 +44,33 @@ CONFIG_DIR = os.path.dirname(CONFIG_FILE)
 service_process: Optional[subprocess.Popen] = None
 service_lock = threading.Lock()
 
-# [新增] 日志广播所需的全局变量
-log_queue: queue.Queue = queue.Queue()
-active_log_sockets: List[WebSocket] = []
-broadcast_task: Optional[asyncio.Task] = None
+# 日志分发: 读取线程 -> 环形缓冲 -> 每个浏览器连接独立的有界缓冲, 按批发送
+log_fanout = LogFanout(backlog_lines=int(os.environ.get("LOG_BACKLOG_LINES", "2000")),
+                       viewer_max_pending=int(os.environ.get("LOG_VIEWER_MAX_PENDING", "5000")))
 reader_thread: Optional[threading.Thread] = None
 
+# 重启方式: blue_green (新进程就绪后旧进程再退出, 设备无感知) / stop_start (先停止再启动)
+# 平台不支持 SO_REUSEPORT 时自动使用 stop_start
+RESTART_MODE = os.environ.get("RESTART_MODE", "blue_green")
+READY_TIMEOUT = float(os.environ.get("SERVICE_READY_TIMEOUT", "300"))        # 等待新进程加载模型的最长时间
+DRAIN_WAIT_TIMEOUT = float(os.environ.get("SERVICE_DRAIN_TIMEOUT", "60"))   # 超过主服务 DRAIN_TIMEOUT 后强制结束
+
+# 历史日志搜索: 与主服务使用同一个日志目录 (主服务在同一工作目录下启动)
+log_search = LogSearch(os.environ.get("LOG_DIR", "./logs"),
+                       archive_cache_bytes=int(os.environ.get("LOG_SEARCH_CACHE_MB", "256")) * 1024 * 1024)
+
+# 仪表盘: 主服务以 UDP 发布指标快照 (见 tools/metrics.py SnapshotPublisher), 这里只转发最新的一份
+METRICS_PUBLISH_PORT = int(os.environ.get("METRICS_PUBLISH_PORT", "8003"))
+active_metric_sockets: List[WebSocket] = []
+latest_metrics: Optional[str] = None
+metrics_event: Optional[asyncio.Event] = None
+metrics_broadcast_task: Optional[asyncio.Task] = None
+
 
 # [新增] 日志读取线程函数
-def log_reader_thread(process: subprocess.Popen, q: queue.Queue):
+def log_reader_thread(process: subprocess.Popen, fanout: LogFanout):
     """
-    在一个单独的线程中读取子进程的stdout，并将其放入队列。
+    在一个单独的线程中读取子进程的stdout，并发布到日志分发器。
     这可以防止主进程的I/O阻塞。
     
     注意：这个线程会在进程关闭时自动退出，不需要等待。
@@ -56,99 +86,86 @@ def log_reader_thread(process: subprocess.Popen, q: queue.Queue):
             
             # 1. 保留在终端的输出 (打印到 config_ui 的 stdout)
             print(line, end='', flush=True)
-            # 2. 放入队列，供WebSocket广播
-            try:
-                q.put(line, timeout=1.0)  # 1秒超时，避免队列满导致阻塞
-            except queue.Full:
-                logger.warning("Log queue is full, dropping oldest messages")
-                try:
-                    q.get_nowait()
-                except queue.Empty:
-                    pass
-                q.put(line)
+            # 2. 发布给浏览器 (不会阻塞, 慢的客户端只丢自己的数据)
+            fanout.post(line)
                 
     except Exception as e:
         logger.error(f"Log reader thread error: {e}")
-    finally:
-        # 尝试发送哨兵信号，但不阻塞
-        try:
-            q.put(None, timeout=0.5)
-        except queue.Full:
-            pass  # 队列满，不强制等待
 
 
-# [新增] WebSocket 广播任务
-async def websocket_broadcaster(q: queue.Queue):
-    """
-    一个常驻的 asyncio 任务，从队列中获取日志并广播。
-    使用超时避免卡顿。
-    """
-    loop = asyncio.get_event_loop()
-    while True:
-        try:
-            # 使用超时的 queue.get 避免永久卡顿
-            # 在 asyncio 中执行阻塞的 queue.get
-            def get_with_timeout():
-                try:
-                    return q.get(timeout=1.0)  # 1秒超时
-                except queue.Empty:
-                    return None  # 队列空，返回 None
-            
-            line = await loop.run_in_executor(None, get_with_timeout)
+# [新增] WebSocket 端点
+@app.websocket("/ws/logs")
+async def websocket_log_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    # 先发送最近的历史日志, 之后持续发送新日志, 直到连接断开
+    await log_fanout.serve(websocket)
 
-            # 如果队列空超时，继续等待下一条消息
-            if line is None:
-                await asyncio.sleep(0.1)
-                continue
 
-            if not active_log_sockets:
-                continue
+class MetricsSnapshotProtocol(asyncio.DatagramProtocol):
+    """接收主服务发布的指标快照, 只保留最新的一份"""
 
-            # [核心] 广播给所有连接的客户端
-            # 我们复制列表以防在迭代时有客户端断开连接
-            living_sockets = active_log_sockets[:]
-            for ws in living_sockets:
-                try:
-                    await ws.send_text(line)
-                except Exception:
-                    # 客户端可能已断开，从主列表中移除
-                    if ws in active_log_sockets:
-                        active_log_sockets.remove(ws)
+    def datagram_received(self, data, addr):
+        global latest_metrics
+        try:
+            latest_metrics = data.decode("utf-8")
+        except UnicodeDecodeError:
+            return
+        if metrics_event is not None:
+            metrics_event.set()
 
-        except Exception as e:
-            logger.error(f"Log broadcaster error: {e}")
-            await asyncio.sleep(1)
 
+async def metrics_broadcaster():
+    """
+    有新快照时推送给所有仪表盘客户端
+    发送慢的客户端会错过中间的快照, 只会收到最新的一份
+    """
+    while True:
+        await metrics_event.wait()
+        metrics_event.clear()
+        snapshot = latest_metrics
+        for ws in active_metric_sockets[:]:
+            try:
+                await asyncio.wait_for(ws.send_text(snapshot), timeout=1.0)
+            except Exception:
+                if ws in active_metric_sockets:
+                    active_metric_sockets.remove(ws)
 
-# [新增] WebSocket 端点
-@app.websocket("/ws/logs")
-async def websocket_log_endpoint(websocket: WebSocket):
+
+@app.websocket("/ws/metrics")
+async def websocket_metrics_endpoint(websocket: WebSocket):
     await websocket.accept()
-    active_log_sockets.append(websocket)
-    logger.info(f"Log client connected. Total clients: {len(active_log_sockets)}")
+    if latest_metrics is not None:
+        await websocket.send_text(latest_metrics)
+    active_metric_sockets.append(websocket)
+    logger.info(f"Metrics client connected. Total clients: {len(active_metric_sockets)}")
     try:
         while True:
-            # 保持连接打开，等待断开
             await websocket.receive_text()
     except WebSocketDisconnect:
-        logger.info("Log client disconnected.")
+        logger.info("Metrics client disconnected.")
     finally:
-        if websocket in active_log_sockets:
-            active_log_sockets.remove(websocket)
-        logger.info(f"Log client removed. Total clients: {len(active_log_sockets)}")
+        if websocket in active_metric_sockets:
+            active_metric_sockets.remove(websocket)
 
 # ============ 确保广播任务在主循环启动 ============
 
 @app.on_event("startup")
 async def on_startup():
-    """应用启动事件：初始化广播任务"""
-    global broadcast_task
+    """应用启动事件：绑定日志分发器的事件循环, 启动守护线程"""
+    log_fanout.bind(asyncio.get_event_loop())
+    logger.info("Log fan-out bound to the app event loop.")
+    supervisor.start()
+
+    # 接收主服务的指标快照
+    global metrics_event, metrics_broadcast_task
     try:
         loop = asyncio.get_event_loop()
-        broadcast_task = loop.create_task(websocket_broadcaster(log_queue))
-        logger.info("Log broadcaster task started on app startup.")
+        metrics_event = asyncio.Event()
+        await loop.create_datagram_endpoint(MetricsSnapshotProtocol, local_addr=("127.0.0.1", METRICS_PUBLISH_PORT))
+        metrics_broadcast_task = loop.create_task(metrics_broadcaster())
+        logger.info(f"Listening for metrics snapshots on udp://127.0.0.1:{METRICS_PUBLISH_PORT}")
     except Exception as e:
-        logger.error(f"Failed to start broadcaster task: {e}")
+        logger.error(f"Failed to start metrics receiver: {e}")
 
 # ============ Pydantic 模型 ============
 
@@ -160,6 +177,9 @@ class AIPersonaConfig(BaseModel):
 
 class FullConfig(BaseModel):
     """完整的配置模型"""
+    # 保留页面上没有的高级配置项 (如 LLM_PROVIDER), 避免保存时被丢弃
+    model_config = ConfigDict(extra="allow")
+
     ACCESS_TOKEN: str = "123456"
     ALIYUN_API_KEY: str
     CHAT_MODEL: str = "qwen-turbo"
@@ -181,12 +201,39 @@ if os.path.exists(static_dir):
 
 # ============ 服务进程管理函数（内部实现，无锁） ============
 
+def _spawn_service(extra_env: Optional[Dict[str, str]] = None):
+    """启动一个 main.py 子进程, 并启动读取其输出的日志线程"""
+    env = os.environ.copy()
+    env['PYTHONUNBUFFERED'] = '1'
+    env.pop('LOG_FILE_PREFIX', None)  # 主服务使用默认的 assistant 前缀
+    if extra_env:
+        env.update(extra_env)
+
+    process = subprocess.Popen(
+        ["python", "./main.py"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        encoding='utf-8',
+        errors='replace',
+        env=env
+    )
+
+    thread = threading.Thread(
+        target=log_reader_thread,
+        args=(process, log_fanout),
+        daemon=True
+    )
+    thread.start()
+    return process, thread
+
 def _start_service_impl():
     """
     启动 Python 主服务的内部实现（无锁）
     !!! 注意：此函数不应单独调用，它假定 service_lock 已经被持有
     """
-    global service_process, broadcast_task, reader_thread
+    global service_process, reader_thread
 
     if service_process and service_process.poll() is None:
         logger.warning("Service is already running (impl check)")
@@ -195,38 +242,7 @@ def _start_service_impl():
     try:
         logger.info("Starting AIChat main service...")
 
-        env = os.environ.copy()
-        env['PYTHONUNBUFFERED'] = '1'
-
-        service_process = subprocess.Popen(
-            ["python", "./main.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            encoding='utf-8',
-            errors='replace',
-            env=env
-        )
-
-        reader_thread = threading.Thread(
-            target=log_reader_thread,
-            args=(service_process, log_queue),
-            daemon=True
-        )
-        reader_thread.start()
-
-        if broadcast_task is None or broadcast_task.done():
-            # 必须在运行的事件循环上创建任务
-            try:
-                loop = asyncio.get_running_loop()
-                broadcast_task = loop.create_task(websocket_broadcaster(log_queue))
-                logger.info("Log broadcaster task started.")
-            except RuntimeError:
-                # 如果不在主线程，我们无法创建任务，这在 executor 中可能发生
-                # 这种情况下，广播任务必须在主线程启动时（例如 @app.on_event("startup")）就绪
-                logger.warning("Could not start broadcaster task from worker thread.")
-                pass
+        service_process, reader_thread = _spawn_service()
 
         time.sleep(1)  # 这仍然是阻塞的，但因为它在 executor 中运行，所以是安全的
 
@@ -272,9 +288,6 @@ def _stop_service_impl():
             logger.info("Waiting for log reader thread to stop...")
             reader_thread.join(timeout=2)
         
-        # 注意：在同步函数中无法安全地操作异步的 active_log_sockets
-        # active_log_sockets.clear() # 最好在异步端点中处理
-
         return {"success": True, "message": "服务已停止"}
 
     except Exception as e:
@@ -282,6 +295,116 @@ def _stop_service_impl():
         logger.error(error_msg)
         return {"success": False, "message": error_msg}
 
+def _notify_config_reload():
+    """
+    通知运行中的主服务重新加载配置文件
+    POSIX 上发送 SIGHUP 立即生效; 其他平台由主服务检查配置文件的修改时间 (CONFIG_WATCH_INTERVAL)
+    """
+    sighup = getattr(signal, "SIGHUP", None)
+    process = service_process  # 不获取 service_lock, 避免在事件循环中等待正在进行的重启
+    if sighup is None or process is None or process.poll() is not None:
+        return
+    try:
+        process.send_signal(sighup)
+        logger.info("Sent config reload signal to AIChat service")
+    except Exception as e:
+        logger.warning(f"Failed to signal config reload: {e}")
+
+def blue_green_supported() -> bool:
+    """新旧进程共用端口 (SO_REUSEPORT) 并通过 SIGUSR1 通知旧进程退出, 仅 Linux 等平台支持"""
+    return RESTART_MODE == "blue_green" and hasattr(socket, "SO_REUSEPORT") and hasattr(signal, "SIGUSR1")
+
+def _retire_process(process: subprocess.Popen, thread: threading.Thread):
+    """等待旧进程处理完当前轮次后退出, 超时则强制结束 (在后台线程中运行)"""
+    try:
+        process.wait(timeout=DRAIN_WAIT_TIMEOUT)
+        logger.info(f"Old service process exited (PID: {process.pid}, code: {process.returncode})")
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Old service process did not drain in time, killing it (PID: {process.pid})")
+        process.kill()
+        process.wait()
+    thread.join(timeout=2)
+
+def _blue_green_restart_impl():
+    """
+    零停机重启的内部实现（无锁）
+    1. 启动新进程, 与旧进程共用端口; 旧进程继续服务, 直到新进程加载完模型并开始监听 (就绪文件)
+    2. 向旧进程发送 SIGUSR1: 停止接受新连接, 当前轮次结束后关闭连接并退出, 设备重连到新进程
+    新进程启动失败时保留旧进程
+    !!! 注意：此函数不应单独调用，它假定 service_lock 已经被持有
+    """
+    global service_process, reader_thread
+
+    old_process, old_thread = service_process, reader_thread
+    ready_file = os.path.join(tempfile.gettempdir(), f"aichat_ready_{uuid.uuid4().hex}")
+    logger.info("Starting standby AIChat service for zero-downtime restart...")
+    try:
+        new_process, new_thread = _spawn_service({"SERVICE_READY_FILE": ready_file})
+    except Exception as e:
+        error_msg = f"Failed to start standby service: {e}"
+        logger.error(error_msg)
+        return {"success": False, "message": error_msg}
+
+    try:
+        deadline = time.time() + READY_TIMEOUT
+        while not os.path.exists(ready_file):
+            if new_process.poll() is not None:
+                error_msg = f"新服务启动失败 (退出码: {new_process.returncode})，旧服务继续运行"
+                logger.error(error_msg)
+                return {"success": False, "message": error_msg}
+            if time.time() > deadline:
+                new_process.kill()
+                new_process.wait()
+                error_msg = f"新服务 {READY_TIMEOUT} 秒内未就绪，旧服务继续运行"
+                logger.error(error_msg)
+                return {"success": False, "message": error_msg}
+            time.sleep(0.5)
+    finally:
+        try:
+            os.remove(ready_file)
+        except OSError:
+            pass
+
+    logger.info(f"Standby service ready (PID: {new_process.pid}), draining old service (PID: {old_process.pid})")
+    service_process, reader_thread = new_process, new_thread
+    try:
+        old_process.send_signal(signal.SIGUSR1)
+    except Exception as e:
+        logger.warning(f"Failed to signal old service, terminating it: {e}")
+        old_process.terminate()
+    threading.Thread(target=_retire_process, args=(old_process, old_thread), daemon=True).start()
+    return {"success": True, "message": "AI 聊天服务已无缝重启"}
+
+def _restart_service_impl(blue_green: bool = True):
+    """
+    重启服务的内部实现（无锁）: 平台支持时使用蓝绿方式, 否则先停止再启动
+    !!! 注意：此函数不应单独调用，它假定 service_lock 已经被持有
+    :param blue_green: 是否允许蓝绿方式; 守护线程因内存超限重启时为 False, 避免新旧两个完整进程同时占用内存
+    """
+    if not service_process or service_process.poll() is not None:
+        logger.warning("Service is not running, starting it...")
+        return _start_service_impl()
+    if blue_green and blue_green_supported():
+        return _blue_green_restart_impl()
+    logger.info("Restarting AIChat service...")
+    _stop_service_impl()
+    time.sleep(0.2) # 在 executor 中 sleep 是安全的
+    result = _start_service_impl()
+    result["message"] = "AI 聊天服务已重启"
+    return result
+
+# 守护线程: 启动/停止/重启接口通过 set_wanted 告知用户期望的状态
+supervisor = ServiceSupervisor(
+    service_lock,
+    get_process=lambda: service_process,
+    start=_start_service_impl,
+    restart=_restart_service_impl,
+    backoff_max=float(os.environ.get("SERVICE_BACKOFF_MAX", "60")),
+    crash_window=float(os.environ.get("SERVICE_CRASH_WINDOW", "300")),
+    crash_limit=int(os.environ.get("SERVICE_CRASH_LIMIT", "5")),
+    memory_limit_mb=float(os.environ.get("SERVICE_MEMORY_LIMIT_MB", "0")),
+)
+
 def get_service_status():
     """获取服务状态"""
     global service_process
@@ -290,14 +413,16 @@ def get_service_status():
         return {
             "running": False,
             "status": "stopped",
-            "message": "服务未运行"
+            "message": "服务未运行",
+            "supervisor": supervisor.status()
         }
     else:
         return {
             "running": True,
             "status": "running",
             "message": "服务正在运行",
-            "pid": service_process.pid
+            "pid": service_process.pid,
+            "supervisor": supervisor.status()
         }
 
 # ============ REST API 端点 ============
@@ -338,6 +463,31 @@ async def get_config():
         logger.error(f"Failed to get config: {e}")
         return {"success": False, "error": str(e)}
 
+def _fill_persona_defaults(config_data: dict) -> dict:
+    """补全 ai_persona 及其 background_facts (保存和比较新旧配置时使用同一规则)"""
+    if not config_data.get("ai_persona"):
+        config_data["ai_persona"] = {
+            "bot_name": "Echo",
+            "system_content": "你是一个桌面机器人，名为Echo，友好简洁地回答用户问题。",
+            "background_facts": []
+        }
+    elif "background_facts" not in config_data["ai_persona"]:
+        config_data["ai_persona"]["background_facts"] = []
+    return config_data
+
+def _changed_keys(old_config: dict, config_data: dict) -> List[str]:
+    """
+    新旧配置中值不同的配置名
+    旧文件先经过同一个模型补全默认值, 旧版本的 config.json 缺少的字段不会每次保存都被当作已修改;
+    旧文件无法通过校验时, 只比较其中实际存在的字段
+    """
+    try:
+        old_normalized = _fill_persona_defaults(FullConfig.model_validate(old_config).model_dump())
+    except ValidationError:
+        return sorted(key for key in old_config if old_config[key] != config_data.get(key))
+    return sorted(key for key in set(old_normalized) | set(config_data)
+                  if old_normalized.get(key) != config_data.get(key))
+
 @app.post("/api/config")
 async def save_config(config: FullConfig):
     """保存配置到 JSON 文件"""
@@ -346,34 +496,35 @@ async def save_config(config: FullConfig):
         os.makedirs(CONFIG_DIR, exist_ok=True)
         
         config_data = config.model_dump()
+
+        # 读取现有配置, 用于恢复隐藏的 API Key 和比较哪些配置发生了变化
+        old_config = {}
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                try:
+                    old_config = json.load(f)
+                except:
+                    pass
         
         # 如果 API Key 被隐藏（包含 *），从现有配置恢复
         if config_data.get("ALIYUN_API_KEY", "") and "*" in config_data.get("ALIYUN_API_KEY", ""):
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    try:
-                        old_config = json.load(f)
-                        config_data["ALIYUN_API_KEY"] = old_config.get("ALIYUN_API_KEY", "")
-                    except:
-                        pass
+            config_data["ALIYUN_API_KEY"] = old_config.get("ALIYUN_API_KEY", "")
         
-        # 确保 ai_persona 存在
-        if not config_data.get("ai_persona"):
-            config_data["ai_persona"] = {
-                "bot_name": "Echo",
-                "system_content": "你是一个桌面机器人，名为Echo，友好简洁地回答用户问题。",
-                "background_facts": []
-            }
-        else:
-            # 确保 background_facts 字段存在
-            if "background_facts" not in config_data["ai_persona"]:
-                config_data["ai_persona"]["background_facts"] = []
+        # 确保 ai_persona 及 background_facts 字段存在
+        _fill_persona_defaults(config_data)
         
         # 写入文件
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, indent=4, ensure_ascii=False)
         
         logger.info(f"Configuration saved to {CONFIG_FILE}")
+
+        # 通知主服务热加载; 需要重启才能生效的配置由页面提示用户重启
+        changed = _changed_keys(old_config, config_data)
+        restart_required = [key for key in changed if key not in HOT_RELOAD_KEYS]
+        reloaded = [key for key in changed if key in HOT_RELOAD_KEYS]
+        if reloaded:
+            _notify_config_reload()
         
         # 隐藏返回数据中的敏感信息
         return_data = config_data.copy()
@@ -387,7 +538,10 @@ async def save_config(config: FullConfig):
         return {
             "success": True,
             "message": "配置已保存",
-            "data": return_data
+            "data": return_data,
+            "reloaded": reloaded,
+            "restart_required": restart_required,
+            "service_running": get_service_status()["running"]
         }
     
     except Exception as e:
@@ -409,6 +563,7 @@ async def start_service_endpoint():
     def sync_start_task():
         # 在这里获取锁并调用实现
         with service_lock:
+            supervisor.set_wanted(True)
             result = _start_service_impl()
         
         status = get_service_status()
@@ -426,6 +581,7 @@ async def stop_service_endpoint():
 
     def sync_stop_task():
         with service_lock:
+            supervisor.set_wanted(False)
             result = _stop_service_impl()
         
         status = get_service_status()
@@ -435,13 +591,8 @@ async def stop_service_endpoint():
     loop = asyncio.get_event_loop()
     result = await loop.run_in_executor(None, sync_stop_task)
     
-    # [新增] 在异步上下文中安全地清理 WebSocket
-    for ws in active_log_sockets[:]:
-        try:
-            await ws.close(code=1001, reason="Service stopped")
-        except Exception:
-            pass # 客户端可能已经断开
-    active_log_sockets.clear()
+    # [新增] 在异步上下文中安全地关闭日志 WebSocket
+    await log_fanout.close_all(code=1001, reason="Service stopped")
     
     return result
 
@@ -452,32 +603,25 @@ async def restart_service_endpoint():
     def sync_restart_task():
         # 1. 在这里获取唯一的锁
         with service_lock:
-            # 2. 检查服务状态
-            if not service_process or service_process.poll() is not None:
-                logger.warning("Service is not running, starting it...")
-                # 3. 调用无锁的实现
-                result = _start_service_impl()
-            else:
-                logger.info("Restarting AIChat service...")
-                # 4. 调用无锁的停止实现
-                _stop_service_impl()
-                
-                time.sleep(0.2) # 在 executor 中 sleep 是安全的
-                
-                # 5. 调用无锁的启动实现
-                result = _start_service_impl()
-                result["message"] = "AI 聊天服务已重启"
+            # 2. 调用无锁的实现 (服务未运行时直接启动)
+            supervisor.set_wanted(True)
+            result = _restart_service_impl()
         
-        # 6. 获取最终状态
+        # 3. 获取最终状态
         status = get_service_status()
         result.update(status)
         return result
 
     loop = asyncio.get_event_loop()
-    # 7. 将整个阻塞和锁定的流程放入 executor
+    # 4. 将整个阻塞和锁定的流程放入 executor
     result = await loop.run_in_executor(None, sync_restart_task)
     return result
 
+@app.get("/api/service/runs")
+async def get_service_runs():
+    """最近几次运行的记录: 运行时长、退出码、结束原因、峰值内存和 CPU 时间"""
+    return {"success": True, "data": supervisor.runs()}
+
 @app.get("/api/health")
 async def health_check():
     """健康检查端点"""
@@ -489,6 +633,38 @@ async def health_check():
         "service_status": get_service_status()
     }
 
+def _parse_time(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} 格式错误, 应为 YYYY-MM-DD HH:MM:SS")
+
+
+@app.get("/api/logs/search")
+async def search_logs(start: Optional[str] = None, end: Optional[str] = None, level: Optional[str] = None,
+                      session: Optional[str] = None, q: Optional[str] = None, limit: int = 1000):
+    """
+    搜索历史日志, 以 NDJSON 流式返回: 每行一条匹配的日志, 最后一行为统计信息 ({"done": true, ...})
+    - start / end: 时间范围 (包含), 例如 2024-01-01 12:00:00
+    - level: 最低级别, session: 会话 ID, q: 关键字 (区分大小写)
+    """
+    start_time = _parse_time(start, "start")
+    end_time = _parse_time(end, "end")
+    if level and level.upper() not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"未知的日志级别: {level}")
+    if not os.path.isdir(log_search.log_dir):
+        raise HTTPException(status_code=404, detail="日志目录不存在")
+    limit = max(1, min(limit, 100000))
+
+    def stream():
+        # 同步生成器由 Starlette 放到线程池中执行, 不会阻塞事件循环
+        for item in log_search.search(start_time, end_time, level, session, q, limit):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 # ============ Web UI 页面路由 ============
 
 @app.get("/", response_class=HTMLResponse)
@@ -514,6 +690,14 @@ async def config_html():
     """配置管理页面"""
     return await index()
 
+@app.get("/dashboard", response_class=HTMLResponse)
+async def dashboard():
+    """实时性能仪表盘"""
+    dashboard_html_path = os.path.join(static_dir, "dashboard.html")
+    if not os.path.exists(dashboard_html_path):
+        raise HTTPException(status_code=404, detail="web_ui/dashboard.html not found")
+    return FileResponse(dashboard_html_path, media_type='text/html')
+
 
 if __name__ == "__main__":
     logger.info("Starting AIChat Configuration UI server on port 8080...")
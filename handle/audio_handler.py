@@ -3,6 +3,7 @@ from service_manager import ServiceManager
 import json
 from tools.logger import logger
 from config.settings import global_settings
+from tools.audio_processor import FRAME_TYPE_AUDIO, FRAME_TYPE_PLAYBACK
 
 
 class AudioHandler:
@@ -17,10 +18,19 @@ class AudioHandler:
         :return: 响应消息
         """
         # 解码音频数据
-        bin_protocol = self.service_manager.audio_processor.unpack_bin_frame(msg)
+        bin_protocol = self.service_manager.audio_processor.unpack_bin_frame_ex(msg)
         if bin_protocol:
-            protocol_version, type, payload = bin_protocol
-            if type == 0 and protocol_version == global_settings.protocol_version and self.service_manager.is_vad == False:
+            protocol_version, type, payload, seq, timestamp = bin_protocol
+            if protocol_version != self.service_manager.protocol_version:
+                logger.warning(f"Protocol version mismatch: {protocol_version}, expected {self.service_manager.protocol_version}")
+                return
+            if seq is not None:
+                if type == FRAME_TYPE_PLAYBACK:
+                    # 设备回报下行帧的播放时间, 用于端到端延迟统计
+                    self.service_manager.stream_stats.on_playback_report(seq, timestamp)
+                    return
+                self.service_manager.stream_stats.on_uplink_frame(seq, timestamp)
+            if type == FRAME_TYPE_AUDIO and self.service_manager.is_vad == False:
                 # 处理音频数据
                 pcm_data = self.service_manager.audio_processor.decode_audio(payload)
                 audio_data_np_array = np.frombuffer(pcm_data, dtype=np.int16)
@@ -34,9 +44,14 @@ class AudioHandler:
                 # 检测到语音结束
                 elif vad_result == 1:
                     self.service_manager.is_vad = True
+                    self.service_manager.stream_stats.on_speech_end(timestamp)
+                    self.service_manager.begin_trace()
+                    self.service_manager.trace_mark("vad_end")
+                    self.service_manager.trace_mark("asr_start")
                     asr_res = self.service_manager.asr_service.asr_generate_text()
+                    self.service_manager.trace_mark("asr_end")
                     # asr识别到，然后开一个任务进行对话
-                    self.service_manager.task_manager.submit_task(self.service_manager.chat_start_task, asr_res)
+                    self.service_manager.start_chat_task(asr_res)
                     # 发送asr识别结果
                     res =  {
                             "type": "asr",
@@ -57,9 +72,14 @@ class AudioHandler:
                 # 缓冲区已满
                 elif vad_result == 3:
                     self.service_manager.is_vad = True
+                    self.service_manager.stream_stats.on_speech_end(timestamp)
+                    self.service_manager.begin_trace()
+                    self.service_manager.trace_mark("vad_end")
+                    self.service_manager.trace_mark("asr_start")
                     asr_res = self.service_manager.asr_service.asr_generate_text()
+                    self.service_manager.trace_mark("asr_end")
                     # asr识别到，然后开一个任务进行对话
-                    self.service_manager.task_manager.submit_task(self.service_manager.chat_start_task, asr_res)
+                    self.service_manager.start_chat_task(asr_res)
                     # 发送asr识别结果
                     res =  {
                             "type": "asr",
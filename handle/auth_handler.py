@@ -1,17 +1,19 @@
 from tools.logger import logger
 
 class AuthHandler:
-    def __init__(self, access_token: str, device_id: str = None, protocol_version: int = 2):
+    def __init__(self, access_token: str, device_id: str = None, protocol_version: int = 2, supported_versions: list = None):
         """
         初始化 AuthHandler
 
         :param access_token: 用于验证的访问令牌
         :param device_id: 设备 ID (可选)
         :param protocol_version: 协议版本
+        :param supported_versions: 允许协商的协议版本列表 (可选, 默认只允许 protocol_version)
         """
         self.access_token = access_token
         self.device_id = device_id
         self.protocol_version = protocol_version
+        self.supported_versions = [str(v) for v in (supported_versions or [protocol_version])]
 
     def authenticate(self, headers: dict) -> bool:
         """
@@ -35,9 +37,30 @@ class AuthHandler:
             return False
 
         # 验证协议版本
-        if client_protocol_version != str(self.protocol_version):
+        if client_protocol_version not in self.supported_versions:
             logger.error("Authentication failed: Invalid protocol version")
             return False
 
         logger.info("Authentication successful")
         return True
+
+    def negotiate_protocol_version(self, headers: dict) -> int:
+        """
+        获取本次连接协商的协议版本, 需在 authenticate 通过后调用
+
+        :param headers: 客户端请求头
+        :return: 协议版本
+        """
+        client_protocol_version = headers.get("Protocol-Version")
+        if client_protocol_version in self.supported_versions:
+            return int(client_protocol_version)
+        return self.protocol_version
+
+    def batching_requested(self, headers: dict) -> bool:
+        """
+        客户端是否请求合并发送模式
+
+        :param headers: 客户端请求头
+        :return: 是否开启合并发送
+        """
+        return headers.get("Frame-Batching", "").lower() in ("1", "true", "yes")
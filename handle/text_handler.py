@@ -1,3 +1,5 @@
+import asyncio
+import json
 from service_manager import ServiceManager
 from tools.logger import logger
 from config.settings import global_settings, CONFIG_FILE_PATH
@@ -34,6 +36,11 @@ class TextHandler:
                 return {"type": "error", "message": "Invalid functions format"}
             self.handle_register_functions(functions)
 
+        elif data.get('type') == 'abort':
+            # 客户端主动打断当前轮次
+            if not self.service_manager.barge_in():
+                self.service_manager.ws_send_queue.put(json.dumps({"type": "abort", "state": "ack", "turn_id": None, "purged": 0}))
+
         elif data.get('type') == 'state':
             # client 端 idle 信息
             if data.get('state') == 'idle':
@@ -41,11 +48,15 @@ class TextHandler:
                 logger.info("Client is idle, resetting services")
 
             elif data.get('state') == 'listening':
+                # 上一轮还在进行时切回聆听, 视为用户打断
+                if self.service_manager.barge_in():
+                    logger.info("Client barged in, current turn cancelled")
                 self.service_manager.is_vad = False
                 self.service_manager.vad_service.reset()
                 self.service_manager.asr_service.reset()
-                # 提前打开tts流
-                self.service_manager.tts_service.tts_set(on_data=self.service_manager._tts_on_data, on_complete=self.service_manager._tts_on_complete)
+                # 提前为下一轮打开tts流: 合成器池为空时需要当场握手, 放到线程中执行, 不阻塞事件循环
+                # 本连接的后续消息 (语音) 在打开之后才处理, 不会在 TTS 流就绪前开始新一轮
+                await asyncio.get_running_loop().run_in_executor(None, self.service_manager.prepare_turn)
 
             elif data.get('state') == 'thinking':
                 logger.info("Client is thinking")
@@ -70,6 +81,7 @@ class TextHandler:
                 function_name = func.get('name')
                 description = func.get('description', '')
                 arguments = func.get('arguments', {})
+                examples = func.get('examples', [])  # 可选的示例语句, 用于本地意图快速匹配
 
                 # 检查必要字段
                 if not function_name or not isinstance(arguments, dict):
@@ -81,7 +93,8 @@ class TextHandler:
                     function_name=function_name,
                     description=description,
                     parameters=arguments,
-                    impl=self._generic_function_callback
+                    impl=self._generic_function_callback,
+                    examples=examples if isinstance(examples, list) else []
                 )
                 logger.info(f"成功注册函数: {function_name}, 描述: {description}, 参数: {arguments}")
 
@@ -1,20 +1,37 @@
 import asyncio
+import os
+import signal
+import socket
 from ws_server import WebSocketServer
 from threads.tts_thread import TTSGenerateThread
 from threads.audio_send_thread import AudioSendThread
 from tools.logger import logger
 from service_manager import ServiceManager
+from models.llm_client import close_async_llm_client
+from tools.metrics import MetricsServer, SnapshotPublisher, monitor_event_loop_lag
+from tools.dashboard import DashboardSnapshot
+from tools.config_reloader import ConfigReloader
 import sys
 sys.path.append("..")
 
 # !!! 导入新的配置加载器
 from config.settings import global_settings, CONFIG_FILE_PATH
 
+def configure_logger():
+    logger.configure(fmt=global_settings.LOG_FORMAT, level=global_settings.LOG_LEVEL,
+                     rate_limits=global_settings.LOG_RATE_LIMITS, sample_every=global_settings.LOG_SAMPLE_EVERY,
+                     max_bytes=global_settings.LOG_MAX_BYTES, backup_count=global_settings.LOG_BACKUP_COUNT,
+                     compress=global_settings.LOG_COMPRESS)
+
 async def main():
-    
+    # 尽早接管 SIGHUP: config_ui 可能在加载模型期间通知热加载, 默认动作会结束进程
+    reloader = ConfigReloader(global_settings, CONFIG_FILE_PATH)
+    reloader.listen_signal()
+
     # !!! 第一步：加载配置
     try:
         global_settings.load_from_json(CONFIG_FILE_PATH)
+        configure_logger()
         logger.info(f"AI Persona loaded: {global_settings.ai_persona.get('bot_name', 'Unknown')}")
     except Exception as e:
         logger.error(f"Failed to initialize settings: {e}")
@@ -32,6 +49,9 @@ async def main():
     tts_send_thread = AudioSendThread(service_manager)
     tts_send_thread.start()
 
+    # 蓝绿重启需要新旧进程共用端口 (SO_REUSEPORT, Windows 等平台不支持)
+    reuse_port = global_settings.WS_REUSE_PORT and hasattr(socket, "SO_REUSEPORT")
+
     # 启动 WebSocket 服务器
     # 3. 使用 global_settings 中的配置
     server = WebSocketServer(
@@ -40,10 +60,62 @@ async def main():
         access_token=global_settings.ACCESS_TOKEN,
         device_id=global_settings.DEVICE_ID,
         protocol_version=global_settings.PROTOCOL_VERSION,
-        service_manager=service_manager
+        service_manager=service_manager,
+        supported_protocol_versions=global_settings.SUPPORTED_PROTOCOL_VERSIONS,
+        reuse_port=reuse_port
     )
+    # 启动指标服务和事件循环延迟采样
+    metrics_server = None
+    lag_task = None
+    publish_task = None
+    if global_settings.METRICS_ENABLED:
+        metrics_server = MetricsServer(host=global_settings.METRICS_HOST, port=global_settings.METRICS_PORT,
+                                       reuse_port=reuse_port)
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.error(f"Failed to start metrics server: {e}")
+            metrics_server = None
+        lag_task = asyncio.create_task(monitor_event_loop_lag(global_settings.EVENT_LOOP_LAG_INTERVAL))
+    if global_settings.METRICS_PUBLISH_ENABLED:
+        # 供 config_ui 仪表盘使用的紧凑快照
+        publisher = SnapshotPublisher(DashboardSnapshot(service_manager).build, port=global_settings.METRICS_PUBLISH_PORT,
+                                      interval=global_settings.METRICS_PUBLISH_INTERVAL)
+        publish_task = asyncio.create_task(publisher.run())
+
+    # 配置热加载: 收到 SIGHUP 或配置文件修改后重新读取, 可以直接生效的配置同步到运行中的服务
+    def apply_settings(applied):
+        if any(key.startswith("LOG_") for key in applied):
+            configure_logger()
+        server.auth_handler.access_token = global_settings.ACCESS_TOKEN
+        service_manager.apply_settings()
+
+    reloader.on_reload = apply_settings
+    reload_task = asyncio.create_task(reloader.run())
+
+    # 蓝绿重启: 收到 SIGUSR1 后停止接受新连接, 当前轮次结束后退出
+    # 同时停止指标服务和快照发布, 新旧进程重叠期间 Prometheus 和仪表盘只看到新进程
+    def begin_drain():
+        asyncio.create_task(server.drain(global_settings.DRAIN_TIMEOUT))
+        if publish_task is not None:
+            publish_task.cancel()
+        if metrics_server is not None:
+            asyncio.create_task(metrics_server.stop())
+
+    loop = asyncio.get_running_loop()
+    drain_signal = getattr(signal, "SIGUSR1", None)
+    if drain_signal is not None:
+        loop.add_signal_handler(drain_signal, begin_drain)
+
+    def notify_ready():
+        # config_ui 通过 SERVICE_READY_FILE 等待新进程就绪 (模型已加载并开始监听)
+        ready_file = os.environ.get("SERVICE_READY_FILE")
+        if ready_file:
+            with open(ready_file, "w") as f:
+                f.write(str(os.getpid()))
+
     try:
-        await server.start_server()
+        await server.start_server(on_ready=notify_ready)
     except KeyboardInterrupt:
         logger.info("\n服务器正在关闭...")
     finally:
@@ -51,6 +123,14 @@ async def main():
         service_manager.stop_event.set()  # 设置停止事件
         # tts_generate_thread.join()
         tts_send_thread.join()
+        reload_task.cancel()
+        if lag_task is not None:
+            lag_task.cancel()
+        if publish_task is not None:
+            publish_task.cancel()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await close_async_llm_client()
         logger.info("服务器已关闭。")
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+import re
+import threading
+from typing import Dict, List
+from tools.logger import logger
+from config.settings import global_settings
+from models.llm_providers import get_llm_provider
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+SUMMARY_PROMPT = (
+    "你负责压缩语音助手的对话历史。请把已有摘要和新的对话记录合并为一段新的摘要, "
+    "保留用户的偏好、事实信息和未完成的话题, 不要编造内容, 不超过{max_chars}字, 只返回摘要正文。"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计文本的 token 数: 每个中日韩字符/全角标点约 1 个 token, 其余字符每 4 个约 1 个 token
+    :param text: 文本
+    :return: token 数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    """估计一条消息的 token 数 (包括角色和工具调用的开销)"""
+    tokens = 4 + estimate_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += 4 + estimate_tokens(function.get("name", "")) + estimate_tokens(function.get("arguments", ""))
+    return tokens
+
+
+class ChatHistory:
+    """
+    按 token 预算管理 LLMModel 的对话历史
+    特点：
+    - 增量统计 token 数, 只计算新增的消息
+    - 超出预算时, 保留最近 keep_turns 轮对话, 更早的轮次交给后台线程用 LLM 压缩为摘要
+    - 摘要完成后, 在下一轮请求前替换掉已压缩的消息, 摘要附加在系统提示词之后
+    - 后台线程不修改消息列表, 不会与正在进行的请求冲突
+    """
+
+    def __init__(self, max_tokens: int = None, keep_turns: int = None, summary_model: str = None):
+        """
+        :param max_tokens: 对话历史的 token 预算, <= 0 表示不限制
+        :param keep_turns: 始终原样保留的最近轮数
+        :param summary_model: 生成摘要使用的模型, 默认使用意图识别模型
+        """
+        self.max_tokens = max_tokens if max_tokens is not None else global_settings.HISTORY_MAX_TOKENS
+        self.keep_turns = keep_turns if keep_turns is not None else global_settings.HISTORY_KEEP_TURNS
+        self.summary_model = summary_model or global_settings.HISTORY_SUMMARY_MODEL or global_settings.INTENT_MODEL
+        self.system_prompt = global_settings.SYSTEM_PROMPT
+        self.summary = ""
+        self.tokens = 0
+        self.compactions = 0
+        self._messages = None      # 已统计的消息列表 (LLMModel.messages)
+        self._counted = 0          # 已统计的消息条数
+        self._lock = threading.Lock()
+        self._pending = None       # 正在压缩的消息
+        self._result = None        # (被压缩的消息, 新摘要)
+        self._generation = 0       # reset 后丢弃旧的后台结果
+
+    def set_system_prompt(self, prompt: str):
+        """设置基础系统提示词 (摘要附加在其后)"""
+        self.system_prompt = prompt
+
+    def reset(self):
+        """清除摘要和统计, 进行中的后台压缩结果将被丢弃"""
+        with self._lock:
+            self._generation += 1
+            self._pending = None
+            self._result = None
+        self.summary = ""
+        self.tokens = 0
+        self._messages = None
+        self._counted = 0
+
+    def system_content(self) -> str:
+        """系统提示词 + 对话摘要"""
+        if not self.summary:
+            return self.system_prompt
+        return f"{self.system_prompt}\n以下是之前对话的摘要:\n{self.summary}"
+
+    def _count(self, messages: List[Dict]):
+        if messages is not self._messages or len(messages) < self._counted:
+            # 消息列表被替换或回滚, 重新统计
+            self._messages = messages
+            self._counted = 0
+            self.tokens = 0
+        for message in messages[self._counted:]:
+            self.tokens += message_tokens(message)
+        self._counted = len(messages)
+
+    def _apply_result(self, messages: List[Dict]):
+        with self._lock:
+            result, self._result = self._result, None
+        if result is None:
+            return
+        compacted, summary = result
+        n = len(compacted)
+        # 只有被压缩的消息仍然原样位于历史开头时才替换
+        if len(messages) > n and all(a is b for a, b in zip(messages[1:n + 1], compacted)):
+            removed = sum(message_tokens(m) for m in compacted)
+            del messages[1:n + 1]
+            self.summary = summary
+            messages[0]["content"] = self.system_content()
+            self.compactions += 1
+            self._messages = None  # 系统消息已变化, 重新统计
+            self._count(messages)
+            logger.info(f"对话历史已压缩: 移除 {n} 条消息 (约 {removed} tokens), 当前约 {self.tokens} tokens")
+
+    def maintain(self, messages: List[Dict]):
+        """
+        在每轮请求前调用: 应用已完成的摘要, 统计 token, 超出预算时启动后台压缩
+        :param messages: LLMModel.messages, 第一条为系统消息
+        """
+        self._apply_result(messages)
+        self._count(messages)
+        if self.max_tokens <= 0 or self.tokens <= self.max_tokens:
+            return
+        with self._lock:
+            if self._pending is not None:
+                return
+            turn_starts = [i for i, m in enumerate(messages) if i > 0 and m.get("role") == "user"]
+            if len(turn_starts) <= self.keep_turns:
+                return
+            cut = turn_starts[-self.keep_turns] if self.keep_turns > 0 else len(messages)
+            compacted = self._pending = list(messages[1:cut])
+            generation = self._generation
+        threading.Thread(target=self._summarize, args=(compacted, self.summary, generation), daemon=True).start()
+
+    def _summarize(self, compacted: List[Dict], summary: str, generation: int):
+        lines = []
+        for message in compacted:
+            if message.get("role") in ("user", "assistant") and message.get("content"):
+                lines.append(f"{'用户' if message['role'] == 'user' else '助手'}: {message['content']}")
+        prompt = SUMMARY_PROMPT.format(max_chars=global_settings.HISTORY_SUMMARY_MAX_CHARS)
+        content = f"已有摘要:\n{summary or '无'}\n\n新的对话记录:\n" + "\n".join(lines)
+        new_summary = None
+        try:
+            message = get_llm_provider().complete(self.summary_model, [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": content},
+            ])
+            new_summary = (message.get("content") or "").strip()
+        except Exception as e:
+            logger.error(f"对话历史摘要生成失败: {e}")
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._pending = None
+            if new_summary:
+                self._result = (compacted, new_summary)
+
+    def stats(self) -> dict:
+        return {"tokens": self.tokens, "summary_chars": len(self.summary), "compactions": self.compactions}
@@ -0,0 +1,154 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List
+from tools.logger import logger
+from config.settings import global_settings
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 未安装时退回到线程池 + dashscope 同步调用
+    aiohttp = None
+
+
+class LLMClientError(Exception):
+    """LLM HTTP 接口返回错误"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"LLM request failed with status {status}: {message}")
+        self.status = status
+
+
+class AsyncLLMClient:
+    """
+    OpenAI 兼容 /chat/completions 接口的异步流式客户端
+    特点：
+    - 所有请求共享一个 aiohttp 会话和 keep-alive 连接池，避免每轮重新建连
+    - 并发请求数由信号量限制，而不是线程池的线程数
+    - 会话在首次请求时于当前事件循环中创建
+    """
+
+    def __init__(self, base_url: str = None, api_key: str = None, max_concurrency: int = None,
+                 pool_size: int = None, timeout: float = None):
+        """
+        :param base_url: 接口地址, 例如 https://dashscope.aliyuncs.com/compatible-mode/v1
+        :param api_key: API Key, None 表示百炼接口, 每次请求时读取配置中的 ALIYUN_API_KEY;
+                        其他接口传入各自的 Key, 为空字符串时不发送 Authorization 头
+        :param max_concurrency: 最大并发请求数
+        :param pool_size: 连接池大小
+        :param timeout: 连接和读取超时 (秒)
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed, async LLM client is unavailable")
+        self.base_url = (base_url or global_settings.LLM_BASE_URL).rstrip("/")
+        self._api_key = api_key
+        self.max_concurrency = max_concurrency or global_settings.LLM_MAX_CONCURRENCY
+        self.pool_size = pool_size or global_settings.LLM_POOL_SIZE
+        self.timeout = timeout or global_settings.API_TIMEOUT
+        self._session = None
+        self._semaphore = None
+
+    @property
+    def api_key(self) -> str:
+        # 每次请求时读取, 以便配置重新加载后生效; 只有百炼接口 (未指定 Key) 才使用 ALIYUN_API_KEY
+        return global_settings.ALIYUN_API_KEY if self._api_key is None else self._api_key
+
+    def _get_session(self):
+        """获取共享的 HTTP 会话 (需在事件循环中调用)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+            timeout = aiohttp.ClientTimeout(total=None, connect=self.timeout, sock_read=self.timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _post(self, session, body: Dict):
+        resp = await session.post(
+            f"{self.base_url}/chat/completions",
+            json=body,
+            headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None,
+        )
+        if resp.status != 200:
+            message = await resp.text()
+            resp.release()
+            raise LLMClientError(resp.status, message[:500])
+        return resp
+
+    async def stream_chat(self, model: str, messages: List[Dict], **extra) -> AsyncIterator[Dict]:
+        """
+        流式对话, 逐个返回 choices[0].delta
+
+        :param model: 模型名称
+        :param messages: 对话消息
+        :param extra: 其他请求参数, 例如 enable_search, tools
+        :return: delta 字典的异步生成器, 例如 {"content": "你好"}
+        """
+        session = self._get_session()
+        body = {"model": model, "messages": messages, "stream": True, **extra}
+        async with self._semaphore:
+            resp = await self._post(session, body)
+            try:
+                # SSE: 每个事件为一行 "data: {...}", 以 "data: [DONE]" 结束
+                async for line in resp.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == b"[DONE]":
+                        break
+                    chunk = json.loads(payload)
+                    for choice in chunk.get("choices", []):
+                        delta = choice.get("delta") or {}
+                        if choice.get("finish_reason"):
+                            delta = dict(delta, finish_reason=choice["finish_reason"])
+                        yield delta
+            finally:
+                resp.release()
+
+    async def chat(self, model: str, messages: List[Dict], **extra) -> Dict:
+        """
+        非流式对话
+
+        :param model: 模型名称
+        :param messages: 对话消息
+        :param extra: 其他请求参数
+        :return: choices[0].message 字典
+        """
+        session = self._get_session()
+        body = {"model": model, "messages": messages, "stream": False, **extra}
+        async with self._semaphore:
+            resp = await self._post(session, body)
+            try:
+                data = await resp.json()
+            finally:
+                resp.release()
+        return data["choices"][0]["message"]
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_shared_clients = {}
+
+
+def get_async_llm_client(base_url: str = None, api_key: str = None) -> AsyncLLMClient:
+    """
+    获取进程内共享的异步 LLM 客户端, 同一接口地址和 API Key 共用一个连接池
+    :param base_url: 接口地址, 默认使用配置中的 LLM_BASE_URL
+    :param api_key: API Key, None 表示百炼接口 (使用配置中的 ALIYUN_API_KEY), 空字符串表示不鉴权
+    """
+    base_url = (base_url or global_settings.LLM_BASE_URL).rstrip("/")
+    client = _shared_clients.get((base_url, api_key))
+    if client is None:
+        client = _shared_clients[(base_url, api_key)] = AsyncLLMClient(base_url, api_key)
+        logger.info(f"Async LLM client created: {client.base_url}, max concurrency {client.max_concurrency}")
+    return client
+
+
+async def close_async_llm_client():
+    """关闭所有共享的异步 LLM 客户端"""
+    for client in list(_shared_clients.values()):
+        await client.close()
+    _shared_clients.clear()
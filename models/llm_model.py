@@ -1,12 +1,44 @@
-from funasr import AutoModel
-import dashscope
 from tools.logger import logger
 from config.settings import global_settings, CONFIG_FILE_PATH
+from models.llm_providers import get_llm_provider, LLMProvider, ToolCallAccumulator
+from tools.stats import now_ms
+from tools.metrics import global_metrics
+
+LLM_FIRST_TOKEN_MS = global_metrics.histogram("llm_first_token_ms", "LLM 流式请求到第一个增量的耗时 (毫秒)")
+LLM_TOTAL_MS = global_metrics.histogram("llm_total_ms", "LLM 流式请求的总耗时 (毫秒)")
+LLM_ERRORS = global_metrics.counter("llm_errors_total", "LLM 请求失败次数")
+
+
+def _timed_stream(deltas):
+    """记录流式请求的首个增量延迟和总耗时 (中途被关闭或出错时不记录总耗时)"""
+    start = now_ms()
+    first = True
+    for delta in deltas:
+        if first:
+            first = False
+            LLM_FIRST_TOKEN_MS.observe(now_ms() - start)
+        yield delta
+    LLM_TOTAL_MS.observe(now_ms() - start)
+
+
+async def _timed_astream(deltas):
+    """同 _timed_stream (异步生成器)"""
+    start = now_ms()
+    first = True
+    async for delta in deltas:
+        if first:
+            first = False
+            LLM_FIRST_TOKEN_MS.observe(now_ms() - start)
+        yield delta
+    LLM_TOTAL_MS.observe(now_ms() - start)
+
 
 class LLMModel:
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, provider: LLMProvider = None):
         # 1. 从 global_settings 读取，而不是硬编码
         self.model_name = model_name or global_settings.CHAT_MODEL
+        # LLM 提供方 (dashscope / openai / mock), 默认由配置 LLM_PROVIDER 决定
+        self.provider = provider or get_llm_provider()
         # 2. 从 global_settings 读取系统提示词
         self.messages = [
             {"role": "system", "content": global_settings.SYSTEM_PROMPT}
@@ -29,6 +61,25 @@ class LLMModel:
         """
         self.messages.append({"role": role, "content": content})
 
+    def add_tool_calls(self, calls: list, result: str):
+        """
+        记录模型发起的工具调用及其结果
+
+        :param calls: 工具调用列表, 每项为 {"id", "name", "raw_arguments"}
+        :param result: 工具执行结果 (工具由 Client 端执行, 这里只记录已下发)
+        """
+        self.messages.append({
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [
+                {"id": call["id"], "type": "function",
+                 "function": {"name": call["name"], "arguments": call["raw_arguments"] or "{}"}}
+                for call in calls
+            ]
+        })
+        for call in calls:
+            self.messages.append({"role": "tool", "tool_call_id": call["id"], "name": call["name"], "content": result})
+
     def clear_messages(self):
         """
         清空对话历史记录
@@ -38,6 +89,13 @@ class LLMModel:
             {"role": "system", "content": global_settings.SYSTEM_PROMPT}
         ]
 
+    def _log_exception(self, prefix: str, e: Exception):
+        LLM_ERRORS.inc()
+        logger.error(f"{prefix}: {str(e)}")
+        # 检查是否是 API Key 问题
+        if "API-KEY is invalid" in str(e) or "unauthorized" in str(e).lower() or "status 401" in str(e):
+            logger.error(f"LLM API Key 验证失败。请检查 {CONFIG_FILE_PATH} 中的 API Key 配置。")
+
     def get_LLM_response(self, question: str) -> str:
         """
         非流式生成回答
@@ -49,62 +107,181 @@ class LLMModel:
             self.add_message("user", question)
 
         try:
-            response = dashscope.Generation.call(
-                # api_key=dashscope.api_key, # 不再需要在这里传递，已在 settings 中设置
-                model=self.model_name,
-                messages=self.messages,
-                result_format='message',
-                stream=False,
-                incremental_output=False,
-                enable_search=True
-            )
-
-            if response["status_code"] == 200:
-                content = response["output"]["choices"][0]["message"]["content"]
-                self.add_message("assistant", content)
-                return content
-            else:
-                logger.error(f"非流式生成失败，状态码: {response['status_code']}")
-                return "抱歉，我暂时无法处理您的请求。"
+            message = self.provider.complete(self.model_name, self.messages, enable_search=True)
+            content = message.get("content") or ""
+            self.add_message("assistant", content)
+            return content
         except Exception as e:
-            logger.error(f"非流式生成异常: {str(e)}")
-            # 检查是否是 API Key 问题
-            if "API-KEY is invalid" in str(e) or "unauthorized" in str(e).lower():
-                logger.error(f"Dashscope API Key 验证失败。请检查 {CONFIG_FILE_PATH} 中的 ALIYUN_API_KEY。")
+            self._log_exception("非流式生成异常", e)
             return "抱歉，我暂时无法处理您的请求。"
 
 
     def get_LLM_response_stream(self, question):
-        """获取百炼对话回答\r\n
+        """获取对话回答
         注意: 此处是yield生成器, 需要在外部循环中调用"""
+        mark = len(self.messages)
         # 如果在此添加用户问题
         if(question):
             self.add_message('user', question)
-        messages = self.messages
 
+        full_text = ''
+        settled = False
+        try:
+            for delta in _timed_stream(self.provider.stream(self.model_name, self.messages, enable_search=True)):
+                content = delta.get("content")
+                if content:
+                    full_text += content
+                    yield content
+            # 最后记录回复的信息
+            self.add_message('assistant', full_text)
+            settled = True
+        except Exception as e:
+            self._log_exception("An exception occurred", e)
+            self._settle_interrupted_turn(mark, full_text)
+            settled = True
+            yield -1
+        finally:
+            if not settled:
+                # 轮次被打断, 调用方中途关闭了生成器
+                self._settle_interrupted_turn(mark, full_text)
+
+    async def get_LLM_response_async(self, question: str) -> str:
+        """
+        非流式生成回答 (异步)
+
+        :param question: 用户问题
+        :return: 完整的回答
+        """
+        if question:
+            self.add_message("user", question)
+
+        try:
+            message = await self.provider.acomplete(self.model_name, self.messages, enable_search=True)
+            content = message.get("content") or ""
+            self.add_message("assistant", content)
+            return content
+        except Exception as e:
+            self._log_exception("非流式生成异常", e)
+            return "抱歉，我暂时无法处理您的请求。"
+
+    async def get_LLM_response_stream_async(self, question):
+        """获取对话回答 (异步流式)
+        注意: 此处是异步生成器, 需要使用 async for 调用"""
+        mark = len(self.messages)
+        if question:
+            self.add_message('user', question)
+
+        full_text = ''
+        settled = False
         try:
-            responses = dashscope.Generation.call(
-                # api_key=dashscope.api_key, # 不再需要在这里传递
-                model=self.model_name, # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-                messages=messages,
-                result_format='message',
-                stream=True,
-                incremental_output=True,
-                enable_search=True
-            )
-            full_text = ''
-            for response in responses:
-                if response["status_code"] == 200:
-                    for choice in response["output"]["choices"]:
-                        full_text += choice["message"]["content"]
-                        yield choice["message"]["content"]
-                else:
-                    logger.error(f"Failed to get LLM response with status code {response['status_code']}")
-                    yield -1
+            async for delta in _timed_astream(self.provider.astream(self.model_name, self.messages, enable_search=True)):
+                content = delta.get("content")
+                if content:
+                    full_text += content
+                    yield content
             # 最后记录回复的信息
             self.add_message('assistant', full_text)
+            settled = True
+        except Exception as e:
+            self._log_exception("An exception occurred", e)
+            self._settle_interrupted_turn(mark, full_text)
+            settled = True
+            yield -1
+        finally:
+            if not settled:
+                # 轮次被打断, 调用方中途关闭了生成器或任务被取消
+                self._settle_interrupted_turn(mark, full_text)
+
+    def get_LLM_response_stream_with_tools(self, question, tools: list):
+        """获取对话回答, 同时以原生 tools 的方式进行意图识别 (单次调用)
+        注意: 此处是yield生成器, 依次返回:
+            ("text", 文本片)
+            ("tool_call", {"id", "name", "arguments", "raw_arguments"}), 每个调用完整后立即返回
+            -1 表示出错"""
+        mark = len(self.messages)
+        if question:
+            self.add_message('user', question)
+
+        full_text = ''
+        calls = []
+        accumulator = ToolCallAccumulator()
+        settled = False
+        try:
+            for delta in _timed_stream(self.provider.stream(self.model_name, self.messages, tools=tools)):
+                for call in accumulator.feed(delta):
+                    calls.append(call)
+                    yield ("tool_call", call)
+                content = delta.get("content")
+                if content:
+                    full_text += content
+                    yield ("text", content)
+            for call in accumulator.finish():
+                calls.append(call)
+                yield ("tool_call", call)
+            self._record_tool_turn(full_text, calls)
+            settled = True
         except Exception as e:
-            logger.error(f"An exception occurred: {str(e)}")
-            if "API-KEY is invalid" in str(e) or "unauthorized" in str(e).lower():
-                logger.error(f"Dashscope API Key 验证失败。请检查 {CONFIG_FILE_PATH} 中的 ALIYUN_API_KEY。")
+            self._log_exception("An exception occurred", e)
+            # 还没有任何输出时撤销本轮的用户消息, 以便调用方回退到两次调用的方式
+            self._settle_interrupted_turn(mark, full_text, calls)
+            settled = True
             yield -1
+        finally:
+            if not settled:
+                self._settle_interrupted_turn(mark, full_text, calls)
+
+    async def get_LLM_response_stream_with_tools_async(self, question, tools: list):
+        """同 get_LLM_response_stream_with_tools (异步生成器)"""
+        mark = len(self.messages)
+        if question:
+            self.add_message('user', question)
+
+        full_text = ''
+        calls = []
+        accumulator = ToolCallAccumulator()
+        settled = False
+        try:
+            async for delta in _timed_astream(self.provider.astream(self.model_name, self.messages, tools=tools)):
+                for call in accumulator.feed(delta):
+                    calls.append(call)
+                    yield ("tool_call", call)
+                content = delta.get("content")
+                if content:
+                    full_text += content
+                    yield ("text", content)
+            for call in accumulator.finish():
+                calls.append(call)
+                yield ("tool_call", call)
+            self._record_tool_turn(full_text, calls)
+            settled = True
+        except Exception as e:
+            self._log_exception("An exception occurred", e)
+            # 还没有任何输出时撤销本轮的用户消息, 以便调用方回退到两次调用的方式
+            self._settle_interrupted_turn(mark, full_text, calls)
+            settled = True
+            yield -1
+        finally:
+            if not settled:
+                self._settle_interrupted_turn(mark, full_text, calls)
+
+    def _settle_interrupted_turn(self, mark: int, full_text: str, calls: list = ()):
+        """
+        流式回答没有正常结束 (被打断或出错) 时整理对话历史, 避免留下没有回复的用户消息
+        - 已有输出: 记录已生成的部分回复
+        - 没有输出: 撤销本轮的用户消息
+
+        :param mark: 本轮开始前的消息数
+        :param full_text: 已生成的文字
+        :param calls: 已完整返回的工具调用
+        """
+        if full_text or calls:
+            self._record_tool_turn(full_text, calls)
+        else:
+            del self.messages[mark:]
+
+    def _record_tool_turn(self, full_text: str, calls: list):
+        # 有工具调用时按 tools 协议记录, 以便需要时继续追问模型得到文字回复
+        if calls:
+            self.add_tool_calls(calls, "函数调用完成")
+        if full_text:
+            self.add_message('assistant', full_text)
@@ -0,0 +1,277 @@
+import asyncio
+import json
+import re
+import time
+import urllib.error
+import urllib.request
+from typing import AsyncIterator, Dict, Iterator, List
+import dashscope
+from tools.logger import logger
+from config.settings import global_settings
+from models.llm_client import LLMClientError, get_async_llm_client, aiohttp
+
+
+class LLMProvider:
+    """
+    LLM 提供方接口
+    - stream / astream: 流式对话, 逐个返回 delta 字典, 例如 {"content": "你好"}
+    - complete / acomplete: 非流式对话, 返回 message 字典, 例如 {"role": "assistant", "content": "..."}
+    - 出错时抛出异常, 由 LLMModel 统一处理
+    """
+    name = "base"
+
+    def async_available(self) -> bool:
+        """是否可以使用异步接口"""
+        return True
+
+    def stream(self, model: str, messages: List[Dict], **options) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def complete(self, model: str, messages: List[Dict], **options) -> Dict:
+        raise NotImplementedError
+
+    async def astream(self, model: str, messages: List[Dict], **options) -> AsyncIterator[Dict]:
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def acomplete(self, model: str, messages: List[Dict], **options) -> Dict:
+        raise NotImplementedError
+
+
+class DashScopeProvider(LLMProvider):
+    """阿里云百炼: 同步接口使用 dashscope SDK, 异步接口使用兼容模式 HTTP + 共享连接池"""
+    name = "dashscope"
+
+    def async_available(self) -> bool:
+        return aiohttp is not None
+
+    def stream(self, model, messages, **options):
+        responses = dashscope.Generation.call(
+            model=model,  # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+            messages=messages,
+            result_format='message',
+            stream=True,
+            incremental_output=True,
+            **options
+        )
+        for response in responses:
+            if response["status_code"] != 200:
+                raise LLMClientError(response["status_code"], response.get("message", ""))
+            for choice in response["output"]["choices"]:
+                delta = dict(choice["message"])
+                if choice.get("finish_reason") and choice["finish_reason"] != "null":
+                    delta["finish_reason"] = choice["finish_reason"]
+                yield delta
+
+    def complete(self, model, messages, **options):
+        response = dashscope.Generation.call(
+            model=model,
+            messages=messages,
+            result_format='message',
+            stream=False,
+            incremental_output=False,
+            **options
+        )
+        if response["status_code"] != 200:
+            raise LLMClientError(response["status_code"], response.get("message", ""))
+        return response["output"]["choices"][0]["message"]
+
+    async def astream(self, model, messages, **options):
+        async for delta in get_async_llm_client().stream_chat(model, messages, **options):
+            yield delta
+
+    async def acomplete(self, model, messages, **options):
+        return await get_async_llm_client().chat(model, messages, **options)
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    通用 OpenAI 兼容接口 (例如本地的 vLLM、llama.cpp、Ollama 推理服务)
+    - 同步接口使用标准库 urllib, 异步接口使用共享连接池
+    - 不支持 dashscope 专有的 enable_search 参数, 调用时会忽略
+    """
+    name = "openai"
+
+    def __init__(self, base_url: str = None, api_key: str = None):
+        self.base_url = (base_url or global_settings.OPENAI_BASE_URL).rstrip("/")
+        # 不会退回到 ALIYUN_API_KEY, 避免把百炼的 Key 发给第三方或本地接口
+        self.api_key = (api_key if api_key is not None else global_settings.OPENAI_API_KEY) or ""
+
+    def async_available(self) -> bool:
+        return aiohttp is not None
+
+    @staticmethod
+    def _options(options: Dict) -> Dict:
+        options = dict(options)
+        options.pop("enable_search", None)
+        return options
+
+    def _request(self, body: Dict):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            # 没有配置 Key 时不发送 Authorization 头 (与异步接口一致)
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        req = urllib.request.Request(f"{self.base_url}/chat/completions", data=json.dumps(body).encode("utf-8"),
+                                     headers=headers)
+        try:
+            return urllib.request.urlopen(req, timeout=global_settings.API_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            raise LLMClientError(e.code, e.read().decode("utf-8", "replace")[:500])
+
+    def stream(self, model, messages, **options):
+        body = {"model": model, "messages": messages, "stream": True, **self._options(options)}
+        with self._request(body) as resp:
+            for line in resp:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == b"[DONE]":
+                    break
+                for choice in json.loads(payload).get("choices", []):
+                    delta = choice.get("delta") or {}
+                    if choice.get("finish_reason"):
+                        delta = dict(delta, finish_reason=choice["finish_reason"])
+                    yield delta
+
+    def complete(self, model, messages, **options):
+        body = {"model": model, "messages": messages, "stream": False, **self._options(options)}
+        with self._request(body) as resp:
+            return json.loads(resp.read())["choices"][0]["message"]
+
+    async def astream(self, model, messages, **options):
+        client = get_async_llm_client(self.base_url, self.api_key)
+        async for delta in client.stream_chat(model, messages, **self._options(options)):
+            yield delta
+
+    async def acomplete(self, model, messages, **options):
+        client = get_async_llm_client(self.base_url, self.api_key)
+        return await client.chat(model, messages, **self._options(options))
+
+
+class ToolCallAccumulator:
+    """
+    拼接流式返回的 tool_calls 增量
+    - 每个工具调用的 name/arguments 分散在多个 delta 中, 以 index 区分
+    - 出现新的 index 或 finish_reason 时, 之前的调用即已完整, 可以立即分发
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._current = None
+
+    def _pop(self, index) -> Dict:
+        call = self._calls.pop(index)
+        try:
+            call["arguments"] = json.loads(call["raw_arguments"]) if call["raw_arguments"] else {}
+        except json.JSONDecodeError:
+            logger.error(f"工具调用参数解析失败: {call['raw_arguments']}")
+            call["arguments"] = {}
+        return call
+
+    def feed(self, delta: Dict) -> List[Dict]:
+        """
+        输入一个 delta
+        :return: 已完整的工具调用列表, 每项为 {"id", "name", "arguments", "raw_arguments"}
+        """
+        completed = []
+        for tool_call in delta.get("tool_calls") or []:
+            index = tool_call.get("index", 0)
+            if self._current is not None and index != self._current and self._current in self._calls:
+                completed.append(self._pop(self._current))
+            self._current = index
+            call = self._calls.setdefault(index, {"id": "", "name": "", "raw_arguments": ""})
+            if tool_call.get("id"):
+                call["id"] = tool_call["id"]
+            function = tool_call.get("function") or {}
+            if function.get("name"):
+                call["name"] += function["name"]
+            if function.get("arguments"):
+                call["raw_arguments"] += function["arguments"]
+        if delta.get("finish_reason"):
+            completed.extend(self.finish())
+        return completed
+
+    def finish(self) -> List[Dict]:
+        """流结束, 返回剩余的工具调用"""
+        return [self._pop(index) for index in sorted(self._calls)]
+
+
+def split_tokens(text: str) -> List[str]:
+    """
+    将文本切分为模拟的 token: 每个中文字符/标点为一个 token, 英文单词和数字连同前导空格为一个 token
+    """
+    return re.findall(r"\s*[A-Za-z0-9_.']+|\s*[^\sA-Za-z0-9_.']|\s+", text)
+
+
+class MockProvider(LLMProvider):
+    """
+    离线的模拟 LLM, 用于 CI 和容量测试
+    - 按固定的首 token 延迟和 token 速率流式返回预设回复, 结果完全可复现
+    - 非流式调用 (意图识别) 返回预设的 JSON
+    """
+    name = "mock"
+
+    def __init__(self, response: str = None, completion: str = None,
+                 first_token_delay_ms: float = None, tokens_per_second: float = None):
+        self.response = response if response is not None else global_settings.MOCK_LLM_RESPONSE
+        self.completion = completion if completion is not None else global_settings.MOCK_LLM_COMPLETION
+        self.first_token_delay_ms = (first_token_delay_ms if first_token_delay_ms is not None
+                                     else global_settings.MOCK_LLM_FIRST_TOKEN_DELAY_MS)
+        self.tokens_per_second = tokens_per_second or global_settings.MOCK_LLM_TOKENS_PER_SECOND
+
+    def schedule(self):
+        """
+        预设回复的 token 及其相对上一个 token 的延迟 (秒)
+        :return: [(delay, token), ...]
+        """
+        interval = 1.0 / self.tokens_per_second
+        tokens = split_tokens(self.response)
+        return [(self.first_token_delay_ms / 1000 if i == 0 else interval, token) for i, token in enumerate(tokens)]
+
+    def stream(self, model, messages, **options):
+        for delay, token in self.schedule():
+            time.sleep(delay)
+            yield {"content": token}
+        yield {"finish_reason": "stop"}
+
+    def complete(self, model, messages, **options):
+        time.sleep(self.first_token_delay_ms / 1000)
+        return {"role": "assistant", "content": self.completion}
+
+    async def astream(self, model, messages, **options):
+        for delay, token in self.schedule():
+            await asyncio.sleep(delay)
+            yield {"content": token}
+        yield {"finish_reason": "stop"}
+
+    async def acomplete(self, model, messages, **options):
+        await asyncio.sleep(self.first_token_delay_ms / 1000)
+        return {"role": "assistant", "content": self.completion}
+
+
+_PROVIDERS = {
+    DashScopeProvider.name: DashScopeProvider,
+    OpenAICompatibleProvider.name: OpenAICompatibleProvider,
+    MockProvider.name: MockProvider,
+}
+_provider_instances = {}
+
+
+def async_llm_available() -> bool:
+    """是否启用并可以使用异步 LLM 接口"""
+    return global_settings.LLM_ASYNC and get_llm_provider().async_available()
+
+
+def get_llm_provider(name: str = None) -> LLMProvider:
+    """
+    获取 LLM 提供方实例
+    :param name: 提供方名称 (dashscope / openai / mock), 默认使用配置中的 LLM_PROVIDER
+    """
+    name = name or global_settings.LLM_PROVIDER
+    if name not in _PROVIDERS:
+        raise ValueError(f"未知的 LLM 提供方: {name}, 可选: {list(_PROVIDERS)}")
+    if name not in _provider_instances:
+        _provider_instances[name] = _PROVIDERS[name]()
+        logger.info(f"LLM provider initialized: {name}")
+    return _provider_instances[name]
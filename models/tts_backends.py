@@ -0,0 +1,436 @@
+import math
+import queue
+import threading
+import time
+import zlib
+from array import array
+import dashscope
+from dashscope.audio.tts_v2 import *
+from tools.logger import logger
+from config.settings import global_settings
+
+
+class TTSBackend:
+    """
+    TTS 后端接口, 与 TTSModel 的流式接口一致
+    - tts_stream_set: 设置回调并准备一次流式合成 (on_data 收到 16kHz 单声道 16bit PCM)
+    - tts_stream_speech_synthesis: 送入一段文本
+    - tts_stream_close: 文本结束, 阻塞到合成完成
+    - tts_stream_cancel: 立即中止, 不再回调音频
+    """
+    name = "base"
+
+    def __init__(self, model: str = None, voice: str = None):
+        self.model = model or global_settings.TTS_MODEL
+        self.voice = voice or global_settings.TTS_VOICE
+
+    def tts_stream_set(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None) -> bool:
+        raise NotImplementedError
+
+    def tts_stream_speech_synthesis(self, text_chunk):
+        raise NotImplementedError
+
+    def tts_stream_close(self):
+        raise NotImplementedError
+
+    def tts_stream_cancel(self, wait=True):
+        raise NotImplementedError
+
+    def prewarm(self):
+        """即将使用 (例如设备已连接), 可以提前准备连接"""
+
+    def stats(self) -> dict:
+        return {}
+
+
+class _TTSCallback(ResultCallback):
+    """
+    可重新绑定处理函数的 TTS 回调
+    - 预热时还没有轮次使用, 只记录连接状态, 用于健康检查
+    - 交给某一轮使用时再绑定该轮的处理函数
+    """
+
+    def __init__(self):
+        self.healthy = True
+        self.bind()
+
+    def bind(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None):
+        self._on_open = on_open or (lambda: logger.debug("tts server-WS is open."))
+        self._on_complete = on_complete or (lambda: logger.info("Speech synthesis task completed successfully."))
+        self._on_error = on_error or (lambda message: logger.info(f"Speech synthesis task failed, {message}"))
+        self._on_close = on_close or (lambda: logger.debug("tts server-WS is closed."))
+        self._on_data = on_data or (lambda data: logger.debug(f"Audio result length: {len(data)}"))
+
+    # 实现 ResultCallback 必需的方法
+    def on_open(self):
+        self._on_open()
+
+    def on_complete(self):
+        self._on_complete()
+
+    def on_error(self, message: str):
+        self.healthy = False
+        self._on_error(message)
+
+    def on_close(self):
+        self.healthy = False
+        self._on_close()
+
+    def on_data(self, data: bytes) -> None:
+        self._on_data(data)
+
+
+class _WarmSynthesizer:
+    """已打开 ws 连接、等待使用的合成器"""
+
+    def __init__(self, synthesizer, callback: _TTSCallback):
+        self.synthesizer = synthesizer
+        self.callback = callback
+        self.created_at = time.monotonic()
+
+    def usable(self, max_idle: float) -> bool:
+        return self.callback.healthy and time.monotonic() - self.created_at < max_idle
+
+
+class SynthesizerPool:
+    """
+    预热的 TTS 流式合成器池
+    特点：
+    - 后台线程提前创建合成器并打开 ws 连接 (streaming_call('')), 每轮直接取用, 握手不在关键路径上
+    - 连接出错/关闭或空闲超过 max_idle 秒的合成器会被丢弃并补充新的
+    - 只在最近一次 touch/acquire (设备连接或开始一轮) 之后的 keep_warm 秒内补充, 没有设备使用时不反复建连
+    - 池为空时退回到当场创建
+    """
+
+    def __init__(self, factory, size: int = 1, max_idle: float = 10, check_interval: float = 1,
+                 keep_warm: float = 300):
+        """
+        :param factory: 创建合成器的函数, factory(callback) -> SpeechSynthesizer
+        :param size: 保持预热的合成器数量
+        :param max_idle: 合成器最长空闲时间 (秒), 超过后服务端可能已断开
+        :param check_interval: 健康检查间隔 (秒)
+        :param keep_warm: 最近一次使用之后继续补充的时长 (秒)
+        """
+        self.factory = factory
+        self.size = size
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self.keep_warm = keep_warm
+        self._warm_until = 0  # 启动时没有设备连接, 等第一次 touch 再预热
+        self._idle = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        threading.Thread(target=self._maintain, daemon=True, name="tts-pool").start()
+
+    def _warm(self):
+        """创建一个合成器并打开连接, 失败时返回 None"""
+        callback = _TTSCallback()
+        try:
+            synthesizer = self.factory(callback)
+            synthesizer.streaming_call('')  # 提前打开ws连接
+            return _WarmSynthesizer(synthesizer, callback)
+        except Exception as e:
+            logger.warning(f"TTS synthesizer warm-up failed: {e}")
+            return None
+
+    @staticmethod
+    def _discard(entry: _WarmSynthesizer):
+        try:
+            entry.synthesizer.streaming_cancel()
+        except Exception:
+            pass
+
+    def touch(self):
+        """即将使用, 在接下来的 keep_warm 秒内保持预热"""
+        self._warm_until = time.monotonic() + self.keep_warm
+        self._wakeup.set()
+
+    def _maintain(self):
+        failures = 0
+        while True:
+            with self._lock:
+                stale = [e for e in self._idle if not e.usable(self.max_idle)]
+                self._idle = [e for e in self._idle if e.usable(self.max_idle)]
+                self.discarded += len(stale)
+                warm = time.monotonic() < self._warm_until
+                missing = self.size - len(self._idle) if warm else 0
+                idle = len(self._idle)
+            for entry in stale:
+                self._discard(entry)
+            for _ in range(missing):
+                entry = self._warm()
+                if entry is None:
+                    failures += 1
+                    break
+                failures = 0
+                with self._lock:
+                    self._idle.append(entry)
+            # 连续预热失败时 (例如网络或 API Key 问题) 逐步拉长重试间隔; 不需要预热且池已空时等到下一次 touch
+            if warm or idle:
+                self._wakeup.wait(min(self.check_interval * 2 ** failures, 30))
+            else:
+                self._wakeup.wait()
+            self._wakeup.clear()
+
+    def acquire(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None):
+        """
+        取出一个合成器并绑定本轮的回调
+        :return: SpeechSynthesizer, 创建失败时返回 None
+        """
+        entry = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop(0)
+                if candidate.usable(self.max_idle):
+                    entry = candidate
+                    break
+                self.discarded += 1
+                threading.Thread(target=self._discard, args=(candidate,), daemon=True).start()
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None:
+            entry = self._warm()
+        # 通知后台线程补充
+        self.touch()
+        if entry is None:
+            return None
+        entry.callback.bind(on_open, on_complete, on_error, on_close, on_data)
+        return entry.synthesizer
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"idle": len(self._idle), "hits": self.hits, "misses": self.misses, "discarded": self.discarded}
+
+
+def _synthesizer_factory(model: str, voice: str):
+    def factory(callback):
+        return SpeechSynthesizer(
+            model=model,
+            voice=voice,
+            format=AudioFormat.PCM_16000HZ_MONO_16BIT,
+            callback=callback
+        )
+    return factory
+
+
+_shared_pools = {}
+
+
+def get_synthesizer_pool(model: str, voice: str) -> SynthesizerPool:
+    """获取进程内共享的合成器池, 每个 (模型, 音色) 一个"""
+    pool = _shared_pools.get((model, voice))
+    if pool is None:
+        pool = _shared_pools[(model, voice)] = SynthesizerPool(
+            _synthesizer_factory(model, voice), size=global_settings.TTS_POOL_SIZE,
+            max_idle=global_settings.TTS_POOL_MAX_IDLE, keep_warm=global_settings.TTS_POOL_KEEP_WARM)
+    return pool
+
+
+class DashScopeTTSBackend(TTSBackend):
+    """阿里云百炼 CosyVoice 流式合成, 使用预热的合成器池"""
+    name = "dashscope"
+
+    def __init__(self, model: str = None, voice: str = None):
+        super().__init__(model, voice)
+        self._factory = _synthesizer_factory(self.model, self.voice)
+        # 当前轮次的回调和合成器, 由 tts_stream_set 设置 (取自合成器池或当场创建)
+        self.callback = None
+        self.synthesizer = None
+        # 预热的合成器池, 大小为 0 时每轮当场创建
+        self.pool = get_synthesizer_pool(self.model, self.voice) if global_settings.TTS_POOL_SIZE > 0 else None
+
+    def tts_stream_set(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None):
+        '''设置TTS回调函数, 取用一个已打开ws连接的合成器'''
+        if self.pool is not None:
+            synthesizer = self.pool.acquire(on_open, on_complete, on_error, on_close, on_data)
+            if synthesizer is None:
+                return False
+            self.synthesizer = synthesizer
+            return True
+        self.callback = _TTSCallback()
+        self.callback.bind(on_open, on_complete, on_error, on_close, on_data)
+        self.synthesizer = self._factory(self.callback)
+        try:
+            self.synthesizer.streaming_call('') # 先提前打开ws连接
+            return True
+        except Exception as e:
+            return False
+
+    def tts_stream_close(self):
+        if self.synthesizer is None:
+            return
+        self.synthesizer.streaming_complete()
+        logger.info(f"Request ID: {self.synthesizer.get_last_request_id()}")
+
+    def tts_stream_cancel(self, wait=True):
+        '''立即中止流式合成, 不等待剩余音频
+
+        :param: wait: 是否等待中止完成, False 时在后台线程中中止 (调用时就确定要中止的合成器)'''
+        synthesizer = self.synthesizer
+        if synthesizer is None:
+            return
+
+        def cancel():
+            try:
+                synthesizer.streaming_cancel()
+            except Exception as e:
+                logger.warning(f"TTS cancel failed: {e}")
+
+        if wait:
+            cancel()
+        else:
+            threading.Thread(target=cancel, daemon=True).start()
+
+    def tts_stream_speech_synthesis(self, text_chunk):
+        '''流式语音合成
+
+        :param: text_chunk: 文本片
+        :return: 合成是否成功'''
+
+        if text_chunk and self.synthesizer is not None:
+            try:
+                self.synthesizer.streaming_call(text_chunk)
+            except Exception as e:
+                return False
+
+    def prewarm(self):
+        if self.pool is not None:
+            self.pool.touch()
+
+    def stats(self) -> dict:
+        return self.pool.stats() if self.pool is not None else {}
+
+
+def synthesize_tones(text: str, voice: str = "", sample_rate: int = 16000) -> bytes:
+    """
+    把文本确定性地"合成"为音调序列 (离线测试用)
+    - 每个字符一个音, 频率由字符和音色决定; 中文字符 160ms, 英文字母/数字 70ms
+    - 标点为 150ms 静音, 空白为 40ms 静音; 每个音首尾 10ms 淡入淡出, 避免爆音
+    :return: 16bit 单声道 PCM
+    """
+    base_freq = 180 + zlib.crc32(voice.encode("utf-8")) % 200
+    fade = sample_rate // 100
+    samples = array("h")
+    for ch in text:
+        if ch.isspace():
+            samples.extend([0] * (sample_rate * 40 // 1000))
+            continue
+        if not ch.isalnum():
+            samples.extend([0] * (sample_rate * 150 // 1000))
+            continue
+        n = sample_rate * (70 if ch.isascii() else 160) // 1000
+        freq = base_freq + (ord(ch) % 24) * 15
+        step = 2 * math.pi * freq / sample_rate
+        for i in range(n):
+            gain = min(1.0, i / fade, (n - i) / fade)
+            samples.append(int(9000 * gain * math.sin(step * i)))
+    return samples.tobytes()
+
+
+class LocalTTSBackend(TTSBackend):
+    """
+    离线的模拟 TTS, 用于 CI 和端到端延迟/容量测试
+    - 输出确定性的 16kHz PCM 音调, 每个字符一个音
+    - 首个音频块前等待 first_chunk_delay_ms, 之后按实时率 rtf 输出 (rtf=0.1 表示 1 秒音频用 0.1 秒生成)
+    - 回调时序与 DashScope 一致: on_open -> on_data... -> on_complete -> on_close
+    """
+    name = "local"
+
+    class _Stream:
+        def __init__(self, callback):
+            self.callback = callback
+            self.texts = queue.Queue()
+            self.cancelled = threading.Event()
+            self.thread = None
+
+    def __init__(self, model: str = None, voice: str = None, rtf: float = None,
+                 first_chunk_delay_ms: float = None, chunk_ms: int = None):
+        super().__init__(model, voice)
+        self.rtf = rtf if rtf is not None else global_settings.TTS_LOCAL_RTF
+        self.first_chunk_delay_ms = (first_chunk_delay_ms if first_chunk_delay_ms is not None
+                                     else global_settings.TTS_LOCAL_FIRST_CHUNK_DELAY_MS)
+        self.chunk_ms = chunk_ms or global_settings.TTS_LOCAL_CHUNK_MS
+        self.sample_rate = 16000
+        self._stream = None
+
+    def tts_stream_set(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None):
+        '''设置回调并启动合成线程'''
+        if self._stream is not None:
+            self.tts_stream_cancel(wait=False)
+        callback = _TTSCallback()
+        callback.bind(on_open, on_complete, on_error, on_close, on_data)
+        stream = self._stream = self._Stream(callback)
+        stream.thread = threading.Thread(target=self._run, args=(stream,), daemon=True, name="local-tts")
+        stream.thread.start()
+        return True
+
+    def _run(self, stream):
+        stream.callback.on_open()
+        chunk_bytes = self.sample_rate * self.chunk_ms // 1000 * 2
+        delay = self.first_chunk_delay_ms / 1000
+        while True:
+            text = stream.texts.get()
+            if text is None:
+                break
+            pcm = synthesize_tones(text, self.voice, self.sample_rate)
+            for i in range(0, len(pcm), chunk_bytes):
+                chunk = pcm[i:i + chunk_bytes]
+                delay += len(chunk) / 2 / self.sample_rate * self.rtf
+                if stream.cancelled.wait(delay):
+                    stream.callback.on_close()
+                    return
+                delay = 0
+                stream.callback.on_data(chunk)
+        if not stream.cancelled.is_set():
+            stream.callback.on_complete()
+        stream.callback.on_close()
+
+    def tts_stream_speech_synthesis(self, text_chunk):
+        '''流式语音合成
+
+        :param: text_chunk: 文本片'''
+        if text_chunk:
+            if self._stream is None:
+                self.tts_stream_set()
+            self._stream.texts.put(text_chunk)
+
+    def tts_stream_close(self):
+        '''文本结束, 等待合成完成'''
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.texts.put(None)
+            stream.thread.join()
+
+    def tts_stream_cancel(self, wait=True):
+        '''立即中止合成, 不再回调音频
+
+        :param: wait: 是否等待合成线程退出'''
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.cancelled.set()
+            stream.texts.put(None)
+            if wait and stream.thread is not threading.current_thread():
+                stream.thread.join()
+
+
+_BACKENDS = {
+    DashScopeTTSBackend.name: DashScopeTTSBackend,
+    LocalTTSBackend.name: LocalTTSBackend,
+}
+
+
+def create_tts_backend(name: str = None) -> TTSBackend:
+    """
+    创建 TTS 后端实例 (后端持有当前流的状态, 每个 TTSModel 一个)
+    :param name: 后端名称 (dashscope / local), 默认使用配置中的 TTS_BACKEND
+    """
+    name = name or global_settings.TTS_BACKEND
+    if name not in _BACKENDS:
+        raise ValueError(f"未知的 TTS 后端: {name}, 可选: {list(_BACKENDS)}")
+    logger.info(f"TTS backend: {name}")
+    return _BACKENDS[name]()
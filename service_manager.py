@@ -4,12 +4,51 @@ from services.chat_service import ChatService
 from services.tts_service import TTSService
 from tools.registry import global_registry
 from services.intent_service import IntentService
+from models.llm_providers import async_llm_available
 from tools.audio_processor import AudioProcessor
 from threads.task_manager import TaskManager
-from tools.logger import logger
+from tools.logger import logger, set_log_context
+from tools.stats import StreamStats, now_ms
+from tools.metrics import global_metrics
+from tools.bounded_queue import BoundedQueue
+from tools.text_chunker import TextChunker
+from tools.cancel_token import CancelToken
+from tools.tts_cache import TTSPhraseCache
+from tools.tracing import Tracer, TurnTrace, FINAL_STAGE
+from config.settings import global_settings
 import queue
 import threading
+import asyncio
 import json
+import uuid
+
+TTS_FIRST_CHUNK_MS = global_metrics.histogram("tts_first_chunk_ms", "每轮第一段文本送入 TTS 到收到第一块音频的耗时 (毫秒)")
+
+
+class TurnState(CancelToken):
+    """
+    一轮对话的取消令牌和状态
+    - 每轮创建一个, 显式传给对话任务、TTS 送入和 TTS 回调, 不通过 ServiceManager 上的共享字段读取
+    - 被打断的旧轮次即使稍后才退出, 也只会读写自己的状态, 不会影响下一轮
+    """
+
+    def __init__(self, turn_id: int, chunker: TextChunker, cacheable: bool):
+        """
+        :param turn_id: 轮次编号
+        :param chunker: 本轮的文本分段器
+        :param cacheable: 是否记录本轮的 Opus 包 (用于写入短语缓存)
+        """
+        super().__init__(turn_id)
+        self.chunker = chunker
+        self.trace = None               # 本轮的延迟追踪
+        self.tts_opened = False         # 是否已为本轮打开 TTS 流
+        self.has_text = False           # LLM 是否已输出文字
+        self.segments = []              # 送入 TTS 的文本段
+        self.packets = [] if cacheable else None  # TTS 音频编码出的 Opus 包, 不可缓存时为 None
+        self.first_text_ts = None       # 第一段文本送入 TTS 的时间, 收到第一块音频后清空
+        self.reply_parts = []           # LLM 输出的文本片, 结束时记录一次日志
+        self.audio_ended = False        # 音频结束标记是否已放入语音队列
+
 
 class ServiceManager:
     def __init__(self):
@@ -22,13 +61,51 @@ class ServiceManager:
         self.tts_service = TTSService()
         self.is_vad = False  # 防止VAD发生后还语音加入
 
-        self.tts_text_queue = queue.Queue() # 用于存放 TTS 生成的文本
-        self.audio_queue = queue.Queue()    # 用于存放生成的音频数据
-        self.ws_send_queue = queue.Queue()  # 用于存储ws需要发送的数据
+        # 当前连接协商的协议版本和音频流统计
+        self.protocol_version = global_settings.PROTOCOL_VERSION
+        self.stream_stats = StreamStats()
+        self.downlink_seq = 0  # 下行音频帧序列号 (v3)
+        self.session_id = uuid.uuid4().hex[:8]
+
+        # 每轮对话的延迟追踪
+        self.tracer = Tracer(summary_every=global_settings.TRACE_SUMMARY_EVERY,
+                             chrome_path=global_settings.TRACE_CHROME_PATH,
+                             chrome_max_turns=global_settings.TRACE_CHROME_MAX_TURNS,
+                             chrome_interval=global_settings.TRACE_CHROME_INTERVAL) if global_settings.TRACE_ENABLED else None
+        self.trace = None
+        self._trace_count = 0
+
+        # 有界队列, 保证客户端网络再慢, 单个会话占用的内存也有上限
+        self.cancel_token = CancelToken()  # 当前轮次 (TurnState), 队列溢出或用户打断时取消
+        self.cancel_token.finish()         # 初始没有进行中的轮次
+        self._pending_turn = None          # 客户端切回聆听时提前准备的下一轮 (已打开 TTS 流)
+        self._turn_seq = 0
+        self.tts_text_queue = BoundedQueue("tts_text_queue", global_settings.TTS_TEXT_QUEUE_MAXSIZE,
+                                           global_settings.TTS_TEXT_QUEUE_POLICY, on_overflow=self.cancel_turn,
+                                           block_timeout=global_settings.QUEUE_BLOCK_TIMEOUT)  # 用于存放 TTS 生成的文本
+        self.audio_queue = BoundedQueue("audio_queue", global_settings.AUDIO_QUEUE_MAXSIZE,
+                                        global_settings.AUDIO_QUEUE_POLICY, on_overflow=self.cancel_turn,
+                                        block_timeout=global_settings.QUEUE_BLOCK_TIMEOUT)  # 用于存放生成的音频数据
+        self.ws_send_queue = BoundedQueue("ws_send_queue", global_settings.WS_SEND_QUEUE_MAXSIZE,
+                                          global_settings.WS_SEND_QUEUE_POLICY, on_overflow=self.cancel_turn,
+                                          droppable=lambda item: isinstance(item, bytes),  # 只丢音频, 不丢控制消息
+                                          block_timeout=global_settings.QUEUE_BLOCK_TIMEOUT)  # 用于存储ws需要发送的数据
+
+        # 短语级 TTS 缓存: 本轮只合成了一个短语时, 记录其 Opus 包; 之后相同的短语直接发送
+        self.tts_cache = TTSPhraseCache(global_settings.TTS_CACHE_SIZE, global_settings.TTS_CACHE_MAX_CHARS,
+                                        global_settings.TTS_CACHE_DIR,
+                                        global_settings.TTS_CACHE_DISK_MAX_ENTRIES) if global_settings.TTS_CACHE_ENABLED else None
+
+        # 队列深度在抓取指标时读取, 不占用发送路径
+        global_metrics.gauge("queue_depth", "各队列当前长度").set_function(
+            lambda: {q.name: q.qsize() for q in (self.tts_text_queue, self.audio_queue, self.ws_send_queue)}, label="queue")
+        global_metrics.gauge("queue_dropped", "各队列累计丢弃的数据条数").set_function(
+            lambda: {q.name: q.dropped for q in (self.tts_text_queue, self.audio_queue, self.ws_send_queue)}, label="queue")
 
         self.stop_event = threading.Event() # 用于控制线程停止
 
         self.task_manager = TaskManager()   # 短生命周期的任务管理器
+        self.chat_task = None               # 异步模式下当前轮次的对话任务
 
         def continue_chat():
             return "继续聊天..."
@@ -37,8 +114,128 @@ class ServiceManager:
             return "再见！"
 
         # 默认的一些意图注册到系统
-        global_registry.register_function("continue_chat", "继续聊天意图", {}, continue_chat)
-        global_registry.register_function("exit_chat", "结束对话意图", {}, handle_exit_intent)
+        global_registry.register_function("continue_chat", "继续聊天意图", {}, continue_chat,
+                                          examples=["继续", "继续聊", "接着说", "然后呢"])
+        global_registry.register_function("exit_chat", "结束对话意图", {}, handle_exit_intent,
+                                          examples=["再见", "拜拜", "晚安", "退出", "不聊了", "下次再聊", "再见拜拜"])
+
+    def apply_settings(self):
+        """
+        配置热加载后, 把可以直接生效的配置同步到各服务 (见 config.settings.HOT_RELOAD_KEYS)
+        正在进行的轮次不受影响, 从下一轮开始使用新值
+        """
+        self.vad_service.apply_settings()
+        self.chat_service.apply_settings()
+        self.intent_service.apply_settings()
+        # 文本分段器每轮按当前配置创建, 无需同步
+
+    def start_session(self, protocol_version: int):
+        """
+        新连接鉴权通过后, 设置协商的协议版本并重置流统计
+        :param protocol_version: 协商的协议版本
+        """
+        self.protocol_version = protocol_version
+        self.stream_stats = StreamStats()
+        self.downlink_seq = 0
+        self.end_trace()
+        self.session_id = uuid.uuid4().hex[:8]
+        self._trace_count = 0
+        set_log_context(session=self.session_id, turn=None)
+        self.tts_service.tts_prewarm()
+
+    def begin_trace(self):
+        """语音结束, 开始追踪新的一轮 (上一轮如未结束则一并结束)"""
+        if self.tracer is None:
+            return
+        self.end_trace()
+        self._trace_count += 1
+        self.trace = TurnTrace(f"{self.session_id}-{self._trace_count}")
+
+    def trace_mark(self, stage: str, turn: TurnState = None):
+        """
+        记录一个时间点, 到达最后一个时间点时结束本轮追踪
+        :param stage: 时间点名称, 见 tools.tracing.STAGES
+        :param turn: 时间点所属的轮次, 默认为最近一次开始追踪的轮次
+        """
+        trace = self.trace if turn is None else turn.trace
+        if trace is not None and trace.mark(stage) and stage == FINAL_STAGE:
+            self.tracer.finish(trace)
+
+    def end_trace(self):
+        """结束当前轮次的追踪 (例如轮次被打断或没有音频)"""
+        trace, self.trace = self.trace, None
+        if trace is not None:
+            self.tracer.finish(trace)
+
+    def next_downlink_seq(self) -> int:
+        """获取下一个下行音频帧序列号"""
+        seq = self.downlink_seq
+        self.downlink_seq = (self.downlink_seq + 1) & 0xFFFFFFFF
+        return seq
+
+    @property
+    def turn_cancelled(self) -> bool:
+        """当前轮次是否已被取消"""
+        return self.cancel_token.cancelled
+
+    @property
+    def turn_active(self) -> bool:
+        """当前轮次的对话任务是否还在运行"""
+        return not self.cancel_token.done
+
+    @property
+    def user_speaking(self) -> bool:
+        """用户正在说话: VAD 已检测到语音, 但还没有判定语音结束 (新一轮尚未开始)"""
+        return not self.is_vad and self.vad_service.speech_detected
+
+    def cancel_turn(self, reason: str = "overflow") -> int:
+        """
+        取消当前轮次: 停止继续合成, 清空已排队的音频
+        :param reason: 取消原因
+        :return: 清除的排队数据条数
+        """
+        if self.cancel_token.cancel(reason):
+            logger.warning(f"取消当前轮次 {self.cancel_token.turn_id}, 原因: {reason}")
+        return self.tts_text_queue.purge() + self.audio_queue.purge() + self.ws_send_queue.purge()
+
+    def barge_in(self, reason: str = "barge_in") -> bool:
+        """
+        用户打断: 停止正在进行的 LLM 生成、TTS 合成和音频发送, 并通知客户端
+        :param reason: 打断原因
+        :return: 是否打断了正在进行的轮次
+        """
+        token = self.cancel_token
+        if token.cancelled:
+            return False
+        # 对话任务已结束时, 本轮的音频可能还在队列中没有发出 (客户端会继续播放), 同样需要打断
+        if not self.turn_active and not (self.audio_queue.has_droppable() or self.ws_send_queue.has_droppable()):
+            return False
+        playing_only = not self.turn_active
+        purged = self.cancel_turn(reason)
+        self.end_trace()
+        if not playing_only:
+            # 在这里就中止 TTS, 之后客户端会为下一轮重新打开 TTS 流 (任务已结束时 TTS 流已经关闭)
+            self.tts_service.tts_cancel(wait=False, owner=token)
+        if self.chat_task is not None and not self.chat_task.done():
+            # 异步模式下直接取消任务, 正在等待的 LLM 请求会立即中止
+            self.chat_task.cancel()
+        self.ws_send_queue.put(json.dumps({
+            "type": "abort",
+            "state": "ack",
+            "turn_id": token.turn_id,
+            "purged": purged,
+        }))
+        return True
+
+    def queue_stats(self) -> dict:
+        """
+        获取各队列的统计信息 (长度、最高水位、丢弃数)
+        """
+        return {
+            "tts_text_queue": self.tts_text_queue.stats(),
+            "audio_queue": self.audio_queue.stats(),
+            "ws_send_queue": self.ws_send_queue.stats(),
+        }
 
     def reset_services(self):
         """
@@ -53,32 +250,203 @@ class ServiceManager:
         except Exception as e:
             pass
 
-    def _tts_on_data(self, data):
+    def _tts_on_data(self, turn: TurnState, data):
         """
-        TTS 生成回调函数
+        TTS 生成回调函数 (绑定打开 TTS 流时的轮次)
+        :param turn: 音频所属的轮次
         :param data: 生成的音频数据
         """
-        # 将生成的音频数据放入语音队列
-        self.audio_queue.put(data)
+        # 将生成的音频数据连同所属轮次放入语音队列, 轮次已取消时丢弃
+        if turn.cancelled:
+            return
+        self.trace_mark("tts_first_pcm", turn)
+        first_text_ts, turn.first_text_ts = turn.first_text_ts, None
+        if first_text_ts is not None:
+            TTS_FIRST_CHUNK_MS.observe(now_ms() - first_text_ts)
+        latency = self.stream_stats.on_tts_audio()
+        if latency is not None:
+            logger.info(f"LLM 首 token -> TTS 首音频: {latency:.0f} ms")
+        self.audio_queue.put((turn, data))
         # logger.info(f"Received TTS data: {len(data)} bytes")
 
-    def _tts_on_complete(self):
+    def _tts_on_complete(self, turn: TurnState):
+        if turn.cancelled or turn.audio_ended:
+            # 已被打断的轮次, 客户端已收到 abort 确认; 或者没有文本送入 TTS, 结束标记已经放入
+            return
+        # 标记本轮音频结束, 发送线程发完之前的音频后再通知客户端并写入短语缓存
+        turn.audio_ended = True
+        self.audio_queue.put((turn, None))
+
+    def _new_turn(self) -> TurnState:
+        self._turn_seq += 1
+        chunker = TextChunker(global_settings.TTS_CHUNK_FIRST_MIN_CHARS, global_settings.TTS_CHUNK_MIN_CHARS,
+                              global_settings.TTS_CHUNK_MAX_CHARS)
+        return TurnState(self._turn_seq, chunker, self.tts_cache is not None)
+
+    def _open_tts(self, turn: TurnState):
+        """为一轮打开 TTS 流, 回调绑定该轮, 被打断的合成器迟到的回调不会算到新一轮"""
+        turn.tts_opened = True
+        self.tts_service.tts_set(on_data=lambda data: self._tts_on_data(turn, data),
+                                 on_complete=lambda: self._tts_on_complete(turn), owner=turn)
+
+    def prepare_turn(self):
+        """
+        客户端切回聆听时调用: 提前创建下一轮并打开 TTS 流, 握手不在语音结束后的关键路径上
+        合成器池为空时会阻塞到握手完成, 在事件循环中需通过 run_in_executor 调用
+        """
+        self._pending_turn = self._new_turn()
+        self._open_tts(self._pending_turn)
+
+    def start_chat_task(self, text):
+        """
+        为识别到的文本启动一轮对话
+        - 启用异步 LLM 客户端时, 在事件循环中直接 await, 并发数由信号量限制
+        - 否则提交到线程池, 使用 dashscope 同步调用
+        :param text: 文本
+        """
+        previous = self.cancel_token
+        if not previous.done:
+            # 上一轮的对话任务还没有退出 (通常已在 barge_in 中取消), 不能再往 TTS 送文本
+            previous.cancel("superseded")
+        # 轮次在提交任务前确定, 以便任务开始前的打断也能生效
+        turn, self._pending_turn = self._pending_turn or self._new_turn(), None
+        turn.trace = self.trace
+        self.cancel_token = turn
+        set_log_context(turn=turn.turn_id)
+        if async_llm_available():
+            self.chat_task = asyncio.get_running_loop().create_task(self.chat_start_task_async(turn, text))
+        else:
+            self.task_manager.submit_task(self.chat_start_task, turn, text)
+
+    def _tts_split(self, turn: TurnState, text_chunk) -> list:
+        """
+        记录 LLM 输出的文本片, 按标点分段
+        :param turn: 所属轮次
+        :param text_chunk: 文本片
+        :return: 可以送入 TTS 的文本段列表, 轮次已取消时为空
+        """
+        turn.reply_parts.append(text_chunk)
+        if turn.cancelled:
+            return []
+        if not turn.has_text:
+            turn.has_text = True
+            self.trace_mark("llm_first_token", turn)
+            self.stream_stats.on_llm_first_token()
+        if not global_settings.TTS_CHUNK_ENABLED:
+            return [text_chunk]
+        return turn.chunker.feed(text_chunk)
+
+    def _tts_segments(self, turn: TurnState, segments):
+        for segment in segments:
+            self._tts_segment(turn, segment)
+
+    def _tts_feed(self, turn: TurnState, text_chunk):
+        """
+        将 LLM 输出的文本片送入 TTS (按标点分段)
+        :param turn: 所属轮次
+        :param text_chunk: 文本片
+        """
+        self._tts_segments(turn, self._tts_split(turn, text_chunk))
+
+    async def _tts_feed_async(self, turn: TurnState, text_chunk):
+        """
+        同 _tts_feed (在事件循环中调用): 分段在事件循环中进行, 送入 TTS 放到线程中执行
+        合成器池为空时 streaming_call 需要当场握手, 不能阻塞事件循环; 逐个等待, 文本段的顺序不变
+        """
+        segments = self._tts_split(turn, text_chunk)
+        if segments:
+            await asyncio.get_running_loop().run_in_executor(None, self._tts_segments, turn, segments)
+
+    def _cache_key(self, text):
+        model, voice = self.tts_service.cache_identity()
+        return self.tts_cache.make_key(model, voice, self.audio_processor.frame_duration_ms, text)
+
+    def _tts_segment(self, turn: TurnState, segment):
+        """
+        送出一个文本段: 本轮还没有文本送入 TTS 时, 先查短语缓存 (之后的音频顺序无法保证, 不再查)
+        :param turn: 所属轮次
+        :param segment: 文本段
+        """
+        if self.tts_cache is not None and not turn.segments and self.tts_cache.cacheable(segment):
+            packets = self.tts_cache.get(self._cache_key(segment))
+            if packets is not None:
+                logger.info(f"TTS 缓存命中: {segment}")
+                self.trace_mark("tts_first_text", turn)
+                self.stream_stats.on_tts_audio()
+                self.audio_queue.put((turn, packets))
+                return
+        turn.segments.append(segment)
+        if len(turn.segments) > 1:
+            turn.packets = None
+        else:
+            turn.first_text_ts = now_ms()
+        self.trace_mark("tts_first_text", turn)
+        self.tts_service.tts_speech_stream(segment, owner=turn)
+
+    def record_turn_packet(self, token: TurnState, packet):
+        """
+        发送线程编码出一个 Opus 包 (用于写入短语缓存)
+        :param token: 音频所属的轮次
+        :param packet: Opus 包
+        """
+        if token.packets is not None and not token.cancelled:
+            token.packets.append(packet)
+
+    def finish_turn_audio(self, token: TurnState):
+        """
+        本轮 TTS 音频已全部编码: 通知客户端合成结束, 只合成了一个短语时写入缓存
+        :param token: 音频所属的轮次
+        """
+        if token.cancelled:
+            return
         msg = {
             "type": "tts",
             "state": "end",
         }
         self.ws_send_queue.put(json.dumps(msg))
+        if self.tts_cache is None:
+            return
+        packets, token.packets = token.packets, None
+        if packets and len(token.segments) == 1 and self.tts_cache.cacheable(token.segments[0]):
+            self.tts_cache.put(self._cache_key(token.segments[0]), packets)
 
-    def chat_start_task(self, text):
+    def _tts_finish(self, turn: TurnState):
         """
-        处理识别到的文本，进行对话
-        :param self: ServiceManager 实例
-        :param text: 文本
+        送出剩余文本并关闭 TTS 流, 轮次已取消时直接中止合成
+        TTS 流已属于其他轮次时 (本轮被打断后下一轮已开始) 不会关闭或中止它
+        :param turn: 所属轮次
+        """
+        # 整轮回复只记录一次日志, 不在每个文本片上输出
+        if turn.reply_parts:
+            logger.info(f"[回复]: {''.join(turn.reply_parts)}")
+            turn.reply_parts = []
+        try:
+            if turn.cancelled:
+                turn.chunker.reset()
+                if turn.reason != "barge_in":
+                    # 打断时 TTS 已在 barge_in 中中止
+                    self.tts_service.tts_cancel(owner=turn)
+                return
+            for segment in turn.chunker.flush():
+                self._tts_segment(turn, segment)
+            if turn.segments:
+                self.tts_service.tts_close(owner=turn)
+                return
+            # 没有文本送入 TTS (全部来自短语缓存或没有回复): 不依赖空任务的 on_complete,
+            # 中止未使用的合成器, 直接放入结束标记 (排在缓存的音频之后)
+            turn.audio_ended = True
+            self.tts_service.tts_cancel(wait=False, owner=turn)
+            self.audio_queue.put((turn, None))
+        finally:
+            turn.finish()
+
+    def _dispatch_function_calls(self, function_calls) -> list:
+        """
+        执行意图识别得到的函数调用
+        :param function_calls: 函数调用列表
+        :return: 需要加入对话历史的消息列表
         """
-        # 1.进行意图识别
-        function_calls = self.intent_service.detect_intent(text)
         history_list = []
-        # 2.执行函数调用（如果有）
         for function_call in function_calls:
             if "function_call" in function_call and "name" in function_call["function_call"]:
                 logger.info(f"[准备调用] {function_call}")
@@ -96,26 +464,193 @@ class ServiceManager:
                 else:
                     # 其他函数调用, 发送到Client端, Client自己处理
                     self.ws_send_queue.put(json.dumps(function_call))
-                    history_list.append([
+                    history_list.extend([
                         {"role": "user", "content": f"函数调用: {function_call}"},
                         {"role": "assistant", "content": f"函数调用完成"}
                     ])
-        # 3.调用聊天服务生成文字
-        answers = self.chat_service.generate_chat_response(text, history=history_list, is_stream=True)
-        if answers == -1:
-            logger.error("LLM 生成失败")
-            return -1
-        logger.info(f"[回复]: ")
-        # 4.将生成的文字放入 TTS任务队列
-        # for ans_chunk in answers:
-        #     print(ans_chunk, end="", flush=True)
-        #     service_manager.tts_text_queue.put(ans_chunk)
-
-        # 4.直接TTS生成
-        for text_chunk in answers:
-            print(text_chunk, end="", flush=True)
-            # 调用 TTS 服务进行语音合成
-            self.tts_service.tts_speech_stream(text_chunk)
-        print()  # 换行
-        # 关闭 TTS 流
-        self.tts_service.tts_close()
+        return history_list
+
+    def _speak(self, turn: TurnState, answers) -> bool:
+        """
+        将 LLM 流式生成的文字直接送入 TTS
+        :param turn: 所属轮次
+        :param answers: 文本片生成器
+        :return: 是否生成了文字
+        """
+        spoken = False
+        try:
+            for text_chunk in answers:
+                if text_chunk == -1:
+                    logger.error("LLM 生成失败")
+                    break
+                if turn.cancelled:
+                    # 本轮已取消 (打断或队列溢出), 停止消费 LLM 流
+                    break
+                spoken = True
+                # 调用 TTS 服务进行语音合成
+                self._tts_feed(turn, text_chunk)
+        finally:
+            # 立即关闭 LLM 流, 已生成的部分回复在此时记入对话历史 (不等到垃圾回收)
+            answers.close()
+        return spoken
+
+    async def _speak_async(self, turn: TurnState, answers) -> bool:
+        """同 _speak (异步生成器)"""
+        spoken = False
+        try:
+            async for text_chunk in answers:
+                if text_chunk == -1:
+                    logger.error("LLM 生成失败")
+                    break
+                if turn.cancelled:
+                    # 本轮已取消 (打断或队列溢出), 停止消费 LLM 流
+                    break
+                spoken = True
+                # 调用 TTS 服务进行语音合成
+                await self._tts_feed_async(turn, text_chunk)
+        finally:
+            # 任务被取消时也立即关闭 LLM 流, 已生成的部分回复在此时记入对话历史
+            await answers.aclose()
+        return spoken
+
+    def _handle_chat_event(self, turn: TurnState, event) -> bool:
+        """
+        处理工具调用模式下的一个事件
+        :return: 是否为文字事件
+        """
+        kind, payload = event
+        if kind == "tool_call":
+            # 工具调用已按 tools 协议记入对话历史, 这里只需下发
+            self._dispatch_function_calls([self.intent_service.tool_call_to_function_call(payload)])
+            return False
+        self._tts_feed(turn, payload)
+        return True
+
+    async def _handle_chat_event_async(self, turn: TurnState, event) -> bool:
+        """同 _handle_chat_event (文字在线程中送入 TTS)"""
+        kind, payload = event
+        if kind == "tool_call":
+            return self._handle_chat_event(turn, event)
+        await self._tts_feed_async(turn, payload)
+        return True
+
+    def _chat_with_tools(self, turn: TurnState, text) -> bool:
+        """
+        单次调用完成意图识别和对话: 工具调用到达即下发, 文字直接送入 TTS
+        :return: False 表示调用失败且没有任何输出, 需要回退到两次调用的方式
+        """
+        self.trace_mark("llm_request", turn)
+        events = self.chat_service.generate_chat_response_with_tools(text, self.intent_service.native_tools())
+        spoken = called = False
+        try:
+            for event in events:
+                if event == -1:
+                    if not spoken and not called:
+                        return False
+                    logger.error("LLM 生成失败")
+                    break
+                if turn.cancelled:
+                    break
+                if self._handle_chat_event(turn, event):
+                    spoken = True
+                else:
+                    called = True
+        finally:
+            events.close()
+        if called and not spoken and not turn.cancelled:
+            # 模型只返回了工具调用, 追问一次得到文字回复
+            self._speak(turn, self.chat_service.generate_chat_response(None, is_stream=True))
+        return True
+
+    async def _chat_with_tools_async(self, turn: TurnState, text) -> bool:
+        """同 _chat_with_tools (异步版本)"""
+        self.trace_mark("llm_request", turn)
+        events = self.chat_service.generate_chat_response_with_tools_async(text, self.intent_service.native_tools())
+        spoken = called = False
+        try:
+            async for event in events:
+                if event == -1:
+                    if not spoken and not called:
+                        return False
+                    logger.error("LLM 生成失败")
+                    break
+                if turn.cancelled:
+                    break
+                if await self._handle_chat_event_async(turn, event):
+                    spoken = True
+                else:
+                    called = True
+        finally:
+            await events.aclose()
+        if called and not spoken and not turn.cancelled:
+            # 模型只返回了工具调用, 追问一次得到文字回复
+            await self._speak_async(turn, self.chat_service.generate_chat_response_async(None))
+        return True
+
+    def chat_start_task(self, turn: TurnState, text):
+        """
+        处理识别到的文本，进行对话
+        :param turn: 本轮的状态
+        :param text: 文本
+        """
+        try:
+            if not turn.tts_opened:
+                # 客户端没有先切回聆听, TTS 流还没有打开
+                self._open_tts(turn)
+            # 本地意图匹配命中时无需工具调用, 直接走两次调用的方式 (意图识别不会再请求 LLM)
+            if global_settings.INTENT_MODE == "tool_call" and not self.intent_service.match_local(text):
+                if self._chat_with_tools(turn, text):
+                    return
+                logger.warning("工具调用模式失败, 回退到意图识别 + 对话两次调用")
+            # 1.进行意图识别
+            self.trace_mark("intent_start", turn)
+            function_calls = self.intent_service.detect_intent(text)
+            self.trace_mark("intent_end", turn)
+            if turn.cancelled:
+                return
+            # 2.执行函数调用（如果有）
+            history_list = self._dispatch_function_calls(function_calls)
+            # 3.调用聊天服务生成文字
+            self.trace_mark("llm_request", turn)
+            answers = self.chat_service.generate_chat_response(text, history=history_list, is_stream=True)
+            # 4.将生成的文字放入 TTS任务队列
+            # for ans_chunk in answers:
+            #     service_manager.tts_text_queue.put(ans_chunk)
+
+            # 4.直接TTS生成
+            self._speak(turn, answers)
+        finally:
+            # 关闭 TTS 流 (轮次被打断时中止合成)
+            self._tts_finish(turn)
+
+    async def chat_start_task_async(self, turn: TurnState, text):
+        """
+        处理识别到的文本，进行对话 (异步版本, 在事件循环中运行)
+        :param turn: 本轮的状态
+        :param text: 文本
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            if not turn.tts_opened:
+                # 客户端没有先切回聆听, TTS 流还没有打开 (可能需要握手, 放到线程中执行)
+                await loop.run_in_executor(None, self._open_tts, turn)
+            if global_settings.INTENT_MODE == "tool_call" and not self.intent_service.match_local(text):
+                if await self._chat_with_tools_async(turn, text):
+                    return
+                logger.warning("工具调用模式失败, 回退到意图识别 + 对话两次调用")
+            # 1.进行意图识别
+            self.trace_mark("intent_start", turn)
+            function_calls = await self.intent_service.detect_intent_async(text)
+            self.trace_mark("intent_end", turn)
+            if turn.cancelled:
+                return
+            # 2.执行函数调用（如果有）
+            history_list = self._dispatch_function_calls(function_calls)
+            # 3.调用聊天服务生成文字
+            self.trace_mark("llm_request", turn)
+            answers = self.chat_service.generate_chat_response_async(text, history=history_list)
+            # 4.直接TTS生成
+            await self._speak_async(turn, answers)
+        finally:
+            # 关闭 TTS 流 (会等待合成结束, 放到线程中执行, 避免阻塞事件循环)
+            await loop.run_in_executor(None, self._tts_finish, turn)
@@ -1,6 +1,14 @@
+import time
 import numpy as np
 from config.settings import global_settings
 from models.asr_model import ASRModel
+from tools.audio_processor import SAMPLE_RATE
+from tools.stats import now_ms
+from tools.metrics import global_metrics, RTF_BUCKETS
+
+ASR_INFERENCE_MS = global_metrics.histogram("asr_inference_ms", "ASR 一次识别的耗时 (毫秒)")
+ASR_RTF = global_metrics.histogram("asr_rtf", "ASR 实时率 (识别耗时 / 音频时长)", RTF_BUCKETS)
+ASR_CPU = global_metrics.counter("asr_cpu_seconds_total", "ASR 识别占用的 CPU 时间 (秒, 调用线程)")
 
 
 class ASRService:
@@ -27,6 +35,14 @@ class ASRService:
                 - 如果识别成功，返回转录后的文本。
                 - 如果识别失败或没有检测到语音，返回 None。
         """
+        samples = len(self.asr_model.audio_buffer)
+        start = now_ms()
+        cpu_start = time.thread_time()
         res = self.asr_model.ASR_generate_text(self.asr_model.audio_buffer.astype(np.float32))
+        ASR_CPU.inc(time.thread_time() - cpu_start)
+        elapsed = now_ms() - start
+        ASR_INFERENCE_MS.observe(elapsed)
+        if samples:
+            ASR_RTF.observe(elapsed / (samples * 1000 / SAMPLE_RATE))
         self.asr_model.clear_audio_buffer()  # 清空音频缓冲区
         return res
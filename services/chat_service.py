@@ -2,6 +2,7 @@ from typing import List, Dict, Optional
 from config.settings import global_settings
 from tools.logger import logger
 from models.llm_model import LLMModel
+from models.chat_history import ChatHistory
 
 class ChatService:
     def __init__(self):
@@ -10,17 +11,36 @@ class ChatService:
         self.chat_llm_model.clear_messages()
         # 使用 global_settings 中的系统提示词
         self.chat_llm_model.set_model_sys_content(global_settings.SYSTEM_PROMPT)
+        # 按 token 预算管理对话历史, 较早的轮次在后台压缩为摘要
+        self.history = ChatHistory()
+        self.history.set_system_prompt(global_settings.SYSTEM_PROMPT)
+
+    def apply_settings(self):
+        """配置热加载后更新模型、系统提示词和历史预算, 从下一轮请求开始生效"""
+        self.chat_llm_model.model_name = global_settings.CHAT_MODEL
+        self.history.max_tokens = global_settings.HISTORY_MAX_TOKENS
+        self.history.keep_turns = global_settings.HISTORY_KEEP_TURNS
+        self.history.summary_model = global_settings.HISTORY_SUMMARY_MODEL or global_settings.INTENT_MODEL
+        self.history.set_system_prompt(global_settings.SYSTEM_PROMPT)
+        # 保留已有的对话摘要
+        self.chat_llm_model.set_model_sys_content(self.history.system_content())
 
     def chat_clear(self):
         """清除对话历史记录"""
         self.chat_llm_model.clear_messages()
+        self.history.reset()
 
-    def generate_chat_response(self, user_input: str, history: Optional[Dict] = None, is_stream: bool = False) -> str:
-        """使用通用模型生成对话回复"""
+    def _prepare_history(self, history: Optional[Dict] = None):
+        """请求前整理对话历史: 压缩超出预算的轮次, 并加入本轮的函数调用记录"""
+        self.history.maintain(self.chat_llm_model.messages)
         if history:
             for his in history:
                 if "role" in his and "content" in his:
                     self.chat_llm_model.add_message(his["role"], his["content"])
+
+    def generate_chat_response(self, user_input: str, history: Optional[Dict] = None, is_stream: bool = False) -> str:
+        """使用通用模型生成对话回复"""
+        self._prepare_history(history)
         if is_stream:
             # 流式生成回答
             return self.chat_llm_model.get_LLM_response_stream(user_input)
@@ -28,3 +48,17 @@ class ChatService:
         else:
             return self.chat_llm_model.get_LLM_response(user_input)
 
+    def generate_chat_response_async(self, user_input: str, history: Optional[Dict] = None):
+        """使用通用模型流式生成对话回复 (异步生成器)"""
+        self._prepare_history(history)
+        return self.chat_llm_model.get_LLM_response_stream_async(user_input)
+
+    def generate_chat_response_with_tools(self, user_input: str, tools: List[Dict]):
+        """单次调用同时完成意图识别 (原生 tools) 和对话回复, 返回事件生成器"""
+        self._prepare_history()
+        return self.chat_llm_model.get_LLM_response_stream_with_tools(user_input, tools)
+
+    def generate_chat_response_with_tools_async(self, user_input: str, tools: List[Dict]):
+        """同 generate_chat_response_with_tools (异步生成器)"""
+        self._prepare_history()
+        return self.chat_llm_model.get_LLM_response_stream_with_tools_async(user_input, tools)
@@ -1,9 +1,12 @@
 from typing import Dict, Any, List
+import copy
 import json
 from config.settings import global_settings
 from tools.registry import FunctionRegistry
 from tools.logger import logger
 from models.llm_model import LLMModel
+from tools.intent_matcher import LocalIntentMatcher, normalize_text
+from tools.lru_cache import LRUCache
 
 
 class IntentService:
@@ -11,8 +14,80 @@ class IntentService:
         self.intent_llm_model = LLMModel(model_name=global_settings.INTENT_MODEL)
         self.registry = registry
         # dashscope.api_key = settings.DASHSCOPE_API_KEY
+        # 本地意图匹配, 随函数注册增量建立索引
+        self.local_matcher = LocalIntentMatcher(threshold=global_settings.LOCAL_INTENT_THRESHOLD)
+        # 意图识别缓存: 提示词按注册表版本缓存, 识别结果按 (注册表版本, 归一化语句) 缓存
+        self._prompt_cache = (-1, "")
+        self.intent_cache = LRUCache(global_settings.INTENT_CACHE_SIZE, global_settings.INTENT_CACHE_TTL)
+        self.local_hits = 0
+        self.registry.add_listener(self._index_function)
+
+    def apply_settings(self):
+        """配置热加载后更新意图模型和本地匹配阈值"""
+        if self.intent_llm_model.model_name != global_settings.INTENT_MODEL:
+            self.intent_llm_model.model_name = global_settings.INTENT_MODEL
+            # 换了模型, 之前的识别结果作废
+            self.intent_cache.clear()
+        self.local_matcher.threshold = global_settings.LOCAL_INTENT_THRESHOLD
+
+    def _index_function(self, function_name: str, info: Dict[str, Any]):
+        self.local_matcher.add_function(function_name, info["description"], info["arguments"], info.get("examples"))
+        # 工具列表变化, 之前的识别结果作废
+        self.intent_cache.clear()
+
+    def _cache_key(self, user_input: str):
+        return self.registry.version, normalize_text(user_input)
+
+    def _lookup_cache(self, user_input: str):
+        """
+        依次查询本地意图匹配和识别结果缓存
+        :return: 函数调用列表, 都未命中时返回 None
+        """
+        function_calls = self.match_local(user_input)
+        if function_calls:
+            self.local_hits += 1
+            return function_calls
+        function_calls = self.intent_cache.get(self._cache_key(user_input))
+        if function_calls is not None:
+            logger.info(f"[意图识别缓存命中]: {function_calls}")
+            # 返回副本, 避免调用方修改缓存内容
+            return copy.deepcopy(function_calls)
+        return None
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        获取意图缓存统计信息
+        :return: {"local_hits": 本地匹配命中次数, "intent_cache": LRU 缓存统计, "registry_version": 注册表版本}
+        """
+        return {
+            "local_hits": self.local_hits,
+            "intent_cache": self.intent_cache.stats(),
+            "registry_version": self.registry.version,
+        }
+
+    def match_local(self, user_input: str):
+        """
+        本地意图快速匹配
+        :param user_input: 用户输入
+        :return: 函数调用列表, 没有把握时返回 None
+        """
+        if not global_settings.LOCAL_INTENT_ENABLED:
+            return None
+        function_calls = self.local_matcher.match(user_input)
+        if function_calls:
+            logger.info(f"[本地意图识别结果]: {function_calls}")
+        return function_calls
 
     def generate_prompt(self) -> str:
+        """获取意图识别提示词, 注册表版本不变时直接复用"""
+        version, prompt = self._prompt_cache
+        if version != self.registry.version:
+            version = self.registry.version
+            prompt = self._build_prompt()
+            self._prompt_cache = (version, prompt)
+        return prompt
+
+    def _build_prompt(self) -> str:
         """动态构建意图识别提示词"""
         tools_info = json.dumps(
             self.registry.get_registered_tools(),
@@ -70,13 +145,50 @@ class IntentService:
                 ...
             ]
         """
+        function_calls = self._lookup_cache(user_input)
+        if function_calls is not None:
+            return function_calls
+
+        key = self._cache_key(user_input)
         prompt = self.generate_prompt()
         self.intent_llm_model.clear_messages()
         self.intent_llm_model.set_model_sys_content(prompt)
-        self.intent_llm_model.add_message("user", user_input)
 
+        response = self.intent_llm_model.get_LLM_response(user_input)
+        return self._parse_and_cache(key, response)
+
+    async def detect_intent_async(self, user_input: str) -> List[Dict[str, Any]]:
+        """
+        识别用户意图并返回函数调用列表 (异步, 使用共享连接池)
+        :param user_input: 用户输入的字符串，用于意图识别。
+        :return: 同 detect_intent
+        """
+        function_calls = self._lookup_cache(user_input)
+        if function_calls is not None:
+            return function_calls
+
+        key = self._cache_key(user_input)
+        # 每次使用独立的消息列表, 避免并发的轮次相互覆盖
+        intent_llm_model = LLMModel(model_name=global_settings.INTENT_MODEL)
+        intent_llm_model.set_model_sys_content(self.generate_prompt())
+
+        response = await intent_llm_model.get_LLM_response_async(user_input)
+        return self._parse_and_cache(key, response)
+
+    def _parse_and_cache(self, key, response) -> List[Dict[str, Any]]:
+        """解析模型回复, 解析成功时写入缓存 (key 在请求前计算, 注册表在请求期间变化时不会命中)"""
+        function_calls, ok = self._parse_intent_response(response)
+        if ok:
+            self.intent_cache.put(key, copy.deepcopy(function_calls))
+        return function_calls
+
+    def _parse_intent_response(self, response):
+        """
+        解析意图识别模型的回复
+        :param response: 模型回复 (JSON 字符串、字典或列表)
+        :return: (函数调用列表, 是否解析成功), 解析失败时返回默认的 continue_chat
+        """
         try:
-            response = self.intent_llm_model.get_LLM_response(user_input)
             # 如果有 ```json ``` 包裹，去掉它
             if isinstance(response, str):
                 if response.startswith("```json"):
@@ -89,13 +201,14 @@ class IntentService:
                 logger.info(f"[意图识别结果]: {response}")
             else:
                 logger.error(f"意图识别返回了未知类型: {type(response)}")
-                return [{"function_call": {"name": "continue_chat"}}]
+                return [{"function_call": {"name": "continue_chat"}}], False
 
             # 如果返回的是单个函数调用，包装成列表
             if isinstance(response, dict):
                 response = [response]
 
             # 解析每个函数调用的参数
+            ok = True
             for function_call in response:
                 if "function_call" in function_call and "arguments" in function_call["function_call"]:
                     try:
@@ -105,11 +218,30 @@ class IntentService:
                     except json.JSONDecodeError as e:
                         logger.error(f"函数参数解析失败: {str(e)}")
                         function_call["function_call"]["arguments"] = {}
+                        ok = False
 
-            return response
+            return response, ok
         except json.JSONDecodeError as e:
             logger.error(f"意图识别解析失败: {str(e)}")
-            return [{"function_call": {"name": "continue_chat"}}]
+            return [{"function_call": {"name": "continue_chat"}}], False
+
+    def native_tools(self) -> List[Dict[str, Any]]:
+        """
+        获取原生 tools 格式的工具列表, 用于单次调用的工具调用模式
+        continue_chat 是没有明确意图时的默认结果, 不作为工具提供
+        """
+        return self.registry.get_openai_tools(exclude=["continue_chat"])
+
+    def tool_call_to_function_call(self, call: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将模型返回的原生工具调用转换为与 detect_intent 相同的函数调用格式
+        :param call: {"name": ..., "arguments": {...}}
+        :return: {"function_call": {"name": ..., "arguments": {...}}}
+        """
+        function_call = {"name": call["name"]}
+        if call.get("arguments"):
+            function_call["arguments"] = self._convert_numbers_to_strings(call["arguments"])
+        return {"function_call": function_call}
 
     def _convert_numbers_to_strings(self, data):
         """
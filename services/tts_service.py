@@ -5,8 +5,13 @@ from tools.logger import logger
 class TTSService:
     def __init__(self):
         self.tts_model = TTSModel()
+        # 当前 TTS 流所属的轮次, 旧轮次迟到的关闭/中止/送入不会作用到新一轮的流
+        self.owner = None
 
-    def tts_set(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None):
+    def _owned_by(self, owner) -> bool:
+        return owner is None or owner is self.owner
+
+    def tts_set(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None, owner=None):
         '''设置TTS回调函数, 提前打开ws连接
 
         :param: on_open: 连接打开时的回调函数
@@ -14,12 +19,34 @@ class TTSService:
         :param: on_error: 合成错误时的回调函数
         :param: on_close: 连接关闭时的回调函数
         :param: on_data: 接收到数据时的回调函数(PCM-16bit 音频数据), 可以查看tts_test.py看如何使用
+        :param: owner: 流所属的轮次
         '''
+        self.owner = owner
         self.tts_model.tts_stream_set(on_open, on_complete, on_error, on_close, on_data)
 
-    def tts_close(self):
-        '''关闭TTS流式合成'''
-        self.tts_model.tts_stream_close()
+    def tts_close(self, owner=None):
+        '''关闭TTS流式合成
+
+        :param: owner: 调用方所属的轮次, 流已属于其他轮次时不做任何操作 (None 表示不检查)'''
+        if self._owned_by(owner):
+            self.tts_model.tts_stream_close()
+
+    def tts_cancel(self, wait=True, owner=None):
+        '''中止TTS流式合成, 丢弃尚未合成的文本
+
+        :param: wait: 是否等待中止完成
+        :param: owner: 调用方所属的轮次, 流已属于其他轮次时不做任何操作 (None 表示不检查)'''
+        if self._owned_by(owner):
+            self.tts_model.tts_stream_cancel(wait)
+
+    def tts_prewarm(self):
+        '''设备已连接, 提前准备合成器, 减少第一轮的等待'''
+        self.tts_model.tts_stream_prewarm()
+
+    def cache_identity(self):
+        '''(模型, 音色), 用于区分缓存的合成结果'''
+        return self.tts_model.model, self.tts_model.voice
 
-    def tts_speech_stream(self, text_chunk):
-        self.tts_model.tts_stream_speech_synthesis(text_chunk)
+    def tts_speech_stream(self, text_chunk, owner=None):
+        if self._owned_by(owner):
+            self.tts_model.tts_stream_speech_synthesis(text_chunk)
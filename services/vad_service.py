@@ -1,14 +1,35 @@
+import time
 from config.settings import global_settings
 from models.vad_model import VADModel
+from tools.audio_processor import SAMPLE_RATE
+from tools.stats import now_ms
+from tools.metrics import global_metrics, FAST_LATENCY_BUCKETS_MS, RTF_BUCKETS
+
+VAD_INFERENCE_MS = global_metrics.histogram("vad_inference_ms", "VAD 单帧推理耗时 (毫秒)", FAST_LATENCY_BUCKETS_MS)
+VAD_RTF = global_metrics.histogram("vad_rtf", "VAD 实时率 (推理耗时 / 音频时长)", RTF_BUCKETS)
+VAD_CPU = global_metrics.counter("vad_cpu_seconds_total", "VAD 推理占用的 CPU 时间 (秒, 调用线程)")
 
 class VADService:
     def __init__(self):
-        self.vad_model = VADModel()
+        self.vad_model = VADModel(max_buffer_length_ms=global_settings.VAD_MAX_BUFFER_MS,
+                                  no_speech_timeout_ms=global_settings.VAD_NO_SPEECH_TIMEOUT_MS,
+                                  post_speech_buffer_ms=global_settings.VAD_POST_SPEECH_BUFFER_MS)
+
+    def apply_settings(self):
+        """配置热加载后更新 VAD 判定参数 (每帧读取, 立即生效)"""
+        self.vad_model.max_buffer_length_ms = global_settings.VAD_MAX_BUFFER_MS
+        self.vad_model.no_speech_timeout_ms = global_settings.VAD_NO_SPEECH_TIMEOUT_MS
+        self.vad_model.post_speech_buffer_ms = global_settings.VAD_POST_SPEECH_BUFFER_MS
 
     def reset(self):
         """重置 VAD 状态"""
         self.vad_model.reset()
 
+    @property
+    def speech_detected(self) -> bool:
+        """本次聆听是否已检测到语音 (reset 后清除)"""
+        return self.vad_model.last_speech_pos > 0
+
     def process_audio_frame(self, audio_frame):
         """
         流式处理音频数据，进行语音活动检测
@@ -20,5 +41,12 @@ class VADService:
             2 - 检测到无语音活动
             3 - 缓冲区已满
         """
+        start = now_ms()
+        cpu_start = time.thread_time()
         res = self.vad_model.process_audio_frame(audio_frame)
+        VAD_CPU.inc(time.thread_time() - cpu_start)
+        elapsed = now_ms() - start
+        VAD_INFERENCE_MS.observe(elapsed)
+        if len(audio_frame):
+            VAD_RTF.observe(elapsed / (len(audio_frame) * 1000 / SAMPLE_RATE))
         return res
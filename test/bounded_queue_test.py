@@ -0,0 +1,86 @@
+import asyncio
+import time
+from tools.bounded_queue import BoundedQueue, POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_CANCEL_TURN
+
+
+def is_audio(item) -> bool:
+    """与 ws_send_queue 相同: 音频 (bytes) 可丢弃, 控制消息 (str) 不可丢弃"""
+    return isinstance(item, bytes)
+
+
+def test_block_policy_times_out():
+    """block 策略: 队列满时阻塞上游, 超时后丢弃新数据"""
+    q = BoundedQueue("block", 2, POLICY_BLOCK, block_timeout=0.05)
+    assert q.put(b"1") and q.put(b"2")
+    began = time.monotonic()
+    assert not q.put(b"3")
+    assert time.monotonic() - began >= 0.05
+    assert list(q.queue) == [b"1", b"2"]
+    stats = q.stats()
+    assert stats["dropped"] == 1 and stats["overflows"] == 1 and stats["high_water"] == 2
+    print("test_block_policy_times_out 通过")
+
+
+def test_block_policy_never_blocks_event_loop():
+    """在事件循环线程中 put 时不阻塞, 队列满直接丢弃"""
+    q = BoundedQueue("loop", 1, POLICY_BLOCK)
+
+    async def put_twice():
+        return q.put(b"1"), q.put(b"2")
+
+    assert asyncio.run(put_twice()) == (True, False)
+    assert q.stats()["dropped"] == 1
+    print("test_block_policy_never_blocks_event_loop 通过")
+
+
+def test_drop_oldest_keeps_control_messages():
+    """drop_oldest 策略: 只丢弃最旧的音频, 控制消息保留"""
+    q = BoundedQueue("drop", 3, POLICY_DROP_OLDEST, droppable=is_audio)
+    for item in ("start", b"a", b"b", b"c", "stop"):
+        assert q.put(item)
+    assert list(q.queue) == ["start", b"c", "stop"]
+    assert q.stats()["dropped"] == 2 and q.stats()["overflows"] == 2
+
+    # 没有可丢弃的数据时按超时丢弃新数据
+    q = BoundedQueue("control", 1, POLICY_DROP_OLDEST, droppable=is_audio)
+    assert q.put("start")
+    assert not q.put(b"a", timeout=0.01)
+    assert list(q.queue) == ["start"]
+    print("test_drop_oldest_keeps_control_messages 通过")
+
+
+def test_cancel_turn_calls_on_overflow():
+    """cancel_turn 策略: 溢出时回调取消轮次, 腾出位置后放入新数据"""
+    calls = []
+    q = BoundedQueue("cancel", 2, POLICY_CANCEL_TURN, droppable=is_audio)
+    q.on_overflow = lambda: calls.append(q.purge())
+    assert q.put("start") and q.put(b"a")
+    assert q.put("stop")
+    assert calls == [1]
+    assert list(q.queue) == ["start", "stop"]
+
+    # 没有回调时直接清空可丢弃数据
+    q = BoundedQueue("purge", 2, POLICY_CANCEL_TURN)
+    assert q.put(b"a") and q.put(b"b") and q.put(b"c")
+    assert list(q.queue) == [b"c"] and q.stats()["dropped"] == 2
+    print("test_cancel_turn_calls_on_overflow 通过")
+
+
+def test_purge_and_has_droppable():
+    q = BoundedQueue("purge", 0, droppable=is_audio)
+    assert not q.has_droppable()
+    for item in ("start", b"a", b"b"):
+        q.put(item)
+    assert q.has_droppable()
+    assert q.purge(lambda item: item == b"a") == 1
+    assert q.purge() == 1
+    assert not q.has_droppable() and list(q.queue) == ["start"]
+    print("test_purge_and_has_droppable 通过")
+
+
+if __name__ == "__main__":
+    test_block_policy_times_out()
+    test_block_policy_never_blocks_event_loop()
+    test_drop_oldest_keeps_control_messages()
+    test_cancel_turn_calls_on_overflow()
+    test_purge_and_has_droppable()
@@ -0,0 +1,44 @@
+from tools.intent_matcher import LocalIntentMatcher, normalize_text
+
+
+def make_matcher() -> LocalIntentMatcher:
+    matcher = LocalIntentMatcher()
+    matcher.add_function("get_current_time", "获取当前时间", {}, ["现在几点了", "几点了"])
+    matcher.add_function("exit_chat", "结束对话意图", {}, ["再见", "拜拜"])
+    matcher.add_function("robot_move", "让机器人运动", {"direction": "方向"},
+                         ["往前走", {"text": "向前走", "arguments": {"direction": "forward"}}])
+    return matcher
+
+
+def test_normalize_text():
+    assert normalize_text("现在，几点了？") == "现在几点了"
+    assert normalize_text("ＨＥＬＬＯ World!") == "helloworld"
+    print("test_normalize_text 通过")
+
+
+def test_exact_and_fuzzy_match():
+    matcher = make_matcher()
+    assert matcher.match("现在几点了？") == [{"function_call": {"name": "get_current_time"}}]
+    assert matcher.match("拜拜！") == [{"function_call": {"name": "exit_chat"}}]
+    # 需要参数的函数只能由带 arguments 的示例命中
+    assert matcher.match("向前走") == [{"function_call": {"name": "robot_move", "arguments": {"direction": "forward"}}}]
+    assert matcher.match("往前走") is None
+    # 不确定时交给 LLM
+    assert matcher.match("给我讲个故事吧") is None
+    assert matcher.match("") is None
+    print("test_exact_and_fuzzy_match 通过")
+
+
+def test_remove_function():
+    matcher = make_matcher()
+    matcher.remove_function("exit_chat")
+    assert matcher.match("拜拜") is None
+    matcher.add_function("exit_chat", "结束对话意图", {}, ["拜拜"])
+    assert matcher.match("拜拜") == [{"function_call": {"name": "exit_chat"}}]
+    print("test_remove_function 通过")
+
+
+if __name__ == "__main__":
+    test_normalize_text()
+    test_exact_and_fuzzy_match()
+    test_remove_function()
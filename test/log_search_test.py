@@ -0,0 +1,124 @@
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import tools.log_search as log_search
+from tools.log_search import LogIndex, LogSearch
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+LEVELS = ("INFO", "INFO", "WARNING", "ERROR")
+
+
+def make_lines(count: int, start: datetime = START, session: str = "a1b2c3d4") -> list:
+    """每秒一条文本格式的日志, 每 10 条带一段异常堆栈 (多行日志)"""
+    lines = []
+    for i in range(count):
+        ts = (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+        level = LEVELS[i % len(LEVELS)]
+        lines.append(f"[{ts}][{level}][{session}:{i % 7}] 第 {i} 条日志 seq={i}\n")
+        if i % 10 == 9:
+            lines.append("Traceback (most recent call last):\n  ValueError: boom\n")
+    return lines
+
+
+def write_log(log_dir: str, name: str, lines: list) -> str:
+    path = os.path.join(log_dir, name)
+    data = "".join(lines).encode("utf-8")
+    if name.endswith(".gz"):
+        with gzip.open(path, "wb") as f:
+            f.write(data)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
+
+
+def seqs(results) -> list:
+    """搜索结果中的日志序号 (最后一条为统计信息)"""
+    *records, summary = list(results)
+    assert summary["done"] and summary["matched"] == len(records)
+    return [int(record["line"].split("seq=")[1].split()[0]) for record in records]
+
+
+def with_log_dir(test):
+    log_dir = tempfile.mkdtemp()
+    step = log_search.INDEX_STEP
+    log_search.INDEX_STEP = 1024  # 测试文件较小, 缩小索引间隔以得到多条索引
+    try:
+        test(log_dir)
+    finally:
+        log_search.INDEX_STEP = step
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+def test_sparse_index_limits_range(log_dir):
+    """稀疏索引按时间确定读取范围, 结果与全量过滤一致"""
+    path = write_log(log_dir, "assistant_20240101.log", make_lines(2000))
+    size = os.path.getsize(path)
+    search = LogSearch(log_dir)
+    start, end = START + timedelta(seconds=1000), START + timedelta(seconds=1009)
+    assert seqs(search.search(start=start, end=end)) == list(range(1000, 1010))
+
+    index = LogIndex(os.path.join(log_dir, ".index", "assistant_20240101.log.idx"))
+    assert len(index.keys) > 10 and index.keys == sorted(index.keys)
+    lo, hi = index.range(b"2024-01-01 12:16:40", b"2024-01-01 12:16:49", size)
+    assert 0 < lo < hi < size and hi - lo < size // 10
+
+    # 级别、会话和关键字过滤, 多行日志整条返回
+    results = list(search.search(start=start, end=end, level="ERROR"))
+    assert [record["level"] for record in results[:-1]] == ["ERROR"] * 2
+    assert "ValueError: boom" in list(search.search(text="seq=1009"))[0]["line"]
+    assert seqs(search.search(session="a1b2c3d4:3", start=start, end=end)) == [1004]
+    assert seqs(search.search(text="seq=1999")) == [1999]
+    assert seqs(search.search(text="seq=19", limit=3)) == [19, 190, 191]
+    print("test_sparse_index_limits_range 通过")
+
+
+def test_index_follows_appends_and_rotation(log_dir):
+    """正在写入的文件只补充新增部分, 被切分改名 (inode 变化) 后重新建立索引"""
+    path = write_log(log_dir, "assistant_20240101.log", make_lines(300))
+    search = LogSearch(log_dir)
+    assert seqs(search.search(text="seq=299")) == [299]
+    with open(path, "ab") as f:
+        f.write("".join(make_lines(300, START + timedelta(seconds=300))).encode("utf-8"))
+    # 追加的日志序号从 0 开始, 时间在之后
+    assert len(seqs(search.search(start=START + timedelta(seconds=300)))) == 300
+
+    os.replace(path, path + ".old")
+    write_log(log_dir, "assistant_20240101.log", make_lines(50))
+    assert seqs(search.search(text="seq=49")) == [49]
+    assert seqs(search.search(text="seq=299")) == []
+    print("test_index_follows_appends_and_rotation 通过")
+
+
+def test_archive_cache(log_dir):
+    """归档解压后按 LRU 缓存, 查询范围外的归档无需解压"""
+    lines = make_lines(500)
+    size = len("".join(lines).encode("utf-8"))
+    write_log(log_dir, "assistant_20240101.1.log.gz", lines)
+    write_log(log_dir, "assistant_20240101.2.log.gz", make_lines(500, START + timedelta(seconds=500)))
+    search = LogSearch(log_dir, archive_cache_bytes=size * 3 // 2)
+    assert seqs(search.search(text="seq=499")) == [499, 499]
+    # 缓存只能放下一个归档, 最近使用的保留
+    assert len(search._archives) == 1
+    assert list(search._archives)[0][0].endswith(".2.log.gz")
+
+    # 时间范围内只有第一个归档, 第二个根据索引跳过, 不会再解压进缓存
+    search = LogSearch(log_dir)
+    assert seqs(search.search(end=START + timedelta(seconds=9))) == list(range(10))
+    assert [os.path.basename(key[0]) for key in search._archives] == ["assistant_20240101.1.log.gz"]
+    assert seqs(search.search(end=START + timedelta(seconds=9))) == list(range(10))
+    assert len(search._archives) == 1
+
+    # 不缓存时仍能正常搜索
+    search = LogSearch(log_dir, archive_cache_bytes=0)
+    assert seqs(search.search(start=START + timedelta(seconds=995))) == [495, 496, 497, 498, 499]
+    assert not search._archives
+    print("test_archive_cache 通过")
+
+
+if __name__ == "__main__":
+    with_log_dir(test_sparse_index_limits_range)
+    with_log_dir(test_index_follows_appends_and_rotation)
+    with_log_dir(test_archive_cache)
@@ -0,0 +1,37 @@
+import time
+from tools.lru_cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["hits"] == 3 and stats["misses"] == 1
+    print("test_evicts_least_recently_used 通过")
+
+
+def test_ttl_expires_lazily():
+    cache = LRUCache(maxsize=2, ttl=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a", "miss") == "miss"
+    assert len(cache) == 0 and cache.stats()["expirations"] == 1
+    print("test_ttl_expires_lazily 通过")
+
+
+def test_disabled_cache():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None and len(cache) == 0
+    print("test_disabled_cache 通过")
+
+
+if __name__ == "__main__":
+    test_evicts_least_recently_used()
+    test_ttl_expires_lazily()
+    test_disabled_cache()
@@ -0,0 +1,150 @@
+import threading
+import tools.supervisor as supervisor_module
+from tools.supervisor import ServiceSupervisor
+
+
+class FakeClock:
+    """替换 tools.supervisor 中的 time 模块, 由测试控制时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeProcess:
+    """模拟 subprocess.Popen, poll 返回 exit_code (None 表示运行中)"""
+    next_pid = 900000
+
+    def __init__(self):
+        FakeProcess.next_pid += 1
+        self.pid = FakeProcess.next_pid  # 不存在的进程, 不会采样到内存
+        self.exit_code = None
+
+    def poll(self):
+        return self.exit_code
+
+
+class FakeService:
+    """记录 supervisor 的启动请求, 每次启动一个新进程"""
+
+    def __init__(self):
+        self.process = None
+        self.starts = 0
+
+    def start(self):
+        self.starts += 1
+        self.process = FakeProcess()
+
+    def restart(self, blue_green=True):
+        self.start()
+
+
+def make_supervisor(service: FakeService, **kwargs) -> ServiceSupervisor:
+    # 不启动检查线程, 由测试调用 _check
+    return ServiceSupervisor(threading.Lock(), lambda: service.process, service.start, service.restart, **kwargs)
+
+
+def crash(sup: ServiceSupervisor, service: FakeService, clock: FakeClock, uptime: float = 0.0) -> float:
+    """当前进程运行 uptime 秒后崩溃, 返回 supervisor 安排的重启等待时间"""
+    sup._check()
+    clock.now += uptime
+    service.process.exit_code = 1
+    sup._check()
+    status = sup.status()
+    return status["restart_in"] if status["state"] == "backoff" else None
+
+
+def run_with_clock(test):
+    clock = FakeClock()
+    original = supervisor_module.time
+    supervisor_module.time = clock
+    try:
+        test(clock)
+    finally:
+        supervisor_module.time = original
+
+
+def test_backoff_doubles_and_resets(clock):
+    """连续崩溃时等待时间翻倍直到上限, 稳定运行后重新从初始值开始"""
+    service = FakeService()
+    sup = make_supervisor(service, backoff_initial=1.0, backoff_max=4.0, stable_after=60.0, crash_limit=100)
+    sup.set_wanted(True)
+    service.start()
+
+    delays = []
+    for _ in range(4):
+        delays.append(crash(sup, service, clock))
+        clock.now += delays[-1]
+        sup._check()  # 等待结束, 重新启动
+    assert delays == [1.0, 2.0, 4.0, 4.0]
+    assert service.starts == 5
+
+    # 稳定运行超过 stable_after 后崩溃, 等待时间重置
+    assert crash(sup, service, clock, uptime=61.0) == 1.0
+    assert [run["reason"] for run in sup.runs()] == ["crashed"] * 5
+    print("test_backoff_doubles_and_resets 通过")
+
+
+def test_backoff_waits_before_restart(clock):
+    """等待时间未到时不重启"""
+    service = FakeService()
+    sup = make_supervisor(service, backoff_initial=2.0)
+    sup.set_wanted(True)
+    service.start()
+    crash(sup, service, clock)
+    clock.now += 1.0
+    sup._check()
+    assert service.starts == 1 and sup.state == "backoff"
+    clock.now += 1.0
+    sup._check()
+    assert service.starts == 2 and sup.state == "running"
+    print("test_backoff_waits_before_restart 通过")
+
+
+def test_crash_loop_stops_auto_restart(clock):
+    """窗口内崩溃 crash_limit 次后停止自动重启, 手动启动后恢复"""
+    service = FakeService()
+    sup = make_supervisor(service, backoff_initial=1.0, crash_window=300.0, crash_limit=3)
+    sup.set_wanted(True)
+    service.start()
+    for _ in range(2):
+        clock.now += crash(sup, service, clock)
+        sup._check()
+    assert crash(sup, service, clock) is None
+    assert sup.state == "crash_loop" and sup.status()["restart_in"] is None
+    clock.now += 3600
+    sup._check()
+    assert service.starts == 3  # 不再自动重启
+
+    sup.set_wanted(True)
+    service.start()
+    assert sup.state == "running" and sup.status()["consecutive_crashes"] == 0
+    assert crash(sup, service, clock) == 1.0
+    print("test_crash_loop_stops_auto_restart 通过")
+
+
+def test_crashes_outside_window_are_not_a_loop(clock):
+    """间隔超过 crash_window 的崩溃不算崩溃循环"""
+    service = FakeService()
+    sup = make_supervisor(service, backoff_initial=1.0, stable_after=60.0, crash_window=100.0, crash_limit=2)
+    sup.set_wanted(True)
+    service.start()
+    for _ in range(3):
+        delay = crash(sup, service, clock, uptime=150.0)
+        assert delay == 1.0
+        clock.now += delay
+        sup._check()
+    assert sup.state == "running"
+    print("test_crashes_outside_window_are_not_a_loop 通过")
+
+
+if __name__ == "__main__":
+    run_with_clock(test_backoff_doubles_and_resets)
+    run_with_clock(test_backoff_waits_before_restart)
+    run_with_clock(test_crash_loop_stops_auto_restart)
+    run_with_clock(test_crashes_outside_window_are_not_a_loop)
@@ -0,0 +1,58 @@
+from tools.text_chunker import TextChunker
+
+
+def feed_all(chunker: TextChunker, pieces) -> list:
+    """按 LLM 流式输出的方式逐片输入, 返回所有文本段 (包括结束时剩余的文本)"""
+    segments = []
+    for piece in pieces:
+        segments.extend(chunker.feed(piece))
+    return segments + chunker.flush()
+
+
+def test_first_segment_is_short():
+    """第一段遇到标点且达到 first_min_chars 就送出, 之后的文本聚合到 min_chars 以上"""
+    chunker = TextChunker(first_min_chars=4, min_chars=10, max_chars=80)
+    assert chunker.feed("好的，") == []  # 不足 4 个字符
+    assert chunker.feed("我来") == []
+    assert chunker.feed("看看，今天") == ["好的，我来看看，"]
+    assert chunker.feed("天气晴。") == []  # 不足 10 个字符, 继续聚合
+    assert chunker.feed("气温二十度，适合出门。") == ["今天天气晴。气温二十度，适合出门。"]
+    assert chunker.flush() == []
+    print("test_first_segment_is_short 通过")
+
+
+def test_ascii_punctuation_inside_numbers():
+    """英文标点后面跟着字母数字时不切分 (3.14、1,000)"""
+    chunker = TextChunker(first_min_chars=2, min_chars=2, max_chars=80)
+    segments = feed_all(chunker, ["圆周率约是3", ".14", "，大约1,", "000次. Done"])
+    assert segments == ["圆周率约是3.14，", "大约1,000次.", " Done"]
+    print("test_ascii_punctuation_inside_numbers 通过")
+
+
+def test_max_chars_does_not_split_words():
+    """超过 max_chars 仍没有标点时强制切分, 但不切开英文单词"""
+    chunker = TextChunker(first_min_chars=4, min_chars=4, max_chars=10)
+    segments = feed_all(chunker, ["hello wor", "ld again"])
+    assert segments == ["hello ", "world ", "again"]
+    assert all(len(segment) <= 10 for segment in segments)
+    print("test_max_chars_does_not_split_words 通过")
+
+
+def test_reset_and_blank_segments():
+    """空白段不送入 TTS, reset 后重新按第一段处理"""
+    chunker = TextChunker(first_min_chars=4, min_chars=10, max_chars=80)
+    assert chunker.feed("嗯嗯嗯嗯，") == ["嗯嗯嗯嗯，"]
+    chunker.feed("没说完")
+    chunker.reset()
+    assert chunker.flush() == []
+    assert chunker.feed("新的一轮，") == ["新的一轮，"]
+    assert chunker.feed("  \n") == []
+    assert chunker.flush() == []
+    print("test_reset_and_blank_segments 通过")
+
+
+if __name__ == "__main__":
+    test_first_segment_is_short()
+    test_ascii_punctuation_inside_numbers()
+    test_max_chars_does_not_split_words()
+    test_reset_and_blank_segments()
@@ -0,0 +1,236 @@
+import asyncio
+import functools
+import json
+import queue
+from service_manager import ServiceManager
+from services.tts_service import TTSService
+from models.tts_model import TTSModel
+from models.tts_backends import TTSBackend
+from models.llm_model import LLMModel
+from models.llm_providers import MockProvider
+from tools.bounded_queue import BoundedQueue
+from tools.cancel_token import CancelToken
+from tools.stats import StreamStats
+from tools.tts_cache import TTSPhraseCache
+from config.settings import global_settings
+
+
+class RecordingTTSBackend(TTSBackend):
+    """记录每个 TTS 流收到的文本和最终状态, 不实际合成"""
+    name = "recording"
+
+    def __init__(self):
+        super().__init__("test", "test")
+        self.streams = []
+        self.current = None
+
+    def tts_stream_set(self, on_open=None, on_complete=None, on_error=None, on_close=None, on_data=None):
+        self.current = {"on_data": on_data, "on_complete": on_complete, "texts": [], "state": "open"}
+        self.streams.append(self.current)
+        return True
+
+    def tts_stream_speech_synthesis(self, text_chunk):
+        self.current["texts"].append(text_chunk)
+
+    def tts_stream_close(self):
+        self.current["state"] = "closed"
+
+    def tts_stream_cancel(self, wait=True):
+        self.current["state"] = "cancelled"
+
+
+class PendingTaskManager:
+    """只记录提交的对话任务, 由测试按需要的顺序执行"""
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit_task(self, func, *args, **kwargs):
+        self.tasks.append((func, args, kwargs))
+
+
+def with_settings(**values):
+    """测试期间修改 global_settings, 结束后恢复原值"""
+    def decorator(test):
+        @functools.wraps(test)
+        def wrapper(*args, **kwargs):
+            saved = {name: getattr(global_settings, name) for name in values}
+            for name, value in values.items():
+                setattr(global_settings, name, value)
+            try:
+                return test(*args, **kwargs)
+            finally:
+                for name, value in saved.items():
+                    setattr(global_settings, name, value)
+        return wrapper
+    return decorator
+
+
+@with_settings(TTS_BACKEND="local")  # 避免创建 DashScope 合成器池, 随后替换为记录用的后端
+def make_tts_service(backend) -> TTSService:
+    tts_service = TTSService()
+    tts_service.tts_model = TTSModel(backend)
+    return tts_service
+
+
+def make_manager():
+    """只初始化轮次相关的字段, 不加载 VAD/ASR 模型"""
+    sm = ServiceManager.__new__(ServiceManager)
+    backend = RecordingTTSBackend()
+    sm.tts_service = make_tts_service(backend)
+    sm.stream_stats = StreamStats()
+    sm.tracer = None
+    sm.trace = None
+    sm.tts_cache = None
+    sm.tts_text_queue = BoundedQueue("tts_text_queue", 100)
+    sm.audio_queue = BoundedQueue("audio_queue", 100)
+    sm.ws_send_queue = BoundedQueue("ws_send_queue", 100)
+    sm.cancel_token = CancelToken()
+    sm.cancel_token.finish()
+    sm._pending_turn = None
+    sm._turn_seq = 0
+    sm.chat_task = None
+    sm.task_manager = PendingTaskManager()
+    return sm, backend
+
+
+def stream_of(*chunks):
+    """模拟 LLM 的流式输出"""
+    yield from chunks
+
+
+def drain(q) -> list:
+    items = []
+    while True:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            return items
+
+
+@with_settings(LLM_ASYNC=False, TTS_CHUNK_ENABLED=True)
+def test_cancelled_turn_finishes_after_next_turn_started():
+    """
+    第 N 轮在 LLM 流中被打断, 第 N+1 轮开始后第 N 轮才退出:
+    第 N 轮剩余的文本、收尾和迟到的 TTS 回调都不能影响第 N+1 轮
+    """
+    sm, backend = make_manager()
+
+    # 第 N 轮: 聆听时打开 TTS 流, 识别出文本后开始对话, 送入一部分回复
+    sm.prepare_turn()
+    sm.start_chat_task("讲个故事")
+    turn_n = sm.cancel_token
+    sm._tts_feed(turn_n, "从前有座山，山里有座庙。")
+    stream_n = backend.current
+    assert sm.turn_active
+
+    # 用户打断, 客户端切回聆听, 第 N+1 轮开始
+    assert sm.barge_in()
+    assert stream_n["state"] == "cancelled"
+    sm.prepare_turn()
+    sm.start_chat_task("现在几点")
+    turn_n1 = sm.cancel_token
+    stream_n1 = backend.current
+    assert turn_n1 is not turn_n and stream_n1 is not stream_n
+    drain(sm.ws_send_queue)
+
+    # 第 N 轮这时才从 LLM 流中返回: 继续送文本, 然后收尾
+    sm._tts_feed(turn_n, "庙里有个老和尚，")
+    sm._speak(turn_n, stream_of("在给小和尚讲故事。"))
+    sm._tts_finish(turn_n)
+    # 被中止的合成器迟到的回调
+    stream_n["on_data"](b"\x00" * 320)
+    stream_n["on_complete"]()
+
+    assert turn_n.done
+    assert sm.turn_active, "旧轮次退出不能清除新一轮的进行中状态"
+    assert stream_n1["texts"] == [] and stream_n1["state"] == "open", "旧轮次不能向新一轮的 TTS 流送文本或关闭它"
+    assert turn_n1.reply_parts == [] and not turn_n1.chunker.flush(), "旧轮次的文本不能进入新一轮的分段器"
+    assert drain(sm.audio_queue) == [], "被打断轮次的音频和结束标记应被丢弃"
+
+    # 第 N+1 轮正常完成: 文本送入自己的流, 收尾后关闭, 结束标记属于本轮
+    sm._speak(turn_n1, stream_of("现在是下午三点。"))
+    sm._tts_finish(turn_n1)
+    assert stream_n1["texts"] == ["现在是下午三点。"] and stream_n1["state"] == "closed"
+    assert not sm.turn_active
+    stream_n1["on_data"](b"\x00" * 320)
+    stream_n1["on_complete"]()
+    assert [item[0] for item in drain(sm.audio_queue)] == [turn_n1, turn_n1]
+    print("test_cancelled_turn_finishes_after_next_turn_started 通过")
+
+
+@with_settings(LLM_ASYNC=False, TTS_CHUNK_ENABLED=False)
+def test_cached_turn_ends_without_synthesis():
+    """整轮回复都来自短语缓存: 不关闭空的 TTS 任务等待 on_complete, 中止合成器并直接放入结束标记"""
+    sm, backend = make_manager()
+    sm.audio_processor = type("FrameInfo", (), {"frame_duration_ms": 40})()
+    sm.tts_cache = TTSPhraseCache()
+    sm.tts_cache.put(sm._cache_key("好的。"), [b"opus"])
+
+    sm.prepare_turn()
+    sm.start_chat_task("打开灯")
+    turn = sm.cancel_token
+    stream = backend.current
+    sm._speak(turn, stream_of("好的。"))
+    sm._tts_finish(turn)
+
+    assert stream["texts"] == [] and stream["state"] == "cancelled", "未使用的合成器应被中止"
+    assert drain(sm.audio_queue) == [(turn, [b"opus"]), (turn, None)], "缓存的音频之后应紧跟结束标记"
+    # 中止后迟到的回调不能再放入一次结束标记
+    stream["on_complete"]()
+    assert drain(sm.audio_queue) == []
+    print("test_cached_turn_ends_without_synthesis 通过")
+
+
+@with_settings(LLM_ASYNC=False, TTS_CHUNK_ENABLED=False)
+def test_barge_in_purges_audio_of_finished_turn():
+    """对话任务已结束但音频还没有发完时打断: 仍要清除本轮排队的音频, 并在确认中报告清除的条数"""
+    sm, backend = make_manager()
+    sm.prepare_turn()
+    sm.start_chat_task("讲个故事")
+    turn = sm.cancel_token
+    stream = backend.current
+    sm._speak(turn, stream_of("从前有座山。"))
+    sm._tts_finish(turn)
+    stream["on_data"](b"\x00" * 320)
+    sm.ws_send_queue.put(b"opus")
+    assert not sm.turn_active
+
+    assert sm.barge_in()
+    assert turn.cancelled and sm.audio_queue.empty()
+    ack = [json.loads(item) for item in drain(sm.ws_send_queue)]
+    assert ack == [{"type": "abort", "state": "ack", "turn_id": turn.turn_id, "purged": 2}]
+    # 音频已全部清除后不再重复打断
+    assert not sm.barge_in()
+    print("test_barge_in_purges_audio_of_finished_turn 通过")
+
+
+def test_interrupted_reply_kept_in_history():
+    """轮次中途被打断: 保留已生成的部分回复; 还没有任何输出时撤销用户消息"""
+    model = LLMModel("mock", MockProvider(response="从前有座山。", first_token_delay_ms=0, tokens_per_second=1000))
+    answers = model.get_LLM_response_stream("讲个故事")
+    assert [next(answers), next(answers)] == ["从", "前"]
+    answers.close()
+    assert model.messages[1:] == [{"role": "user", "content": "讲个故事"}, {"role": "assistant", "content": "从前"}]
+
+    slow = LLMModel("mock", MockProvider(response="现在是下午三点。", first_token_delay_ms=1000))
+
+    async def interrupt():
+        task = asyncio.ensure_future(slow.get_LLM_response_stream_async("几点了").__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(interrupt())
+    assert len(slow.messages) == 1
+    print("test_interrupted_reply_kept_in_history 通过")
+
+
+if __name__ == "__main__":
+    test_cancelled_turn_finishes_after_next_turn_started()
+    test_cached_turn_ends_without_synthesis()
+    test_barge_in_purges_audio_of_finished_turn()
+    test_interrupted_reply_kept_in_history()
@@ -1,17 +1,29 @@
 import threading
 import queue
 import asyncio
+import time
 from tools.logger import logger
 from service_manager import ServiceManager
 from config.settings import global_settings
+from tools.audio_processor import FRAME_TYPE_AUDIO
 
 class AudioSendThread(threading.Thread):
     def __init__(self, sevice_manager: ServiceManager):
         super().__init__(daemon=True)
         self.sevice_manager = sevice_manager
 
+    def _send_opus(self, opus_data, token):
+        """打包一个 Opus 包并放入发送队列"""
+        seq = self.sevice_manager.next_downlink_seq()
+        bin_data = self.sevice_manager.audio_processor.pack_bin_frame(type=FRAME_TYPE_AUDIO, version=self.sevice_manager.protocol_version, payload=opus_data,
+                                                                      seq=seq, timestamp=time.time() * 1000)
+        self.sevice_manager.stream_stats.on_downlink_frame(seq)
+        self.sevice_manager.ws_send_queue.put(bin_data)
+        self.sevice_manager.trace_mark("opus_first_queued", token)
+
     def run(self):
         remain_data = b''
+        remain_token = None
         while not self.sevice_manager.stop_event.is_set():  # 检查 stop_event 是否被设置
             try:
                 # 从语音队列中获取语音数据
@@ -21,18 +33,42 @@ class AudioSendThread(threading.Thread):
                 # if len(audio_data) < 1000:
                 #     remain_data += audio_data
                 #     continue
-                # 二进制数据: PCM-16bit 音频数据
-                if isinstance(audio_data, bytes):
+                # (所属轮次的取消令牌, PCM-16bit 音频数据)
+                token, audio_data = audio_data
+                if token.cancelled:
+                    # 轮次已被打断, 丢弃剩余音频
+                    continue
+                if audio_data is None:
+                    # 本轮 TTS 结束标记: 最后不足一帧的音频补静音后发出
+                    if remain_token is token and remain_data:
+                        samples_per_frame = int(self.sevice_manager.audio_processor.frame_duration_ms * self.sevice_manager.audio_processor.sample_rate / 1000)*2
+                        opus_data = self.sevice_manager.audio_processor.encode_audio(remain_data.ljust(samples_per_frame, b'\x00'))
+                        self.sevice_manager.record_turn_packet(token, opus_data)
+                        self._send_opus(opus_data, token)
+                        remain_data = b''
+                    self.sevice_manager.finish_turn_audio(token)
+                elif isinstance(audio_data, list):
+                    # 短语缓存命中: 已编码好的 Opus 包, 直接打包发送
+                    for opus_data in audio_data:
+                        if token.cancelled:
+                            break
+                        self._send_opus(opus_data, token)
+                elif isinstance(audio_data, bytes):
                     samples_per_frame = int(self.sevice_manager.audio_processor.frame_duration_ms * self.sevice_manager.audio_processor.sample_rate / 1000)*2
-                    audio_data = remain_data + audio_data
+                    # 上一轮不足一帧的尾巴不拼到新一轮
+                    audio_data = (remain_data if remain_token is token else b'') + audio_data
+                    remain_data = b''
+                    remain_token = token
                     # 切片, 编码, 打包, 发送
                     for i in range(0, len(audio_data), samples_per_frame):
+                        if token.cancelled:
+                            break
                         frame_slice = audio_data[i:i + samples_per_frame]
                         if len(frame_slice) == samples_per_frame:
                             # 编码当前帧并发送
                             opus_data = self.sevice_manager.audio_processor.encode_audio(frame_slice)
-                            bin_data = self.sevice_manager.audio_processor.pack_bin_frame(type=0, version=global_settings.protocol_version, payload=opus_data)
-                            self.sevice_manager.ws_send_queue.put(bin_data)
+                            self.sevice_manager.record_turn_packet(token, opus_data)
+                            self._send_opus(opus_data, token)
                         else:
                             # 最后一帧不足时, 保留
                             remain_data = frame_slice
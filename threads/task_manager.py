@@ -12,4 +12,5 @@ class TaskManager:
         提交任务到线程池
         """
         self.executor.submit(func, *args, **kwargs)
-        logger.info(f"任务提交成功: {func.__name__}, 参数: {args}, {kwargs}")
+        # 每轮对话都会提交任务, 不记录参数 (可能很长), 只在 DEBUG 级别输出
+        logger.debug(f"任务提交成功: {func.__name__}")
@@ -13,6 +13,9 @@ class TTSGenerateThread(threading.Thread):
             try:
                 # 从 TTS任务队列中获取文字
                 text_chunk = self.sevice_manager.tts_text_queue.get(timeout=1)  # 设置超时时间，避免阻塞
+                if self.sevice_manager.turn_cancelled:
+                    # 轮次已被打断, 不再合成
+                    continue
                 # 调用 TTS 服务生成语音
                 self.sevice_manager.tts_service.tts_speech_stream(text_chunk)
                 # 将生成的语音数据放入语音队列
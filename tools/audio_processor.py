@@ -1,17 +1,37 @@
 import struct
+import time
 from pyogg import OpusEncoder, OpusDecoder
 import sys
 sys.path.append("..")
 from tools.logger import logger
+from tools.stats import now_ms
+from tools.metrics import global_metrics, FAST_LATENCY_BUCKETS_MS
 
 # 默认音频配置参数
 SAMPLE_RATE = 16000
 CHANNELS = 1
 FRAME_DURATION_MS = 40
 
+# BinProtocol 消息类型
+FRAME_TYPE_AUDIO = 0      # opus 音频数据
+FRAME_TYPE_PLAYBACK = 1   # 设备播放回报 (v3, 无负载, seq 为已播放的下行帧, timestamp 为播放时间)
+FRAME_TYPE_BATCH = 2      # 合并发送的容器消息, 负载为多个条目, 每个条目: 类型 (1 字节) + 长度 (4 字节) + 数据
+
+# 容器条目类型
+BATCH_ITEM_BINARY = 0     # 完整的 BinProtocol 消息
+BATCH_ITEM_TEXT = 1       # UTF-8 编码的 JSON 文本消息
+
+OPUS_ENCODE_MS = global_metrics.histogram("opus_encode_ms", "Opus 编码耗时 (毫秒, 每次调用)", FAST_LATENCY_BUCKETS_MS)
+OPUS_DECODE_MS = global_metrics.histogram("opus_decode_ms", "Opus 解码耗时 (毫秒, 每次调用)", FAST_LATENCY_BUCKETS_MS)
+OPUS_CPU = global_metrics.counter("opus_cpu_seconds_total", "Opus 编解码占用的 CPU 时间 (秒)")
+
 class AudioProcessor:
     HEADER_FORMAT = "!HHI"  # 版本 (2 字节) + 类型 (2 字节) + 负载大小 (4 字节)
     HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    # v3: 在 v2 头部之后追加 序列号 (4 字节) + 时间戳 (8 字节, 毫秒)
+    HEADER_FORMAT_V3 = "!HHIIQ"
+    HEADER_SIZE_V3 = struct.calcsize(HEADER_FORMAT_V3)
+    BATCH_ITEM_FORMAT = "!BI"  # 条目类型 (1 字节) + 条目长度 (4 字节)
 
     def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS, frame_duration_ms=FRAME_DURATION_MS):
         self.sample_rate = sample_rate
@@ -33,38 +53,108 @@ class AudioProcessor:
         self.decoder.set_sampling_frequency(sample_rate)
         self.decoder.set_channels(channels)
 
-    def pack_bin_frame(self, version, type, payload):
+    def pack_bin_frame(self, version, type, payload, seq=0, timestamp=0):
         """
         打包 BinProtocol 消息
         :param version: 协议版本 (2 字节)
         :param type: 消息类型 (2 字节)
         :param payload: 消息负载 (字节)
+        :param seq: 序列号 (仅 v3)
+        :param timestamp: 采集/播放时间戳, 毫秒 (仅 v3)
         :return: 打包后的二进制数据
         """
-        header = struct.pack(self.HEADER_FORMAT, version, type, len(payload))
+        if version >= 3:
+            header = struct.pack(self.HEADER_FORMAT_V3, version, type, len(payload),
+                                 seq & 0xFFFFFFFF, int(timestamp))
+        else:
+            header = struct.pack(self.HEADER_FORMAT, version, type, len(payload))
         return header + payload
 
+    def pack_batch_frame(self, version, items, timestamp=0):
+        """
+        将多条待发送消息打包为一个容器消息
+        :param version: 协议版本
+        :param items: 消息列表, bytes 为 BinProtocol 消息, str 为 JSON 文本
+        :param timestamp: 发送时间戳, 毫秒 (仅 v3)
+        :return: 打包后的二进制数据
+        """
+        parts = []
+        for item in items:
+            if isinstance(item, str):
+                data = item.encode("utf-8")
+                parts.append(struct.pack(self.BATCH_ITEM_FORMAT, BATCH_ITEM_TEXT, len(data)))
+            else:
+                data = item
+                parts.append(struct.pack(self.BATCH_ITEM_FORMAT, BATCH_ITEM_BINARY, len(data)))
+            parts.append(data)
+        return self.pack_bin_frame(version, FRAME_TYPE_BATCH, b''.join(parts), timestamp=timestamp)
+
+    def unpack_batch_frame(self, payload):
+        """
+        拆分容器消息的负载 (客户端使用)
+        :param payload: FRAME_TYPE_BATCH 消息的负载
+        :return: 消息列表, bytes 为 BinProtocol 消息, str 为 JSON 文本; 格式错误时返回 None
+        """
+        items = []
+        offset = 0
+        item_header_size = struct.calcsize(self.BATCH_ITEM_FORMAT)
+        while offset < len(payload):
+            if len(payload) - offset < item_header_size:
+                logger.error("Batch item header truncated")
+                return None
+            item_type, length = struct.unpack_from(self.BATCH_ITEM_FORMAT, payload, offset)
+            offset += item_header_size
+            data = payload[offset:offset + length]
+            if len(data) != length:
+                logger.error("Batch item size mismatch")
+                return None
+            offset += length
+            items.append(data.decode("utf-8") if item_type == BATCH_ITEM_TEXT else data)
+        return items
+
     def unpack_bin_frame(self, data):
         """
         解包 BinProtocol 消息
         :param data: 接收到的二进制数据
-        :return: BinProtocol 对象或 None
+        :return: (version, type, payload) 或 None
+        """
+        res = self.unpack_bin_frame_ex(data)
+        if res:
+            return res[:3]
+        return None
+
+    def unpack_bin_frame_ex(self, data):
+        """
+        解包 BinProtocol 消息, 同时返回 v3 的序列号和时间戳
+        :param data: 接收到的二进制数据
+        :return: (version, type, payload, seq, timestamp) 或 None, v2 消息的 seq/timestamp 为 None
         """
         if len(data) < self.HEADER_SIZE:
             logger.error("Data too short to contain BinProtocol header")
             return None
 
-        version, type, payload_size = struct.unpack(self.HEADER_FORMAT, data[:self.HEADER_SIZE])
-        if len(data) < self.HEADER_SIZE + payload_size:
+        version = struct.unpack_from("!H", data)[0]
+        if version >= 3:
+            if len(data) < self.HEADER_SIZE_V3:
+                logger.error("Data too short to contain BinProtocol v3 header")
+                return None
+            version, type, payload_size, seq, timestamp = struct.unpack(self.HEADER_FORMAT_V3, data[:self.HEADER_SIZE_V3])
+            header_size = self.HEADER_SIZE_V3
+        else:
+            version, type, payload_size = struct.unpack(self.HEADER_FORMAT, data[:self.HEADER_SIZE])
+            seq, timestamp = None, None
+            header_size = self.HEADER_SIZE
+
+        if len(data) < header_size + payload_size:
             logger.error("Data size does not match payload_size")
             return None
 
-        payload = data[self.HEADER_SIZE:self.HEADER_SIZE + payload_size]
+        payload = data[header_size:header_size + payload_size]
         if len(payload) != payload_size:
             logger.error("Payload size mismatch")
             return None
 
-        return (version, type, payload)
+        return (version, type, payload, seq, timestamp)
 
     def encode_audio(self, pcm_data):
         """
@@ -80,11 +170,15 @@ class AudioProcessor:
             logger.error("PCM data size is less than one frame size")
             return None
 
+        start = now_ms()
+        cpu_start = time.thread_time()
         opus_data = b''
         for i in range(0, total_bytes_to_process, self.frame_size * 2):
             frame = pcm_data[i:i + self.frame_size * 2]
             encoded_frame = self.encoder.encode(frame)
             opus_data += encoded_frame
+        OPUS_ENCODE_MS.observe(now_ms() - start)
+        OPUS_CPU.inc(time.thread_time() - cpu_start)
 
         # # 如果有剩余未处理的数据，则记录警告
         # remaining_bytes = len(pcm_data) % (self.frame_size * 2)
@@ -99,6 +193,8 @@ class AudioProcessor:
         :param opus_data: Opus 数据 (字节)
         :return: 解码后的 PCM 音频数据 (字节)
         """
+        begin = now_ms()
+        cpu_start = time.thread_time()
         pcm_data = b''
         start = 0
         while start < len(opus_data):
@@ -108,6 +204,8 @@ class AudioProcessor:
             decoded_frame = self.decoder.decode(encoded_frame)
             pcm_data += decoded_frame
             start += encoded_frame_size
+        OPUS_DECODE_MS.observe(now_ms() - begin)
+        OPUS_CPU.inc(time.thread_time() - cpu_start)
 
         return pcm_data
 
@@ -0,0 +1,150 @@
+import asyncio
+import queue
+import sys
+sys.path.append("..")
+from tools.logger import logger
+
+# 队列溢出策略
+POLICY_BLOCK = "block"              # 阻塞上游, 超时后丢弃新数据
+POLICY_DROP_OLDEST = "drop_oldest"  # 丢弃队列中最旧的可丢弃数据
+POLICY_CANCEL_TURN = "cancel_turn"  # 取消当前轮次, 清空可丢弃数据
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_CANCEL_TURN)
+
+
+class BoundedQueue(queue.Queue):
+    """
+    带溢出策略的有界队列
+    特点：
+    - 队列满时按策略处理: 阻塞上游 / 丢弃最旧数据 / 取消当前轮次
+    - 只有 droppable 判定为可丢弃的数据才会被丢弃 (例如只丢音频, 不丢控制消息)
+    - 统计丢弃数、溢出次数和历史最高水位
+    - put 不会抛出 queue.Full, 数据被丢弃时返回 False
+    - 在事件循环线程中 put 时从不阻塞 (队列仍满时直接丢弃), 阻塞等待只用于工作线程中的生产者
+    """
+
+    def __init__(self, name: str, maxsize: int, policy: str = POLICY_BLOCK, droppable=None,
+                 on_overflow=None, block_timeout: float = None):
+        """
+        :param name: 队列名称, 用于日志和统计
+        :param maxsize: 最大长度, <= 0 表示不限制
+        :param policy: 溢出策略
+        :param droppable: 判断数据是否可丢弃的函数, 默认全部可丢弃
+        :param on_overflow: cancel_turn 策略下溢出时的回调
+        :param block_timeout: block 策略下的最长阻塞时间 (秒), None 表示一直阻塞
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"未知的队列溢出策略: {policy}, 可选: {POLICIES}")
+        super().__init__(maxsize)
+        self.name = name
+        self.policy = policy
+        self.droppable = droppable or (lambda item: True)
+        self.on_overflow = on_overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.overflows = 0
+        self.high_water = 0
+
+    def _put(self, item):
+        # 在 mutex 内被调用
+        super()._put(item)
+        if len(self.queue) > self.high_water:
+            self.high_water = len(self.queue)
+
+    def _drop_oldest(self) -> bool:
+        """丢弃最旧的一条可丢弃数据, 需在 mutex 内调用"""
+        for i, old in enumerate(self.queue):
+            if self.droppable(old):
+                del self.queue[i]
+                self.dropped += 1
+                return True
+        return False
+
+    @staticmethod
+    def _on_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def put(self, item, block=True, timeout=None) -> bool:
+        """
+        按溢出策略放入数据
+        :return: 数据是否成功入队
+        """
+        cancel = False
+        accepted = False
+        warning = None
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self.overflows += 1
+                if self.overflows == 1 or self.overflows % 100 == 0:
+                    # 日志在释放锁后输出, 避免其他生产者和消费者等待日志处理
+                    warning = (self.overflows, self.dropped)
+                if self.policy == POLICY_DROP_OLDEST and self._drop_oldest():
+                    # 丢弃和放入在同一次持锁中完成, 其他生产者不会抢占腾出的位置
+                    self._put(item)
+                    self.unfinished_tasks += 1
+                    self.not_empty.notify()
+                    accepted = True
+                elif self.policy == POLICY_CANCEL_TURN:
+                    cancel = True
+
+        if warning is not None:
+            logger.warning(f"队列 {self.name} 已满 (maxsize={self.maxsize}, policy={self.policy}), "
+                           f"溢出次数: {warning[0]}, 已丢弃: {warning[1]}")
+        if accepted:
+            return True
+        if cancel:
+            # 回调会取消轮次并清空其他队列, 不能在持有本队列的锁时调用
+            if self.on_overflow:
+                self.on_overflow()
+            else:
+                self.purge()
+
+        if self._on_event_loop():
+            block = False  # 阻塞会卡住整个事件循环
+        try:
+            super().put(item, block=block, timeout=timeout if timeout is not None else self.block_timeout)
+            return True
+        except queue.Full:
+            with self.mutex:
+                self.dropped += 1
+            return False
+
+    def has_droppable(self) -> bool:
+        """队列中是否有可丢弃的数据 (例如还没有发出的音频)"""
+        with self.mutex:
+            return any(self.droppable(item) for item in self.queue)
+
+    def purge(self, predicate=None) -> int:
+        """
+        清除队列中的数据
+        :param predicate: 判断是否清除的函数, 默认清除所有可丢弃数据
+        :return: 清除的数量
+        """
+        predicate = predicate or self.droppable
+        with self.mutex:
+            kept = [item for item in self.queue if not predicate(item)]
+            removed = len(self.queue) - len(kept)
+            if removed:
+                self.queue.clear()
+                self.queue.extend(kept)
+                self.dropped += removed
+                self.not_full.notify_all()
+        return removed
+
+    def stats(self) -> dict:
+        """
+        获取队列统计信息
+        :return: 统计字典
+        """
+        with self.mutex:
+            return {
+                "size": self._qsize(),
+                "maxsize": self.maxsize,
+                "policy": self.policy,
+                "high_water": self.high_water,
+                "dropped": self.dropped,
+                "overflows": self.overflows,
+            }
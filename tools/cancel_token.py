@@ -0,0 +1,43 @@
+import threading
+
+
+class CancelToken:
+    """
+    单轮对话的取消令牌
+    - 每轮对话创建一个新令牌, LLM 流、TTS 送入和音频发送在各自的循环中检查
+    - 音频数据携带所属轮次的令牌, 轮次取消后发送线程直接丢弃
+    - 对话任务退出时调用 finish, done 表示本轮已不再产生文本
+    """
+
+    def __init__(self, turn_id: int = 0):
+        """
+        :param turn_id: 轮次编号
+        """
+        self.turn_id = turn_id
+        self.reason = None
+        self._event = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def finish(self):
+        """本轮的对话任务已退出 (无论是否被取消)"""
+        self._done.set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """
+        取消本轮
+        :param reason: 取消原因, 例如 barge_in / overflow
+        :return: 是否是第一次取消
+        """
+        if self._event.is_set():
+            return False
+        self.reason = reason
+        self._event.set()
+        return True
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import signal
+import sys
+sys.path.append("..")
+from tools.logger import logger
+
+
+class ConfigReloader:
+    """
+    运行中重新加载配置文件, 不重启服务、不重新加载模型
+    - 收到 SIGHUP (仅 POSIX) 或配置文件的修改时间变化时, 调用 Settings.reload_from_json
+    - 可以直接生效的配置交给 on_reload 回调同步到各服务; 需要重启的配置只记录警告, 保持当前值
+    - 文件检查间隔每次读取 settings.CONFIG_WATCH_INTERVAL, 修改后下一次检查即生效
+    - SIGHUP 的默认动作是结束进程, 应在加载模型之前调用 listen_signal; 之前收到的信号在 run 开始后处理
+    """
+
+    def __init__(self, settings, config_path: str, on_reload=None):
+        """
+        :param settings: Settings 实例
+        :param config_path: 配置文件路径
+        :param on_reload: 回调 on_reload(applied), applied 为已生效的配置名列表
+        """
+        self.settings = settings
+        self.config_path = config_path
+        self.on_reload = on_reload
+        self._mtime = self._current_mtime()
+        self._event = None
+        self._sighup = None
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def request(self):
+        """请求重新加载 (在事件循环线程中调用, 例如信号处理)"""
+        if self._event is not None:
+            self._event.set()
+
+    def listen_signal(self):
+        """安装 SIGHUP 处理 (在事件循环中调用, 可重复调用)"""
+        if self._event is None:
+            self._event = asyncio.Event()
+        sighup = getattr(signal, "SIGHUP", None)
+        if sighup is None or self._sighup is not None:
+            return
+        try:
+            asyncio.get_running_loop().add_signal_handler(sighup, self.request)
+            self._sighup = sighup
+        except (NotImplementedError, RuntimeError):
+            pass  # 不在主线程或平台不支持, 只检查文件
+
+    def reload(self):
+        """
+        立即重新加载配置文件, 出错时保持当前配置
+        :return: (已生效的配置名列表, 需要重启的配置名列表)
+        """
+        self._mtime = self._current_mtime()
+        try:
+            applied, restart_required = self.settings.reload_from_json(self.config_path)
+        except Exception as e:
+            logger.error(f"重新加载配置失败, 继续使用当前配置: {e}")
+            return [], []
+        if applied and self.on_reload is not None:
+            try:
+                self.on_reload(applied)
+            except Exception as e:
+                logger.error(f"应用新配置失败: {e}")
+        if applied:
+            logger.info(f"配置已热加载: {applied}")
+        if restart_required:
+            logger.warning(f"以下配置需要重启服务才能生效: {restart_required}")
+        if not applied and not restart_required:
+            logger.info("配置文件没有变化")
+        return applied, restart_required
+
+    async def run(self):
+        """监听信号和配置文件变化, 直到任务被取消"""
+        self.listen_signal()
+        try:
+            while True:
+                interval = self.settings.CONFIG_WATCH_INTERVAL
+                try:
+                    await asyncio.wait_for(self._event.wait(), timeout=interval if interval > 0 else None)
+                    self._event.clear()
+                    logger.info("收到重新加载配置的信号")
+                except asyncio.TimeoutError:
+                    if self._current_mtime() == self._mtime:
+                        continue
+                    logger.info(f"配置文件已修改: {self.config_path}")
+                self.reload()
+        finally:
+            if self._sighup is not None:
+                asyncio.get_running_loop().remove_signal_handler(self._sighup)
+                self._sighup = None
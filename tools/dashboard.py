@@ -0,0 +1,91 @@
+import os
+import time
+import sys
+sys.path.append("..")
+from tools.metrics import global_metrics, MetricsRegistry
+
+# 计算 CPU 占用率的累计 CPU 时间指标 (显示名: 指标名)
+CPU_COUNTERS = {
+    "process": "process_cpu_seconds",
+    "vad": "vad_cpu_seconds_total",
+    "asr": "asr_cpu_seconds_total",
+    "opus": "opus_cpu_seconds_total",
+}
+# 换算为每秒速率的计数器 (显示名: 指标名)
+RATE_COUNTERS = {
+    "bytes_in": "ws_bytes_in_total",
+    "bytes_out": "ws_bytes_out_total",
+}
+# 各组件的耗时直方图
+COMPONENT_HISTOGRAMS = ("vad_inference_ms", "asr_inference_ms", "asr_rtf", "llm_first_token_ms", "llm_total_ms",
+                        "tts_first_chunk_ms", "opus_encode_ms", "opus_decode_ms", "event_loop_lag_ms")
+
+
+def _compact(summary: dict) -> dict:
+    """只保留样本数和 p50/p95/p99"""
+    if not summary:
+        return None
+    return {"n": summary["count"], "p50": summary["p50"], "p95": summary["p95"], "p99": summary["p99"]}
+
+
+class DashboardSnapshot:
+    """
+    生成仪表盘使用的紧凑快照 (由 SnapshotPublisher 每秒发送几次)
+    - 会话数、各队列长度和丢弃数、上行丢帧
+    - 每轮各阶段延迟和各组件耗时的 p50/p95/p99
+    - 两次快照之间的 CPU 占用率 (按模型) 和收发速率
+    """
+
+    def __init__(self, service_manager, registry: MetricsRegistry = global_metrics):
+        """
+        :param service_manager: ServiceManager 实例
+        :param registry: 指标注册表
+        """
+        self.service_manager = service_manager
+        self.registry = registry
+        self.started_at = time.time()
+        self._last_time = None
+        self._last_values = {}
+
+    def _value(self, name: str):
+        metric = self.registry.get(name)
+        return metric.snapshot() if metric is not None else None
+
+    def _rates(self, names: dict, scale: float = 1.0) -> dict:
+        """两次快照之间的变化速率, 第一次调用时为 None"""
+        now = time.monotonic()
+        elapsed = now - self._last_time if self._last_time is not None else None
+        rates = {}
+        for key, name in names.items():
+            value = self._value(name) or 0
+            last = self._last_values.get(name)
+            rates[key] = round((value - last) / elapsed * scale, 1) if elapsed and last is not None else None
+            self._last_values[name] = value
+        return rates
+
+    def build(self) -> dict:
+        sm = self.service_manager
+        queues = {name: {"size": stats["size"], "max": stats["maxsize"], "dropped": stats["dropped"]}
+                  for name, stats in sm.queue_stats().items()}
+        stream = sm.stream_stats
+        tracer_summary = sm.tracer.summary() if sm.tracer is not None else {"total": None, "stages": {}}
+        cpu = self._rates(CPU_COUNTERS, scale=100.0)   # 占用一个核心的百分比
+        traffic = self._rates(RATE_COUNTERS)
+        self._last_time = time.monotonic()
+        return {
+            "t": round(time.time(), 3),
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at),
+            "sessions": self._value("active_sessions"),
+            "sessions_total": self._value("sessions_total"),
+            "session_id": sm.session_id,
+            "queues": queues,
+            "uplink": {"received": stream.received, "lost": stream.lost, "jitter_ms": round(stream.jitter_ms, 1)},
+            "turn": _compact(tracer_summary["total"]),
+            "stages": {stage: _compact(summary) for stage, summary in tracer_summary["stages"].items()},
+            "components": {name: _compact(self._value(name)) for name in COMPONENT_HISTOGRAMS
+                           if self.registry.get(name) is not None},
+            "cpu": cpu,
+            "traffic": traffic,
+            "loop_lag_ms": self._value("event_loop_lag_last_ms"),
+        }
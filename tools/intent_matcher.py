@@ -0,0 +1,161 @@
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+import sys
+sys.path.append("..")
+from tools.logger import logger
+
+try:
+    import jieba
+    jieba.setLogLevel(logging.WARNING)
+except ImportError:  # 没有 jieba 时只使用字符 n-gram
+    jieba = None
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """
+    归一化文本: 全角转半角、转小写、去掉标点和空白
+    :param text: 原始文本
+    :return: 归一化后的文本
+    """
+    return _PUNCT_RE.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def tokenize(text: str) -> frozenset:
+    """
+    将文本切分为匹配用的 token 集合: jieba 分词结果 + 字符二元组/三元组
+    :param text: 原始文本
+    :return: token 集合
+    """
+    norm = normalize_text(text)
+    if not norm:
+        return frozenset()
+    tokens = set(jieba.lcut(norm)) if jieba else set()
+    if len(norm) < 2:
+        tokens.add(norm)
+    for n in (2, 3):
+        tokens.update(norm[i:i + n] for i in range(len(norm) - n + 1))
+    return frozenset(tokens)
+
+
+class LocalIntentMatcher:
+    """
+    本地意图快速匹配, 位于 LLM 意图识别之前
+    特点：
+    - 从每个注册函数的名称、描述和示例语句建立倒排索引, 函数注册时增量更新
+    - 归一化后与示例完全相同的语句直接命中, 其余按 token 集合的 Jaccard 相似度打分
+    - 只有最高分超过阈值且明显高于其他候选时才返回结果, 否则返回 None 交给 LLM
+    - 需要参数的函数只能由带 arguments 的示例命中
+    """
+
+    # 名称/描述不是用户的原话, 命中时打折扣
+    DESCRIPTION_WEIGHT = 0.9
+
+    def __init__(self, threshold: float = 0.8, margin: float = 0.15):
+        """
+        :param threshold: 命中所需的最低相似度
+        :param margin: 最高分需要领先其他函数的分数
+        """
+        self.threshold = threshold
+        self.margin = margin
+        self._entries = []          # [(function_name, tokens, arguments, weight)]
+        self._exact = {}            # 归一化文本 -> entry id
+        self._index = {}            # token -> {entry id}
+        self._by_function = {}      # function_name -> [entry id]
+        if jieba:
+            jieba.initialize()      # 提前加载词典, 避免第一轮对话时卡顿
+
+    def add_function(self, function_name: str, description: str = "", parameters: Dict = None, examples: List = None):
+        """
+        索引一个函数, 重复注册时替换旧的索引
+        :param function_name: 函数名称
+        :param description: 功能描述
+        :param parameters: 参数结构 {字段名: 描述}
+        :param examples: 示例语句, 每项为字符串或 {"text": ..., "arguments": {...}}
+        """
+        self.remove_function(function_name)
+        needs_arguments = bool(parameters)
+        if not needs_arguments:
+            self._add_entry(function_name, description, None, self.DESCRIPTION_WEIGHT)
+            self._add_entry(function_name, function_name.replace("_", " "), None, self.DESCRIPTION_WEIGHT)
+        for example in examples or []:
+            if isinstance(example, str):
+                text, arguments = example, None
+            elif isinstance(example, dict):
+                text, arguments = example.get("text", ""), example.get("arguments")
+            else:
+                continue
+            if needs_arguments and not arguments:
+                continue
+            self._add_entry(function_name, text, arguments, 1.0)
+
+    def _add_entry(self, function_name, text, arguments, weight):
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        entry_id = len(self._entries)
+        self._entries.append((function_name, tokens, arguments, weight))
+        self._by_function.setdefault(function_name, []).append(entry_id)
+        self._exact.setdefault(normalize_text(text), entry_id)
+        for token in tokens:
+            self._index.setdefault(token, set()).add(entry_id)
+
+    def remove_function(self, function_name: str):
+        """从索引中移除一个函数"""
+        for entry_id in self._by_function.pop(function_name, []):
+            _, tokens, _, _ = self._entries[entry_id]
+            for token in tokens:
+                ids = self._index.get(token)
+                if ids:
+                    ids.discard(entry_id)
+            self._entries[entry_id] = (None, frozenset(), None, 0)
+        self._exact = {k: v for k, v in self._exact.items() if self._entries[v][0] is not None}
+
+    @staticmethod
+    def _to_function_call(function_name, arguments) -> List[Dict[str, Any]]:
+        function_call = {"name": function_name}
+        if arguments:
+            function_call["arguments"] = {k: str(v) for k, v in arguments.items()}
+        return [{"function_call": function_call}]
+
+    def match(self, text: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        匹配用户语句
+        :param text: 用户语句
+        :return: 与 IntentService.detect_intent 相同格式的函数调用列表, 不确定时返回 None
+        """
+        norm = normalize_text(text)
+        if not norm:
+            return None
+        entry_id = self._exact.get(norm)
+        if entry_id is not None:
+            function_name, _, arguments, weight = self._entries[entry_id]
+            if weight >= self.threshold:
+                return self._to_function_call(function_name, arguments)
+
+        tokens = tokenize(text)
+        candidates = set()
+        for token in tokens:
+            candidates.update(self._index.get(token, ()))
+
+        # 每个 (函数, 参数) 只保留最高分
+        best = {}
+        for entry_id in candidates:
+            function_name, entry_tokens, arguments, weight = self._entries[entry_id]
+            score = weight * len(tokens & entry_tokens) / len(tokens | entry_tokens)
+            key = (function_name, repr(sorted((arguments or {}).items())))
+            if score > best.get(key, (0, None))[0]:
+                best[key] = (score, arguments)
+        if not best:
+            return None
+
+        ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)
+        (function_name, _), (top_score, arguments) = ranked[0]
+        runner_up = ranked[1][1][0] if len(ranked) > 1 else 0.0
+        if top_score >= self.threshold and top_score - runner_up >= self.margin:
+            logger.debug(f"本地意图命中: {function_name}, score={top_score:.2f}, runner_up={runner_up:.2f}")
+            return self._to_function_call(function_name, arguments)
+        return None
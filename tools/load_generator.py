@@ -0,0 +1,526 @@
+"""
+WebSocket 压测工具: 模拟多个设备, 把 test/ 下的 PCM 录音按实时速率回放给服务端, 走完整的 VAD/ASR/LLM/TTS 流程
+- 每个客户端带 AuthHandler 需要的请求头建立连接, 发送 hello 后每轮发送 listening, 再按帧发送 Opus 音频,
+  录音结束后补静音直到服务端给出识别结果, 然后接收 TTS 音频直到 {"type": "tts", "state": "end"}
+- 统计每轮 语音结束 -> ASR 结果 / 第一帧 TTS 音频 / TTS 结束 的延迟百分位, 以及按原因分类的失败次数
+- 压测前后各读取一次服务端的 /metrics.json, 计算压测期间服务端的吞吐量
+
+用法:
+    # 对运行中的服务压测: 2 个服务实例各一个连接, 每个连接 3 轮
+    python -m tools.load_generator --url ws://127.0.0.1:8000 --url ws://127.0.0.1:8010 --clients 2 --turns 3
+    # 完全离线: 在本进程内启动服务, LLM 使用 mock 提供方, TTS 使用 local 后端, 不访问 DashScope
+    python -m tools.load_generator --serve --clients 1 --turns 5
+
+注意: 主服务每个进程只服务一个设备 (所有连接共用一个 ServiceManager), 同一个服务上的并发连接会互相打断轮次,
+每轮延迟和吞吐量都没有意义, 因此并发连接数不能超过服务实例数 (--serve 时只有一个);
+模拟多个设备时启动多个服务实例, 重复传入 --url (每个实例一个连接) 和 --metrics-url
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+import urllib.request
+from collections import Counter
+import websockets
+import sys
+sys.path.append("..")
+from tools.logger import logger
+from tools.stats import Histogram, DEFAULT_LATENCY_BUCKETS_MS, now_ms
+from tools.audio_processor import AudioProcessor, FRAME_TYPE_AUDIO, FRAME_TYPE_PLAYBACK, FRAME_TYPE_BATCH
+from config.settings import global_settings, CONFIG_FILE_PATH
+
+# 整轮耗时在高负载下可能超过 10 秒, 在默认桶的基础上增加上界
+TURN_LATENCY_BUCKETS_MS = DEFAULT_LATENCY_BUCKETS_MS + (15000, 20000, 30000, 60000)
+
+_DEFAULT_PCM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "*.pcm")
+
+
+def load_utterances(paths: list, processor: AudioProcessor) -> list:
+    """
+    读取 PCM 录音 (16kHz 单声道 16bit) 并预先编码为 Opus 帧, 所有客户端共用, 压测时不再占用编码的 CPU
+    直接使用编码器, 不计入进程内服务的 Opus 指标
+    :param paths: PCM 文件路径列表
+    :param processor: 音频处理器 (提供编码器和帧大小)
+    :return: [(文件名, [Opus 帧, ...]), ...]
+    """
+    frame_bytes = processor.frame_size * 2
+    utterances = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pcm = f.read()
+        if len(pcm) % frame_bytes:
+            pcm += b"\x00" * (frame_bytes - len(pcm) % frame_bytes)  # 最后一帧补零
+        frames = [bytes(processor.encoder.encode(pcm[i:i + frame_bytes])) for i in range(0, len(pcm), frame_bytes)]
+        if frames:
+            utterances.append((os.path.basename(path), frames))
+    return utterances
+
+
+class Turn:
+    """客户端观测到的一轮对话, 时间均为单调时钟的毫秒值"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.speech_end = None      # 录音的最后一帧发出的时间
+        self.asr_at = None
+        self.first_audio_at = None
+        self.end_at = None
+        self.asr_text = None
+        self.audio_frames = 0
+        self.audio_bytes = 0
+        self.failure = None         # 失败原因, 成功时为 None
+        self.recognized = asyncio.Event()   # 收到 ASR 结果 (或轮次已失败)
+        self.finished = asyncio.Event()     # 收到 TTS 结束 (或轮次已失败)
+
+    def fail(self, reason: str):
+        if self.failure is None and self.end_at is None:
+            self.failure = reason
+        self.recognized.set()
+        self.finished.set()
+
+
+class LoadReport:
+    """汇总所有客户端的结果"""
+
+    def __init__(self):
+        self.asr_ms = Histogram(TURN_LATENCY_BUCKETS_MS)
+        self.first_audio_ms = Histogram(TURN_LATENCY_BUCKETS_MS)
+        self.turn_ms = Histogram(TURN_LATENCY_BUCKETS_MS)
+        self.turns = 0
+        self.failures = Counter()
+        self.connect_failures = Counter()
+        self.connections = 0
+        self.uplink_frames = 0
+        self.downlink_frames = 0
+        self.downlink_bytes = 0
+
+    def add(self, turn: Turn):
+        self.turns += 1
+        self.downlink_frames += turn.audio_frames
+        self.downlink_bytes += turn.audio_bytes
+        if turn.failure is not None:
+            self.failures[turn.failure] += 1
+            return
+        self.asr_ms.observe(turn.asr_at - turn.speech_end)
+        if turn.first_audio_at is not None:
+            self.first_audio_ms.observe(turn.first_audio_at - turn.speech_end)
+        self.turn_ms.observe(turn.end_at - turn.speech_end)
+
+    def summary(self, elapsed: float, targets: int) -> dict:
+        """
+        :param elapsed: 压测耗时 (秒)
+        :param targets: 服务实例数 (每个实例一个连接)
+        """
+        ok = self.turns - sum(self.failures.values())
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "targets": targets,
+            "connections": self.connections,
+            "connect_failures": dict(self.connect_failures),
+            "turns": self.turns,
+            "turns_ok": ok,
+            "turn_failures": dict(self.failures),
+            "turns_per_s": round(ok / elapsed, 2) if elapsed > 0 else None,
+            "latency_ms": {
+                "speech_end_to_asr": self.asr_ms.snapshot(),
+                "speech_end_to_first_audio": self.first_audio_ms.snapshot(),
+                "speech_end_to_tts_end": self.turn_ms.snapshot(),
+            },
+            "uplink_frames": self.uplink_frames,
+            "downlink_frames": self.downlink_frames,
+            "downlink_bytes": self.downlink_bytes,
+        }
+
+
+class LoadClient:
+    """
+    一个模拟设备
+    - 接收任务解析服务端消息 (包括合并发送的容器消息), 更新当前轮次
+    - v3 协议下收到下行音频帧立即回报播放时间, 服务端可以统计端到端延迟
+    """
+
+    def __init__(self, index: int, url: str, args, processor: AudioProcessor, utterances: list, silence: bytes,
+                 report: LoadReport):
+        """
+        :param index: 客户端编号
+        :param url: 服务地址
+        :param args: 命令行参数
+        :param processor: 音频处理器 (只用于打包/解包, 所有客户端共用)
+        :param utterances: load_utterances 预先编码的录音
+        :param silence: 一帧静音的 Opus 数据
+        :param report: 结果汇总
+        """
+        self.index = index
+        self.url = url
+        self.args = args
+        self.processor = processor
+        self.utterances = utterances
+        self.silence = silence
+        self.report = report
+        self.version = args.protocol_version
+        self.seq = 0
+        self.turn = None
+        self.websocket = None
+
+    def _headers(self) -> dict:
+        headers = {
+            "Authorization": f"Bearer {self.args.token}",
+            "Device-Id": self.args.device_id,
+            "Protocol-Version": str(self.args.protocol_version),
+        }
+        if self.args.batching:
+            headers["Frame-Batching"] = "1"
+        return headers
+
+    async def run(self):
+        try:
+            websocket = await websockets.connect(self.url, extra_headers=self._headers(), max_size=None,
+                                                 open_timeout=self.args.connect_timeout)
+        except asyncio.TimeoutError:
+            self.report.connect_failures["connect_timeout"] += 1
+            return
+        except (OSError, websockets.exceptions.InvalidHandshake) as e:
+            logger.warning(f"[client {self.index}] connect failed: {e}")
+            self.report.connect_failures["connect_error"] += 1
+            return
+        self.websocket = websocket
+        receiver = None
+        try:
+            reply = json.loads(await asyncio.wait_for(websocket.recv(), timeout=self.args.connect_timeout))
+            if reply.get("type") != "auth" or reply.get("message") != "Client authenticated":
+                logger.warning(f"[client {self.index}] authentication failed: {reply}")
+                self.report.connect_failures["auth"] += 1
+                return
+            self.version = reply.get("protocol_version", self.version)
+            self.report.connections += 1
+            receiver = asyncio.create_task(self._receive())
+            await websocket.send(json.dumps({
+                "type": "hello",
+                "audio_params": {"format": "opus", "sample_rate": self.processor.sample_rate,
+                                 "channels": self.processor.channels, "frame_duration": self.processor.frame_duration_ms},
+            }))
+            for n in range(self.args.turns):
+                name, frames = self.utterances[(self.index + n) % len(self.utterances)]
+                turn = await self._run_turn(name, frames)
+                if turn.failure == "closed":
+                    break
+                await asyncio.sleep(self.args.think_ms / 1000)
+        except asyncio.TimeoutError:
+            self.report.connect_failures["auth_timeout"] += 1
+        except websockets.exceptions.ConnectionClosed as e:
+            logger.warning(f"[client {self.index}] connection closed: {e}")
+            if self.turn is not None:
+                self.turn.fail("closed")
+        finally:
+            if self.turn is not None:
+                # 发送过程中连接断开, 当前轮次未完成
+                self.report.add(self.turn)
+                self.turn = None
+            if receiver is not None:
+                receiver.cancel()
+            await websocket.close()
+
+    async def _run_turn(self, name: str, frames: list) -> Turn:
+        turn = self.turn = Turn(name)
+        await self.websocket.send(json.dumps({"type": "state", "state": "listening"}))
+        loop = asyncio.get_running_loop()
+        interval = self.processor.frame_duration_ms / 1000
+        start = loop.time()
+        sent = 0
+
+        async def send_frame(payload):
+            nonlocal sent
+            await self.websocket.send(self.processor.pack_bin_frame(self.version, FRAME_TYPE_AUDIO, payload,
+                                                                    seq=self.seq, timestamp=time.time() * 1000))
+            self.seq += 1
+            sent += 1
+            self.report.uplink_frames += 1
+            # 按实时速率发送, 以起始时间为基准, 避免误差累积
+            delay = start + sent * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        for payload in frames:
+            if turn.recognized.is_set():
+                break  # 服务端已判定语音结束 (例如 VAD 缓冲区已满)
+            await send_frame(payload)
+        turn.speech_end = now_ms()
+        # 录音之后补静音, 服务端检测到语音结束后停止发送
+        for _ in range(int(self.args.tail_ms / self.processor.frame_duration_ms)):
+            if turn.recognized.is_set():
+                break
+            await send_frame(self.silence)
+
+        remaining = self.args.turn_timeout - (now_ms() - turn.speech_end) / 1000
+        try:
+            await asyncio.wait_for(turn.recognized.wait(), timeout=max(remaining, 0.1))
+        except asyncio.TimeoutError:
+            turn.fail("no_speech_end")
+        remaining = self.args.turn_timeout - (now_ms() - turn.speech_end) / 1000
+        try:
+            await asyncio.wait_for(turn.finished.wait(), timeout=max(remaining, 0.1))
+        except asyncio.TimeoutError:
+            turn.fail("timeout")
+        self.turn = None
+        self.report.add(turn)
+        return turn
+
+    async def _receive(self):
+        try:
+            async for message in self.websocket:
+                await self._dispatch(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        if self.turn is not None:
+            self.turn.fail("closed")
+
+    async def _dispatch(self, message):
+        if isinstance(message, str):
+            self._on_text(json.loads(message))
+            return
+        frame = self.processor.unpack_bin_frame_ex(message)
+        if frame is None:
+            return
+        _, frame_type, payload, seq, _ = frame
+        if frame_type == FRAME_TYPE_BATCH:
+            for item in self.processor.unpack_batch_frame(payload) or []:
+                await self._dispatch(item)
+        elif frame_type == FRAME_TYPE_AUDIO:
+            turn = self.turn
+            if turn is not None:
+                if turn.first_audio_at is None:
+                    turn.first_audio_at = now_ms()
+                turn.audio_frames += 1
+                turn.audio_bytes += len(payload)
+            if seq is not None:
+                # 模拟设备收到即播放
+                await self.websocket.send(self.processor.pack_bin_frame(self.version, FRAME_TYPE_PLAYBACK, b"",
+                                                                        seq=seq, timestamp=time.time() * 1000))
+
+    def _on_text(self, data: dict):
+        turn = self.turn
+        if turn is None:
+            return
+        msg_type = data.get("type")
+        if msg_type == "asr":
+            turn.asr_at = now_ms()
+            turn.asr_text = data.get("text")
+            turn.recognized.set()
+        elif msg_type == "vad" and data.get("state") == "no_speech":
+            turn.fail("no_speech")
+        elif msg_type == "tts" and data.get("state") == "end":
+            if turn.asr_at is None:
+                return  # 上一轮的结束消息
+            turn.end_at = now_ms()
+            turn.finished.set()
+        elif msg_type == "abort":
+            turn.fail("aborted")
+        elif msg_type == "error":
+            logger.warning(f"[client {self.index}] server error: {data}")
+
+
+def fetch_metrics(url: str):
+    """
+    读取服务端的 /metrics.json
+    :return: 指标摘要, 无法访问时返回 None
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to fetch metrics from {url}: {e}")
+        return None
+
+
+def server_throughput(before: dict, after: dict, elapsed: float) -> dict:
+    """
+    根据压测前后两次指标摘要计算服务端的吞吐量
+    计数器和直方图的样本数取差值, 延迟分布取压测结束时的累计值
+    """
+    def delta(name):
+        return (after.get(name) or 0) - (before.get(name) or 0)
+
+    def count(name):
+        return (after.get(name) or {}).get("count", 0) - (before.get(name) or {}).get("count", 0)
+
+    def rate(value):
+        return round(value / elapsed, 2) if elapsed > 0 else None
+
+    asr_turns = count("asr_inference_ms")
+    return {
+        "sessions": delta("sessions_total"),
+        "asr_turns": asr_turns,
+        "asr_turns_per_s": rate(asr_turns),
+        "llm_requests": count("llm_total_ms"),
+        "llm_errors": delta("llm_errors_total"),
+        "ws_bytes_in_per_s": rate(delta("ws_bytes_in_total")),
+        "ws_bytes_out_per_s": rate(delta("ws_bytes_out_total")),
+        "cpu_percent": round(delta("process_cpu_seconds") / elapsed * 100, 1) if elapsed > 0 else None,
+        "queue_dropped": after.get("queue_dropped"),
+        "asr_inference_ms": after.get("asr_inference_ms"),
+        "llm_first_token_ms": after.get("llm_first_token_ms"),
+        "tts_first_chunk_ms": after.get("tts_first_chunk_ms"),
+        "event_loop_lag_ms": after.get("event_loop_lag_ms"),
+    }
+
+
+async def start_local_server(port: int):
+    """
+    在本进程内启动主服务 (与 main.py 相同的流水线), LLM 和 TTS 替换为离线实现, 不访问 DashScope:
+    LLM_PROVIDER = "mock" (MockProvider), TTS_BACKEND = "local" (LocalTTSBackend), VAD/ASR 仍使用本地模型
+    压测端与服务共用一个进程和事件循环, 结果偏保守
+    :param port: 监听端口
+    :return: (WebSocketServer, 服务任务)
+    """
+    from service_manager import ServiceManager
+    from threads.audio_send_thread import AudioSendThread
+    from ws_server import WebSocketServer
+
+    global_settings.LLM_PROVIDER = "mock"
+    global_settings.TTS_BACKEND = "local"
+    service_manager = ServiceManager()
+    AudioSendThread(service_manager).start()
+    server = WebSocketServer(
+        host="127.0.0.1",
+        port=port,
+        access_token=global_settings.ACCESS_TOKEN,
+        device_id=global_settings.DEVICE_ID,
+        protocol_version=global_settings.PROTOCOL_VERSION,
+        service_manager=service_manager,
+        supported_protocol_versions=global_settings.SUPPORTED_PROTOCOL_VERSIONS,
+    )
+    ready = asyncio.Event()
+    task = asyncio.create_task(server.start_server(on_ready=ready.set))
+    waiter = asyncio.create_task(ready.wait())
+    await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    if task.done():
+        waiter.cancel()
+        task.result()  # 启动失败 (例如端口被占用) 时抛出异常
+    return server, task
+
+
+async def stop_local_server(server, task):
+    from models.llm_client import close_async_llm_client
+
+    await server.drain(timeout=0)
+    await task
+    server.service_manager.stop_event.set()
+    await close_async_llm_client()
+
+
+async def run_load(args) -> dict:
+    processor = AudioProcessor()
+    utterances = load_utterances(args.pcm, processor)
+    if not utterances:
+        raise ValueError(f"没有可用的 PCM 文件: {args.pcm}")
+    silence = bytes(processor.encoder.encode(b"\x00" * processor.frame_size * 2))
+
+    server = task = None
+    if args.serve:
+        server, task = await start_local_server(args.port)
+    try:
+        if args.serve:
+            # 同一进程, 直接读取指标注册表
+            from tools.metrics import global_metrics
+            sources = {"local": global_metrics.snapshot}
+        else:
+            sources = {url: (lambda url=url: fetch_metrics(url)) for url in args.metrics_url}
+        loop = asyncio.get_running_loop()
+        before = {name: await loop.run_in_executor(None, fetch) for name, fetch in sources.items()}
+
+        report = LoadReport()
+        clients = [LoadClient(i, args.url[i % len(args.url)], args, processor, utterances, silence, report) for i in range(args.clients)]
+
+        async def start_client(client):
+            # 在 ramp_up 秒内均匀地建立连接
+            await asyncio.sleep(args.ramp_up * client.index / max(args.clients, 1))
+            await client.run()
+
+        logger.info(f"Load test started: {args.clients} client(s) x {args.turns} turn(s), "
+                    f"{len(utterances)} utterance(s), targets: {args.url}")
+        started = time.monotonic()
+        await asyncio.gather(*(start_client(client) for client in clients))
+        elapsed = time.monotonic() - started
+
+        result = report.summary(elapsed, len(args.url))
+        result["server"] = {}
+        for name, fetch in sources.items():
+            after = await loop.run_in_executor(None, fetch)
+            if before.get(name) is not None and after is not None:
+                result["server"][name] = server_throughput(before[name], after, elapsed)
+        return result
+    finally:
+        if server is not None:
+            await stop_local_server(server, task)
+
+
+def print_report(result: dict):
+    print("\n=== 压测结果 ===")
+    print(f"服务实例: {result['targets']} (每个实例一个连接, 每个进程只服务一个设备)")
+    print(f"连接: {result['connections']} 成功, 失败 {result['connect_failures'] or 0}")
+    print(f"轮次: {result['turns']}, 成功 {result['turns_ok']}, 失败 {result['turn_failures'] or 0}")
+    print(f"耗时: {result['elapsed_s']}s, 吞吐: {result['turns_per_s']} 轮/秒")
+    print(f"上行 Opus 帧: {result['uplink_frames']}, 下行音频帧: {result['downlink_frames']} ({result['downlink_bytes']} 字节)")
+    print(f"\n{'延迟 (毫秒)':<28}{'count':>7}{'avg':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, snap in result["latency_ms"].items():
+        values = "".join(f"{'-' if snap[k] is None else snap[k]:>9}" for k in ("avg", "p50", "p95", "p99", "max"))
+        print(f"{name:<30}{snap['count']:>7}{values}")
+    for name, server in result["server"].items():
+        print(f"\n服务端 [{name}]:")
+        for key, value in server.items():
+            print(f"  {key}: {json.dumps(value, ensure_ascii=False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket load generator replaying test PCM through the full pipeline")
+    parser.add_argument("--url", action="append", help="服务地址, 可重复, 每个服务实例一个连接 (默认 ws://127.0.0.1:8000)")
+    parser.add_argument("--metrics-url", action="append", help="服务端 /metrics.json 地址, 可重复")
+    parser.add_argument("--serve", action="store_true", help="在本进程内启动使用 mock LLM 和 local TTS 的服务")
+    parser.add_argument("--port", type=int, default=8000, help="--serve 时的监听端口")
+    parser.add_argument("--clients", type=int, default=1, help="并发连接数, 不能超过服务实例数")
+    parser.add_argument("--turns", type=int, default=3, help="每个连接的对话轮数")
+    parser.add_argument("--pcm", action="append", help="回放的 PCM 文件 (16kHz 单声道 16bit), 可重复, 默认 test/*.pcm")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="在多少秒内建立全部连接")
+    parser.add_argument("--think-ms", type=float, default=500, help="两轮之间的间隔 (毫秒)")
+    parser.add_argument("--tail-ms", type=float, default=3000, help="录音之后最多补多长的静音 (毫秒)")
+    parser.add_argument("--turn-timeout", type=float, default=30, help="语音结束后等待 TTS 结束的最长时间 (秒)")
+    parser.add_argument("--connect-timeout", type=float, default=10, help="建立连接和鉴权的超时 (秒)")
+    parser.add_argument("--token", default=None, help="鉴权令牌, 默认使用配置中的 ACCESS_TOKEN")
+    parser.add_argument("--device-id", default=None, help="设备 ID, 默认使用配置中的 DEVICE_ID")
+    parser.add_argument("--protocol-version", type=int, default=None, help="协议版本, 默认使用配置中的 PROTOCOL_VERSION")
+    parser.add_argument("--batching", action="store_true", help="请求服务端合并发送 (Frame-Batching)")
+    parser.add_argument("--json", default=None, help="同时把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    global_settings.load_from_json(CONFIG_FILE_PATH)
+    args.token = args.token or global_settings.ACCESS_TOKEN
+    args.device_id = args.device_id or global_settings.DEVICE_ID
+    args.protocol_version = args.protocol_version or global_settings.PROTOCOL_VERSION
+    args.pcm = args.pcm or sorted(glob.glob(_DEFAULT_PCM))
+    if args.serve:
+        args.url = [f"ws://127.0.0.1:{args.port}"]
+    else:
+        args.url = list(dict.fromkeys(args.url or ["ws://127.0.0.1:8000"]))
+    # 同一个服务进程上的并发连接共用一个 ServiceManager, 会互相打断, 测出的每轮延迟和吞吐量是错的
+    if args.clients > len(args.url):
+        parser.error(f"--clients {args.clients} 超过服务实例数 {len(args.url)}: 每个服务进程只服务一个设备, "
+                     f"请启动多个服务实例并为每个实例传入一个 --url")
+        if args.metrics_url is None:
+            args.metrics_url = ([f"http://127.0.0.1:{global_settings.METRICS_PORT}/metrics.json"]
+                                if global_settings.METRICS_ENABLED else [])
+
+    try:
+        result = asyncio.run(run_load(args))
+    except KeyboardInterrupt:
+        logger.info("Load test interrupted")
+        return
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from collections import deque
+import sys
+sys.path.append("..")
+from tools.logger import logger
+
+
+class LogViewer:
+    """
+    单个日志查看者 (浏览器连接)
+    - 待发送的行放在自己的有界缓冲中, 超出上限时丢弃最旧的行并计数
+    - 发送慢的查看者只会丢自己的行, 不会拖慢其他查看者
+    """
+
+    def __init__(self, websocket, max_pending: int):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.dropped = 0          # 累计丢弃的行数
+        self._reported = 0        # 已告知查看者的丢弃数
+        self.event = asyncio.Event()
+
+    def push(self, lines):
+        """放入若干行 (在事件循环线程中调用)"""
+        for line in lines:
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append(line)
+        self.event.set()
+
+    def take(self, max_lines: int) -> str:
+        """取出最多 max_lines 行, 合并为一条消息; 有新的丢弃时在开头注明"""
+        count = min(len(self.pending), max_lines)
+        lines = [self.pending.popleft() for _ in range(count)]
+        if self.dropped > self._reported:
+            lines.insert(0, f"[日志查看器] 发送过慢, 已丢弃 {self.dropped - self._reported} 行\n")
+            self._reported = self.dropped
+        if not self.pending:
+            self.event.clear()
+        return "".join(lines)
+
+
+class LogFanout:
+    """
+    把服务日志分发给多个浏览器连接
+    特点：
+    - 读取线程调用 post, 行先攒在线程间的列表中, 每批只唤醒一次事件循环
+    - 事件循环中维护最近 backlog_lines 行的环形缓冲, 新的查看者先收到这些历史日志
+    - 每个查看者有独立的有界缓冲和发送任务, 按批 (最多 batch_lines 行) 发送
+    """
+
+    def __init__(self, backlog_lines: int = 2000, viewer_max_pending: int = 5000, batch_lines: int = 500,
+                 batch_interval: float = 0.1):
+        """
+        :param backlog_lines: 保留的历史行数
+        :param viewer_max_pending: 每个查看者最多积压的行数
+        :param batch_lines: 每条消息最多包含的行数
+        :param batch_interval: 两次发送之间的最短间隔 (秒), 用于合并短时间内的多行
+        """
+        self.backlog = deque(maxlen=backlog_lines)
+        self.viewer_max_pending = viewer_max_pending
+        self.batch_lines = batch_lines
+        self.batch_interval = batch_interval
+        self.viewers = set()
+        self.loop = None
+        self._incoming = []
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """绑定事件循环 (在应用启动时调用)"""
+        self.loop = loop
+
+    def post(self, line: str):
+        """
+        发布一行日志 (可在任意线程中调用, 不会阻塞)
+        :param line: 日志行 (包含换行符)
+        """
+        with self._lock:
+            self._incoming.append(line)
+            if self._scheduled or self.loop is None:
+                return
+            self._scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _drain(self):
+        with self._lock:
+            lines, self._incoming = self._incoming, []
+            self._scheduled = False
+        if not lines:
+            return
+        self.backlog.extend(lines)
+        for viewer in self.viewers:
+            viewer.push(lines)
+
+    async def _send_loop(self, viewer: LogViewer):
+        try:
+            while True:
+                await viewer.event.wait()
+                await asyncio.sleep(self.batch_interval)
+                while viewer.pending:
+                    await viewer.websocket.send_text(viewer.take(self.batch_lines))
+        except Exception:
+            # 连接已断开
+            return
+
+    async def serve(self, websocket):
+        """
+        为一个已接受的 WebSocket 连接发送日志, 直到连接断开
+        :param websocket: FastAPI WebSocket
+        """
+        viewer = LogViewer(websocket, self.viewer_max_pending)
+        viewer.push(list(self.backlog))
+        self.viewers.add(viewer)
+        logger.info(f"Log client connected. Total clients: {len(self.viewers)}")
+        sender = asyncio.create_task(self._send_loop(viewer))
+        receiver = asyncio.create_task(self._wait_closed(websocket))
+        try:
+            await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            receiver.cancel()
+            self.viewers.discard(viewer)
+            logger.info(f"Log client removed (dropped {viewer.dropped} lines). Total clients: {len(self.viewers)}")
+
+    @staticmethod
+    async def _wait_closed(websocket):
+        # 浏览器不会发送数据, 收到断开消息时退出
+        try:
+            while True:
+                message = await websocket.receive()
+                if message.get("type") == "websocket.disconnect":
+                    return
+        except Exception:
+            return
+
+    async def close_all(self, code: int = 1001, reason: str = ""):
+        """关闭所有查看者的连接"""
+        for viewer in list(self.viewers):
+            try:
+                await viewer.websocket.close(code=code, reason=reason)
+            except Exception:
+                pass  # 客户端可能已经断开
+
+    def stats(self) -> dict:
+        return {
+            "viewers": len(self.viewers),
+            "backlog": len(self.backlog),
+            "dropped": sum(v.dropped for v in self.viewers),
+        }
@@ -0,0 +1,405 @@
+import bisect
+import gzip
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import sys
+sys.path.append("..")
+from tools.logger import _LOG_FILE_RE
+
+# 每隔多少字节记录一条索引 (时间 -> 偏移)
+INDEX_STEP = 64 * 1024
+# 索引旁路文件: 文件头 (标识, inode, 已索引到的位置) + 若干条 (时间, 偏移)
+_HEADER = struct.Struct("<4sQQ")
+_ENTRY = struct.Struct("<19sQ")
+_MAGIC = b"LIX1"
+
+# 一条日志的开头: 文本格式 [2024-01-01 12:00:00][INFO][会话:轮次] 或 JSON 格式 {"ts": "2024-01-01T12:00:00.000", "level": "INFO"
+_RECORD_RE = re.compile(rb'\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\]\[([A-Z]+)\]'
+                        rb'|\{"ts": "(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)[^"]*", "level": "([A-Z]+)"')
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+
+def _parse_header(buf, pos: int):
+    """解析 pos 处的日志开头, 返回 (时间, 级别), 不是日志开头 (例如异常堆栈的后续行) 时返回 None"""
+    m = _RECORD_RE.match(buf, pos)
+    if m is None:
+        return None
+    if m.group(1):
+        return m.group(1), m.group(2)
+    return m.group(3).replace(b"T", b" "), m.group(4)
+
+
+def _time_key(value: datetime) -> bytes:
+    # 两种格式统一为 "YYYY-MM-DD HH:MM:SS", 按字节比较即可比较时间
+    return value.strftime("%Y-%m-%d %H:%M:%S").encode()
+
+
+def _sample_entries(buf, pos: int, size: int, step: int):
+    """
+    从 pos 开始每隔 step 字节取一条完整日志的 (时间, 偏移)
+    :return: (新的索引条目, 下次继续的位置)
+    """
+    entries = []
+    while pos < size:
+        line = 0 if pos == 0 else buf.find(b"\n", pos - 1, size) + 1
+        if line == 0 and pos > 0:
+            break
+        found = None
+        while line < size:
+            end = buf.find(b"\n", line, size)
+            if end < 0:
+                break  # 最后一行还没写完, 下次再索引
+            header = _parse_header(buf, line)
+            if header is not None:
+                found = (header[0], line)
+                break
+            line = end + 1
+        if found is None:
+            break
+        entries.append(found)
+        pos = found[1] + step
+    return entries, pos
+
+
+def _last_entry(buf, size: int):
+    """文件中最后一条日志的 (时间, 偏移)"""
+    pos = size
+    while pos > 0:
+        line = buf.rfind(b"\n", 0, pos - 1) + 1
+        header = _parse_header(buf, line)
+        if header is not None:
+            return header[0], line
+        pos = line
+    return None
+
+
+class _Literals:
+    """
+    查找多个固定字符串中最先出现的一个 (级别标记、会话 ID、关键字)
+    - bytes.find / mmap.find 比多分支的正则快得多
+    - 记住每个字符串在当前缓冲区中下一次出现的位置, 向后查找时不重复扫描
+    """
+
+    def __init__(self, literals):
+        """
+        :param literals: 要查找的字符串 (bytes) 列表
+        """
+        self.literals = list(dict.fromkeys(literals))
+        self._buf = None
+        self._end = None
+        self._next = {}
+
+    def search(self, buf, pos: int, end: int):
+        """
+        :return: 在 [pos, end) 中最先出现的位置 (开始, 结束), 没有时返回 None
+        """
+        if buf is not self._buf or end != self._end:
+            self._buf, self._end, self._next = buf, end, {}
+        best = None
+        for literal in self.literals:
+            found = self._next.get(literal)
+            if found is None or 0 <= found < pos:
+                found = self._next[literal] = buf.find(literal, pos, end)
+            if found >= 0 and (best is None or found < best[0]):
+                best = (found, found + len(literal))
+        return best
+
+
+class LogIndex:
+    """
+    单个日志文件的稀疏索引, 保存在旁路文件中
+    - 每 INDEX_STEP 字节记录一条 (时间, 偏移), 建立时只需解析少量日志行, 不需要读取整个文件
+    - 正在写入的文件每次查询时只补充新增部分; 文件被切分改名后 (inode 变化) 重新建立
+    - 压缩归档不会再变化, 额外记录最后一条日志的时间, 查询范围外的归档无需解压
+    """
+
+    def __init__(self, index_path: str):
+        """
+        :param index_path: 旁路索引文件路径
+        """
+        self.index_path = index_path
+        self.inode = None
+        self.indexed = 0
+        self.keys = []
+        self.offsets = []
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if len(data) < _HEADER.size:
+            return
+        magic, inode, indexed = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            return
+        body = data[_HEADER.size:]
+        body = body[:len(body) - len(body) % _ENTRY.size]
+        for key, offset in _ENTRY.iter_unpack(body):
+            self.keys.append(key)
+            self.offsets.append(offset)
+        self.inode = inode
+        self.indexed = indexed
+
+    def _save(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, self.inode, self.indexed))
+            f.write(b"".join(_ENTRY.pack(key, offset) for key, offset in zip(self.keys, self.offsets)))
+        os.replace(tmp, self.index_path)
+
+    def update(self, buf, size: int, inode: int, final: bool = False):
+        """
+        把文件新增的部分加入索引
+        :param buf: 文件内容 (mmap 或 bytes)
+        :param size: 文件长度
+        :param inode: 文件的 inode, 用于识别切分后的新文件
+        :param final: 文件不会再变化 (压缩归档), 记录到文件末尾
+        """
+        if inode != self.inode or size < self.indexed:
+            self.inode, self.indexed, self.keys, self.offsets = inode, 0, [], []
+        if self.indexed >= size:
+            return
+        entries, self.indexed = _sample_entries(buf, self.indexed, size, INDEX_STEP)
+        if final:
+            last = _last_entry(buf, size)
+            if last is not None and (not entries or last[1] > entries[-1][1]):
+                entries.append(last)
+            self.indexed = size
+        for key, offset in entries:
+            self.keys.append(key)
+            self.offsets.append(offset)
+        try:
+            self._save()
+        except OSError:
+            pass  # 索引只是加速, 写入失败时下次重新建立
+
+    def range(self, start_key: bytes, end_key: bytes, size: int):
+        """
+        返回可能包含 [start_key, end_key] 内日志的字节范围
+        多线程写入时相邻日志的时间可能略有先后, 两端各多留一条索引的余量
+        """
+        lo, hi = 0, size
+        if start_key is not None:
+            i = bisect.bisect_left(self.keys, start_key) - 2
+            if i >= 0:
+                lo = self.offsets[i]
+        if end_key is not None:
+            j = bisect.bisect_right(self.keys, end_key) + 1
+            if j < len(self.offsets):
+                hi = self.offsets[j]
+        return lo, hi
+
+
+class LogSearch:
+    """
+    按时间范围、级别、会话 ID 和关键字搜索历史日志 (包括已压缩的归档)
+    - 按文件名中的日期和稀疏索引确定需要读取的字节范围
+    - 未压缩的文件通过 mmap 读取, 在整个范围内查找固定字符串确定候选位置, 只有命中的日志才会解码
+    - 归档解压后的内容按 LRU 缓存 (总大小不超过 archive_cache_bytes), 重复查询同一时间段时不再解压
+    - 结果按时间顺序逐条产生, 调用方可以边查边返回
+    """
+
+    def __init__(self, log_dir: str, prefix: str = "assistant", archive_cache_bytes: int = 256 * 1024 * 1024):
+        """
+        :param log_dir: 日志目录
+        :param prefix: 日志文件前缀
+        :param archive_cache_bytes: 解压后归档的缓存上限 (字节), <= 0 表示不缓存
+        """
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.index_dir = os.path.join(log_dir, ".index")
+        self.archive_cache_bytes = archive_cache_bytes
+        self._archives = OrderedDict()  # (路径, inode): 解压后的内容, 最近使用的在最后
+        self._archive_size = 0
+        self._archive_lock = threading.Lock()  # 搜索在线程池中执行, 可能同时进行
+
+    def _files(self, start: datetime, end: datetime):
+        """按时间顺序列出日期在查询范围内的日志文件, 同时删除已不存在的文件的索引"""
+        first = start.strftime("%Y%m%d") if start else None
+        last = end.strftime("%Y%m%d") if end else None
+        files = []
+        names = set()
+        for entry in os.scandir(self.log_dir):
+            match = _LOG_FILE_RE.match(entry.name)
+            if not match or match.group("prefix") != self.prefix:
+                continue
+            names.add(entry.name)
+            date = match.group("date")
+            if (first and date < first) or (last and date > last):
+                continue
+            # 同一天中带序号的文件更早, 不带序号的是当天最后一个文件
+            index = int(match.group("index")) if match.group("index") else float("inf")
+            files.append((date, index, entry.path, bool(match.group("gz"))))
+        if os.path.isdir(self.index_dir):
+            for entry in os.scandir(self.index_dir):
+                if entry.name.endswith(".idx") and entry.name[:-4] not in names:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        files.sort()
+        return [(path, gz) for _, _, path, gz in files]
+
+    @staticmethod
+    def _pattern(level: str, session: str, text: str) -> _Literals:
+        """候选位置: 优先使用最有区分度的条件, 都是固定字符串"""
+        if text:
+            # JSON 格式中引号、反斜杠等会被转义
+            return _Literals([text.encode(), json.dumps(text, ensure_ascii=False)[1:-1].encode()])
+        if session:
+            return _Literals([session.encode()])
+        # 每个级别在两种格式中的标记: ][ERROR] 和 "level": "ERROR"
+        names = [name.encode() for name, value in LEVELS.items() if value >= LEVELS.get(level, 0)]
+        return _Literals([b"][" + name + b"]" for name in names] + [b'"level": "' + name + b'"' for name in names])
+
+    @staticmethod
+    def _record_bounds(buf, pos: int, lo: int, hi: int):
+        """pos 所在日志的起止位置 (异常堆栈等多行内容属于前一条日志)"""
+        start = max(buf.rfind(b"\n", lo, pos) + 1, lo)
+        while start > lo and _parse_header(buf, start) is None:
+            start = max(buf.rfind(b"\n", lo, start - 1) + 1, lo)
+        end = buf.find(b"\n", pos, hi)
+        while 0 <= end < hi - 1 and _parse_header(buf, end + 1) is None:
+            end = buf.find(b"\n", end + 1, hi)
+        return start, (hi if end < 0 else end + 1)
+
+    def _search_buffer(self, buf, lo: int, hi: int, pattern, start_key, end_key, min_level, session, variants):
+        pos = lo
+        while pos < hi:
+            found = pattern.search(buf, pos, hi)
+            if found is None:
+                return
+            record_start, record_end = self._record_bounds(buf, found[0], lo, hi)
+            pos = max(record_end, found[1])
+            header = _parse_header(buf, record_start)
+            if header is None:
+                continue
+            key, level = header
+            if start_key is not None and key < start_key:
+                continue
+            if end_key is not None and key > end_key:
+                # 索引两端留有余量, 超出结束时间后还可能有少量更早的日志
+                continue
+            if LEVELS.get(level.decode(), 0) < min_level:
+                continue
+            record = buf[record_start:record_end]
+            if session and session not in record:
+                continue
+            if variants and not any(v in record for v in variants):
+                continue
+            yield record_start, key, level, record
+
+    def _index_for(self, path: str) -> LogIndex:
+        os.makedirs(self.index_dir, exist_ok=True)
+        return LogIndex(os.path.join(self.index_dir, os.path.basename(path) + ".idx"))
+
+    def search(self, start: datetime = None, end: datetime = None, level: str = None, session: str = None,
+               text: str = None, limit: int = 1000):
+        """
+        搜索日志, 逐条产生结果, 最后产生一条统计信息
+        :param start: 开始时间 (包含)
+        :param end: 结束时间 (包含)
+        :param level: 最低级别, 例如 WARNING
+        :param session: 会话 ID (文本格式中为级别后的 [会话:轮次], 按关键字匹配)
+        :param text: 关键字 (区分大小写)
+        :param limit: 最多返回的条数
+        """
+        began = time.perf_counter()
+        level = level.upper() if level else None
+        start_key = _time_key(start) if start else None
+        end_key = _time_key(end) if end else None
+        min_level = LEVELS.get(level, 0)
+        pattern = self._pattern(level, session, text)
+        session_bytes = session.encode() if session else None
+        variants = [text.encode(), json.dumps(text, ensure_ascii=False)[1:-1].encode()] if text else None
+        matched = 0
+        scanned = 0
+        for path, gz in self._files(start, end):
+            results = self._scan_file(path, gz, start_key, end_key, min_level, pattern, session_bytes, variants)
+            if results is None:
+                continue
+            scanned += 1
+            try:
+                for offset, key, record_level, record in results:
+                    yield {
+                        "file": os.path.basename(path),
+                        "offset": offset,
+                        "time": key.decode(),
+                        "level": record_level.decode(),
+                        "line": record.decode("utf-8", errors="replace").rstrip("\r\n"),
+                    }
+                    matched += 1
+                    if matched >= limit:
+                        break
+            finally:
+                results.close()  # 关闭 mmap
+            if matched >= limit:
+                break
+        yield {
+            "done": True,
+            "matched": matched,
+            "truncated": matched >= limit,
+            "files": scanned,
+            "elapsed_ms": round((time.perf_counter() - began) * 1000, 1),
+        }
+
+    def _scan_file(self, path: str, gz: bool, start_key, end_key, min_level, pattern, session, variants):
+        """在一个文件中查找, 返回结果生成器; 文件为空或不在查询范围内时返回 None"""
+        stat = os.stat(path)
+        if stat.st_size == 0:
+            return None
+        index = self._index_for(path)
+        if gz:
+            # 归档只建立一次索引 (记录到最后一条日志), 时间范围不重叠时无需解压
+            indexed = index.inode == stat.st_ino and index.indexed > 0
+            if indexed and index.keys and ((end_key is not None and index.keys[0] > end_key) or
+                                           (start_key is not None and index.keys[-1] < start_key)):
+                return None
+            return self._scan_archive(path, stat.st_ino, index, indexed, start_key, end_key, min_level, pattern,
+                                      session, variants)
+        return self._scan_mapped(path, stat.st_ino, index, start_key, end_key, min_level, pattern, session, variants)
+
+    def _scan_mapped(self, path, inode, index, start_key, end_key, min_level, pattern, session, variants):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            size = len(buf)
+            index.update(buf, size, inode)
+            lo, hi = index.range(start_key, end_key, size)
+            yield from self._search_buffer(buf, lo, hi, pattern, start_key, end_key, min_level, session, variants)
+
+    def _read_archive(self, path: str, inode: int) -> bytes:
+        """解压归档 (gzip 无法随机访问), 归档不会再变化, 解压结果放入缓存"""
+        key = (path, inode)
+        with self._archive_lock:
+            buf = self._archives.get(key)
+            if buf is not None:
+                self._archives.move_to_end(key)
+                return buf
+        with gzip.open(path, "rb") as f:
+            buf = f.read()
+        if len(buf) <= self.archive_cache_bytes:
+            with self._archive_lock:
+                if key not in self._archives:
+                    self._archives[key] = buf
+                    self._archive_size += len(buf)
+                while self._archive_size > self.archive_cache_bytes:
+                    _, evicted = self._archives.popitem(last=False)
+                    self._archive_size -= len(evicted)
+        return buf
+
+    def _scan_archive(self, path, inode, index, indexed, start_key, end_key, min_level, pattern, session, variants):
+        # 解压到内存后按同样的方式查找
+        buf = self._read_archive(path, inode)
+        if not indexed:
+            index.update(buf, len(buf), inode, final=True)
+        lo, hi = index.range(start_key, end_key, len(buf))
+        yield from self._search_buffer(buf, lo, hi, pattern, start_key, end_key, min_level, session, variants)
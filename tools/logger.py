@@ -1,9 +1,328 @@
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
 import sys
 sys.path.append("..")
 
+# 当前会话和轮次, 由 ServiceManager 更新, 写入每条日志 (单设备, 进程内共享即可)
+_log_context = {"session": None, "turn": None}
+
+
+def set_log_context(**kwargs):
+    """
+    更新日志上下文, 例如 set_log_context(session="ab12cd34", turn=3)
+    :param kwargs: session / turn
+    """
+    _log_context.update(kwargs)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON, 包含时间、级别、模块、会话和轮次"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "module": record.module,
+            "msg": record.getMessage(),
+        }
+        session = getattr(record, "session", None)
+        if session is not None:
+            data["session"] = session
+        turn = getattr(record, "turn", None)
+        if turn is not None:
+            data["turn"] = turn
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式: [时间][级别][会话:轮次] 消息, 没有会话时省略会话部分 (历史日志搜索按会话过滤时使用)"""
+
+    def __init__(self):
+        super().__init__("[%(asctime)s][%(levelname)s]%(context)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        session = getattr(record, "session", None)
+        turn = getattr(record, "turn", None)
+        if session is None:
+            record.context = ""
+        elif turn is None:
+            record.context = f"[{session}]"
+        else:
+            record.context = f"[{session}:{turn}]"
+        return super().format(record)
+
+
+class ModuleThrottle(logging.Filter):
+    """
+    按模块限制 INFO 及以下级别日志的输出量, WARNING 及以上不受影响
+    - rate_limits: {模块名: 每秒最多输出的行数}, 令牌桶, 超出的行丢弃, 下一条输出的日志注明丢弃数
+    - sample_every: {模块名: N}, 每 N 行只输出 1 行
+    - 在调用线程中执行, 只做字典查找和计数, 不加锁 (计数在多线程下是近似的)
+    """
+
+    def __init__(self, rate_limits: dict = None, sample_every: dict = None):
+        super().__init__()
+        self.configure(rate_limits, sample_every)
+
+    def configure(self, rate_limits: dict = None, sample_every: dict = None):
+        self.rate_limits = dict(rate_limits or {})
+        self.sample_every = {module: int(n) for module, n in (sample_every or {}).items() if int(n) > 1}
+        self._buckets = {}     # 模块名: [令牌数, 上次补充时间]
+        self._seen = {}        # 模块名: 已看到的行数 (采样用)
+        self.suppressed = {}   # 模块名: 丢弃的行数
+
+    def _suppress(self, module: str) -> bool:
+        self.suppressed[module] = self.suppressed.get(module, 0) + 1
+        return False
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        module = record.module
+        every = self.sample_every.get(module)
+        if every:
+            seen = self._seen.get(module, 0)
+            self._seen[module] = seen + 1
+            if seen % every:
+                return self._suppress(module)
+        rate = self.rate_limits.get(module)
+        if rate:
+            now = time.monotonic()
+            bucket = self._buckets.get(module)
+            if bucket is None:
+                bucket = self._buckets[module] = [rate, now]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return self._suppress(module)
+            bucket[0] -= 1
+        if rate and self.suppressed.get(module):
+            record.suppressed = self.suppressed.pop(module)
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    把日志记录放入有界队列, 由 QueueListener 在后台线程格式化和写入
+    - 队列满时直接丢弃并计数, 不会阻塞调用线程 (音频路径)
+    - 在调用线程中只补充会话/轮次信息, 不做格式化 (记录在同一进程内传递, 无需序列化)
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.session = _log_context["session"]
+        record.turn = _log_context["turn"]
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            record.msg = f"{record.msg} (同模块另有 {suppressed} 行被限流丢弃)"
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# 日志文件名: 前缀_日期.log, 按大小切分出的文件为 前缀_日期.序号.log, 归档后追加 .gz
+_LOG_FILE_RE = re.compile(r"^(?P<prefix>[a-z][a-z_]*)_(?P<date>\d{8})(?:\.(?P<index>\d+))?\.log(?P<gz>\.gz)?$")
+
+
+class LogArchiver:
+    """
+    日志归档线程: 压缩已切分的日志文件, 按保留数量删除最旧的归档
+    - 压缩在独立线程中进行, 不占用日志写入线程
+    - 每次整理时处理目录下所有前缀为 prefixes 的日志 (包括 tracing 的 trace_YYYYMMDD.log):
+      带序号或日期早于今天的 .log 文件会被压缩, 每个前缀只保留最新的 backup_count 个归档
+    - 每个前缀只由一种进程整理 (主服务: assistant/trace, 配置 UI: config_ui);
+      蓝绿重启时新旧主服务会短暂同时写入, 所以最近 quiet_seconds 内还有写入的文件先不压缩, 稍后再整理
+    """
+
+    def __init__(self, log_dir: str, prefixes=("assistant", "trace"), backup_count: int = 30, compress: bool = True,
+                 quiet_seconds: float = 60):
+        """
+        :param log_dir: 日志目录
+        :param prefixes: 需要整理的日志文件前缀
+        :param backup_count: 每个前缀保留的归档数量, <= 0 表示不删除
+        :param compress: 是否压缩归档
+        :param quiet_seconds: 文件在这段时间内没有写入, 才认为已经没有进程在写
+        """
+        self.log_dir = log_dir
+        self.prefixes = tuple(prefixes)
+        self.backup_count = backup_count
+        self.compress = compress
+        self.quiet_seconds = quiet_seconds
+        self._event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-archiver", daemon=True)
+        self._thread.start()
+
+    def schedule(self):
+        """请求整理一次 (多次请求会合并)"""
+        self._event.set()
+
+    def _run(self):
+        retry = False
+        while True:
+            # 有文件因为最近还在写入而跳过时, 过一段时间再整理一次
+            self._event.wait(self.quiet_seconds if retry else None)
+            self._event.clear()
+            try:
+                retry = self.sweep()
+            except Exception as e:
+                # 这里不能使用 logger, 避免与日志写入线程相互等待
+                print(f"[LogArchiver] 整理日志失败: {e}", file=sys.stderr)
+
+    def sweep(self) -> bool:
+        """
+        整理一次日志目录
+        :return: 是否有文件因为最近还在写入而没有压缩
+        """
+        today = datetime.now().strftime('%Y%m%d')
+        archives = {prefix: [] for prefix in self.prefixes}
+        skipped = False
+        for entry in os.scandir(self.log_dir):
+            match = _LOG_FILE_RE.match(entry.name)
+            if not match or match.group("prefix") not in archives:
+                continue
+            if not match.group("index") and match.group("date") >= today:
+                continue  # 正在写入的文件
+            path = entry.path
+            if self.compress and not match.group("gz"):
+                try:
+                    if time.time() - entry.stat().st_mtime < self.quiet_seconds:
+                        skipped = True  # 可能还有进程没有切换到新文件
+                        continue
+                    path = self._compress(path)
+                except FileNotFoundError:
+                    continue  # 另一个进程已经处理了这个文件
+            # 同一天中带序号的文件更早, 不带序号的是当天最后一个文件
+            index = int(match.group("index")) if match.group("index") else float("inf")
+            archives[match.group("prefix")].append((match.group("date"), index, path))
+        if self.backup_count > 0:
+            for files in archives.values():
+                files.sort()
+                for _, _, path in files[:-self.backup_count]:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        return skipped
+
+    @staticmethod
+    def _compress(path: str) -> str:
+        target = path + ".gz"
+        tmp_path = f"{target}.{os.getpid()}.tmp"  # 蓝绿重启时两个主服务可能同时整理
+        try:
+            with open(path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, target)
+            os.remove(path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return target
+
+
+class DailyRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    按天和大小切分的日志文件, 在 QueueListener 的后台线程中写入和切分
+    - 当前文件为 前缀_YYYYMMDD.log, 跨天后切换到新日期的文件
+    - 超过 max_bytes 时, 当前文件改名为 前缀_YYYYMMDD.序号.log 后重新打开
+    - 切分后通知 LogArchiver 在另一个线程中压缩和清理
+    - 写入前检查当前文件是否已被另一个进程改名 (蓝绿重启时新旧主服务短暂共用同一个文件), 是则重新打开, 不再写入旧文件
+    """
+
+    def __init__(self, log_dir: str, prefix: str = "assistant", max_bytes: int = 0, archiver: LogArchiver = None):
+        """
+        :param log_dir: 日志目录
+        :param prefix: 文件名前缀
+        :param max_bytes: 单个文件的大小上限, <= 0 表示只按天切分
+        :param archiver: 归档线程
+        """
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.archiver = archiver
+        self._date = None
+        self._next_day_at = 0
+        super().__init__(self._path_for(self._update_date()), "a", encoding="utf-8", delay=False)
+
+    def _update_date(self) -> str:
+        now = datetime.now()
+        self._date = now.strftime('%Y%m%d')
+        self._next_day_at = (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+        return self._date
+
+    def _path_for(self, date: str, index: int = None) -> str:
+        name = f"{self.prefix}_{date}.log" if index is None else f"{self.prefix}_{date}.{index}.log"
+        return os.path.abspath(os.path.join(self.log_dir, name))
+
+    def _next_index(self) -> int:
+        pattern = re.compile(rf"^{re.escape(self.prefix)}_{self._date}\.(\d+)\.log(\.gz)?$")
+        indexes = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.log_dir)) if m]
+        return max(indexes, default=0) + 1
+
+    def _moved(self) -> bool:
+        """当前打开的文件是否已经不是 baseFilename (被其他进程切分改名)"""
+        if self.stream is None:
+            return False
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self.stream.fileno())
+        return (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self._moved():
+                self.stream.close()
+                self.stream = self._open()
+        except Exception:
+            self.handleError(record)
+            return
+        super().emit(record)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if record.created >= self._next_day_at:
+            return True
+        return self.max_bytes > 0 and self.stream is not None and self.stream.tell() >= self.max_bytes
+
+    def doRollover(self):
+        moved = self._moved()
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if time.time() >= self._next_day_at:
+            # 跨天: 旧文件原样保留 (由归档线程压缩), 切换到新日期的文件
+            self._update_date()
+        elif not moved:
+            # 已被其他进程切分时只需重新打开
+            try:
+                os.replace(self.baseFilename, self._path_for(self._date, self._next_index()))
+            except FileNotFoundError:
+                pass
+        self.baseFilename = self._path_for(self._date)
+        self.stream = self._open()
+        if self.archiver is not None:
+            self.archiver.schedule()
+
+
 class Logger:
     """
     日志记录器类，基于 Python 标准 logging 模块封装
@@ -11,10 +330,14 @@ class Logger:
     - 支持多级日志（DEBUG/INFO/ERROR）
     - 自动创建日志目录
     - 支持控制台+文件双输出
-    - 可通过 settings 配置日志级别和输出路径
+    - 调用线程只把记录放入队列, 格式化和磁盘 I/O 在后台线程进行, 队列满时丢弃
+    - 文本格式和可选的 JSON 行格式都包含会话和轮次, 可按模块限流或采样
+    - 日志文件按天和大小切分, 旧文件压缩归档并按数量清理
+    - 文件名前缀由环境变量 LOG_FILE_PREFIX 指定 (默认 assistant), 每种进程只切分和归档自己前缀的文件
+    - 日志格式和限流可通过环境变量 LOG_FORMAT 或 configure (读取 settings) 配置
     """
 
-    def __init__(self, name="assistant", level=logging.INFO):
+    def __init__(self, name="assistant", level=logging.INFO, queue_size: int = 10000):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
 
@@ -23,42 +346,105 @@ class Logger:
 
         # 创建日志目录（如果不存在）
         # 注意：这里不再依赖 global_settings，避免循环导入
-        log_dir = os.environ.get("LOG_DIR", "./logs")
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-        # 设置日志格式
-        formatter = logging.Formatter(
-            "[%(asctime)s][%(levelname)s] %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S"
-        )
+        self.log_dir = os.environ.get("LOG_DIR", "./logs")
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
 
         # 控制台输出
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
-
-        # 文件输出（按天分割）
-        file_handler = logging.FileHandler(
-            filename=os.path.join(log_dir, f"assistant_{datetime.now().strftime('%Y%m%d')}.log"),
-            encoding="utf-8"
-        )
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        self.console_handler = logging.StreamHandler()
+
+        # 文件输出（按天和大小切分, 旧文件在归档线程中压缩和清理）
+        # 主服务写 assistant_*.log 并整理 tracing 的 trace_*.log; 配置 UI 使用 config_ui 前缀, 不碰主服务的文件
+        self.file_prefix = os.environ.get("LOG_FILE_PREFIX", "assistant")
+        prefixes = (self.file_prefix, "trace") if self.file_prefix == "assistant" else (self.file_prefix,)
+        self.archiver = LogArchiver(self.log_dir, prefixes=prefixes,
+                                    backup_count=int(os.environ.get("LOG_BACKUP_COUNT", "30")),
+                                    compress=os.environ.get("LOG_COMPRESS", "1") != "0")
+        self.file_handler = DailyRotatingFileHandler(self.log_dir, self.file_prefix,
+                                                     max_bytes=int(os.environ.get("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+                                                     archiver=self.archiver)
+        self.archiver.schedule()  # 整理上次运行留下的文件
+        self.set_format(os.environ.get("LOG_FORMAT", "text"))
+
+        # 调用线程 -> 队列 -> 后台线程 (控制台 + 文件)
+        self.queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        self.throttle = ModuleThrottle()
+        self.queue_handler.addFilter(self.throttle)
+        self.logger.addHandler(self.queue_handler)
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, self.console_handler, self.file_handler,
+                                                       respect_handler_level=True)
+        self.listener.start()
+        self._stopped = False
+        atexit.register(self.stop)
+
+    def set_format(self, fmt: str):
+        """
+        设置输出格式
+        :param fmt: text (默认) / json
+        """
+        if fmt == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = TextFormatter()
+        self.console_handler.setFormatter(formatter)
+        self.file_handler.setFormatter(formatter)
+
+    def configure(self, fmt: str = None, level: str = None, rate_limits: dict = None, sample_every: dict = None,
+                  max_bytes: int = None, backup_count: int = None, compress: bool = None):
+        """
+        加载配置后调整日志输出
+        :param fmt: 输出格式 text / json
+        :param level: 日志级别, 例如 INFO / DEBUG
+        :param rate_limits: {模块名: 每秒最多输出的 INFO/DEBUG 行数}
+        :param sample_every: {模块名: N}, 每 N 行 INFO/DEBUG 日志只输出 1 行
+        :param max_bytes: 单个日志文件的大小上限 (字节), <= 0 表示只按天切分
+        :param backup_count: 保留的归档文件数量
+        :param compress: 是否压缩归档
+        """
+        if fmt:
+            self.set_format(fmt)
+        if level:
+            self.logger.setLevel(level.upper())
+        self.throttle.configure(rate_limits, sample_every)
+        if max_bytes is not None:
+            self.file_handler.max_bytes = max_bytes
+        if backup_count is not None:
+            self.archiver.backup_count = backup_count
+        if compress is not None:
+            self.archiver.compress = compress
+        if backup_count is not None or compress is not None:
+            self.archiver.schedule()
+
+    def stop(self):
+        """停止后台线程, 写完队列中剩余的日志"""
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+    @property
+    def dropped(self) -> int:
+        """队列满而丢弃的日志条数"""
+        return self.queue_handler.dropped
 
+    # stacklevel=2: 记录实际调用方的模块和行号, 而不是本文件
     def debug(self, msg: str, *args, **kwargs):
+        kwargs.setdefault("stacklevel", 2)
         self.logger.debug(msg, *args, **kwargs)
 
     def info(self, msg: str, *args, **kwargs):
+        kwargs.setdefault("stacklevel", 2)
         self.logger.info(msg, *args, **kwargs)
 
     def warning(self, msg: str, *args, **kwargs):
+        kwargs.setdefault("stacklevel", 2)
         self.logger.warning(msg, *args, **kwargs)
 
     def error(self, msg: str, *args, **kwargs):
+        kwargs.setdefault("stacklevel", 2)
         self.logger.error(msg, *args, **kwargs)
 
     def critical(self, msg: str, *args, **kwargs):
+        kwargs.setdefault("stacklevel", 2)
         self.logger.critical(msg, *args, **kwargs)
 
 
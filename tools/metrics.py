@@ -0,0 +1,400 @@
+import asyncio
+import json
+import threading
+import time
+import sys
+sys.path.append("..")
+from tools.logger import logger
+from tools.stats import Histogram, DEFAULT_LATENCY_BUCKETS_MS
+
+# 耗时较短的操作 (Opus 编解码、VAD 单帧推理) 使用的桶上界 (毫秒)
+FAST_LATENCY_BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 3, 5, 10, 20, 50, 100)
+# 实时率 (推理耗时 / 音频时长) 的桶上界
+RTF_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+
+class _PerThread:
+    """
+    按线程分片的数据: 每个线程只写自己的分片, 读取时汇总所有分片
+    - 写入路径不加锁, 只有线程第一次写入时登记分片需要加锁
+    - 已结束线程的分片在读取时并入 retired, 避免短生命周期线程导致分片无限增长
+    """
+
+    def __init__(self, factory, merge):
+        """
+        :param factory: 创建空分片的函数
+        :param merge: merge(目标分片, 源分片), 把源分片累加到目标分片
+        """
+        self._factory = factory
+        self._merge = merge
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells = []  # [(线程, 分片)]
+        self._retired = factory()
+
+    def cell(self):
+        """当前线程的分片"""
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = self._factory()
+            with self._lock:
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def collect(self):
+        """
+        汇总所有分片 (读取期间其他线程可能仍在写入, 结果为近似的瞬时值)
+        :return: 汇总后的新分片
+        """
+        total = self._factory()
+        with self._lock:
+            alive = []
+            for thread, cell in self._cells:
+                if thread.is_alive():
+                    alive.append((thread, cell))
+                else:
+                    self._merge(self._retired, cell)
+            self._cells = alive
+            self._merge(total, self._retired)
+            cells = [cell for _, cell in alive]
+        for cell in cells:
+            self._merge(total, cell)
+        return total
+
+
+def _merge_counter(target, source):
+    target[0] += source[0]
+
+
+def _merge_histogram(target, source):
+    target.merge(source)
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return "NaN"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    """只增计数器, 按线程分片累加"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._shards = _PerThread(lambda: [0], _merge_counter)
+
+    def inc(self, value=1):
+        """
+        增加计数
+        :param value: 增量
+        """
+        self._shards.cell()[0] += value
+
+    @property
+    def value(self):
+        return self._shards.collect()[0]
+
+    def samples(self):
+        return [(self.name, {}, self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """
+    瞬时值
+    - set/inc/dec 适用于单线程 (例如事件循环) 中修改的值
+    - 也可以传入 fn, 在读取时计算; fn 返回数值, 或在指定 label 时返回 {标签值: 数值}
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn=None, label: str = None):
+        """
+        :param name: 指标名
+        :param help: 说明
+        :param fn: 读取时调用的函数
+        :param label: fn 返回字典时使用的标签名
+        """
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, value=1):
+        self._value += value
+
+    def dec(self, value=1):
+        self._value -= value
+
+    def set_function(self, fn, label: str = None):
+        """
+        设置读取时调用的函数 (会替换之前的函数)
+        :param fn: 函数
+        :param label: fn 返回字典时使用的标签名
+        """
+        self.fn = fn
+        self.label = label
+
+    def _read(self):
+        if self.fn is None:
+            return self._value
+        try:
+            return self.fn()
+        except Exception as e:
+            logger.warning(f"读取指标 {self.name} 失败: {e}")
+            return None
+
+    def samples(self):
+        value = self._read()
+        if isinstance(value, dict):
+            return [(self.name, {self.label or "name": key}, v) for key, v in value.items()]
+        return [(self.name, {}, value)]
+
+    def snapshot(self):
+        value = self._read()
+        return dict(value) if isinstance(value, dict) else value
+
+
+class MetricHistogram:
+    """固定桶直方图指标, 按线程分片记录 (复用 tools.stats.Histogram)"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_LATENCY_BUCKETS_MS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._shards = _PerThread(lambda: Histogram(self.buckets), _merge_histogram)
+
+    def observe(self, value):
+        """
+        记录一个样本
+        :param value: 样本值
+        """
+        self._shards.cell().observe(value)
+
+    def collect(self) -> Histogram:
+        """汇总后的直方图"""
+        return self._shards.collect()
+
+    def samples(self):
+        hist = self.collect()
+        samples = []
+        cumulative = 0
+        for bound, c in zip(self.buckets, hist.counts):
+            cumulative += c
+            samples.append((self.name + "_bucket", {"le": _format_value(float(bound))}, cumulative))
+        samples.append((self.name + "_bucket", {"le": "+Inf"}, hist.count))
+        samples.append((self.name + "_sum", {}, round(hist.sum, 3)))
+        samples.append((self.name + "_count", {}, hist.count))
+        return samples
+
+    def snapshot(self):
+        return self.collect().snapshot()
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+    - counter/gauge/histogram 按名称获取或创建, 可在各模块的导入阶段定义指标
+    - render 输出 Prometheus 文本格式, snapshot 输出紧凑的字典
+    """
+
+    def __init__(self, prefix: str = "aichat_"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.type}")
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str, fn=None, label: str = None) -> Gauge:
+        return self._get_or_create(Gauge, name, help, fn, label)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_LATENCY_BUCKETS_MS) -> MetricHistogram:
+        return self._get_or_create(MetricHistogram, name, help, buckets)
+
+    def get(self, name: str):
+        """
+        按名称获取已注册的指标
+        :param name: 指标名 (不含前缀)
+        :return: 指标, 未注册时返回 None
+        """
+        return self._metrics.get(self.prefix + name)
+
+    def render(self) -> str:
+        """Prometheus 文本格式 (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """
+        所有指标的紧凑摘要
+        :return: {指标名 (不含前缀): 数值 / {标签值: 数值} / 直方图摘要}
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name[len(self.prefix):]: metric.snapshot() for metric in metrics}
+
+
+global_metrics = MetricsRegistry()
+global_metrics.gauge("process_cpu_seconds", "进程累计占用的 CPU 时间 (秒)", fn=time.process_time)
+global_metrics.gauge("log_dropped", "日志队列满而丢弃的日志条数", fn=lambda: logger.dropped)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5, registry: MetricsRegistry = global_metrics):
+    """
+    周期性睡眠, 以实际唤醒时间和预期时间的差值作为事件循环延迟
+    :param interval: 采样间隔 (秒)
+    :param registry: 指标注册表
+    """
+    lag_hist = registry.histogram("event_loop_lag_ms", "事件循环调度延迟 (毫秒)", FAST_LATENCY_BUCKETS_MS)
+    lag_gauge = registry.gauge("event_loop_lag_last_ms", "最近一次采样的事件循环调度延迟 (毫秒)")
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, (loop.time() - start - interval) * 1000)
+        lag_hist.observe(lag)
+        lag_gauge.set(round(lag, 3))
+
+
+class MetricsServer:
+    """
+    基于 asyncio 的最小 HTTP 服务, 供 Prometheus 抓取
+    - GET /metrics: Prometheus 文本格式
+    - GET /metrics.json: 紧凑的 JSON 摘要
+    """
+
+    def __init__(self, registry: MetricsRegistry = global_metrics, host="0.0.0.0", port=8001, reuse_port: bool = False):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port  # 蓝绿重启时新旧进程共用端口
+        self.started_at = time.time()
+        self._server = None
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # 读完请求头, 不支持请求体
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request_line.decode("latin-1").split(" ")
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+            if parts[0] != "GET":
+                status, content_type, body = "405 Method Not Allowed", "text/plain", b"method not allowed\n"
+            elif path == "/metrics":
+                status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+                body = self.registry.render().encode("utf-8")
+            elif path == "/metrics.json":
+                status, content_type = "200 OK", "application/json"
+                body = json.dumps(self.registry.snapshot(), ensure_ascii=False).encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            head = f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, UnicodeDecodeError):
+            pass
+        except Exception as e:
+            logger.error(f"指标请求处理错误: {e}")
+        finally:
+            writer.close()
+
+    async def start(self):
+        """启动服务 (不阻塞)"""
+        self.registry.gauge("process_start_time_seconds", "进程启动时间 (Unix 时间戳)").set(round(self.started_at, 3))
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                  reuse_port=self.reuse_port)
+        logger.info(f"Metrics server started on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class _DiscardProtocol(asyncio.DatagramProtocol):
+    def error_received(self, exc):
+        # 接收方未启动时本机会返回 ICMP 端口不可达, 忽略即可
+        pass
+
+
+class SnapshotPublisher:
+    """
+    定期把紧凑的状态快照以 UDP 数据报发送到本机 (例如 config_ui 的仪表盘)
+    - 发送不阻塞, 没有接收方时数据直接丢弃, 不影响主服务
+    - 快照由 build 函数生成, 应保持在几 KB 以内
+    """
+
+    def __init__(self, build, host: str = "127.0.0.1", port: int = 8003, interval: float = 0.25):
+        """
+        :param build: 生成快照字典的函数
+        :param host: 接收方地址
+        :param port: 接收方端口
+        :param interval: 发送间隔 (秒)
+        """
+        self.build = build
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.sent = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(_DiscardProtocol, remote_addr=(self.host, self.port))
+        logger.info(f"Publishing metrics snapshots to udp://{self.host}:{self.port} every {self.interval}s")
+        try:
+            while True:
+                try:
+                    payload = json.dumps(self.build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                    transport.sendto(payload)
+                    self.sent += 1
+                except Exception as e:
+                    logger.warning(f"发布指标快照失败: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            transport.close()
@@ -0,0 +1,136 @@
+"""
+离线的 OpenAI 兼容 LLM 模拟服务
+以固定的首 token 延迟和 token 速率流式返回预设回复, 用于 CI 和容量测试
+
+用法:
+    python -m tools.mock_llm_server --port 8002 --first-token-delay-ms 300 --tokens-per-second 30
+然后在配置中设置 LLM_PROVIDER = "openai", OPENAI_BASE_URL = "http://127.0.0.1:8002/v1"
+"""
+import argparse
+import asyncio
+import json
+import time
+import sys
+sys.path.append("..")
+from tools.logger import logger
+from models.llm_providers import MockProvider
+
+
+class MockLLMServer:
+    """
+    基于 asyncio 的最小 HTTP/1.1 服务, 支持 keep-alive
+    - POST .../chat/completions: stream=true 时以 SSE 分块返回, 否则返回完整 JSON
+    - GET .../models: 返回模型列表
+    """
+
+    def __init__(self, provider: MockProvider, host="127.0.0.1", port=8002):
+        self.provider = provider
+        self.host = host
+        self.port = port
+        self.request_count = 0
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    @staticmethod
+    def _write_head(writer, status, content_type, extra_headers=None):
+        lines = [f"HTTP/1.1 {status}", f"Content-Type: {content_type}", "Connection: keep-alive"]
+        lines += extra_headers or []
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def _write_json(self, writer, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._write_head(writer, status, "application/json", [f"Content-Length: {len(payload)}"])
+        writer.write(payload)
+
+    @staticmethod
+    def _write_chunk(writer, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+
+    async def _stream_completion(self, writer, model):
+        self._write_head(writer, "200 OK", "text/event-stream", ["Transfer-Encoding: chunked", "Cache-Control: no-cache"])
+        created = int(time.time())
+        for delay, token in self.provider.schedule():
+            await asyncio.sleep(delay)
+            chunk = {"id": f"mock-{self.request_count}", "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self._write_chunk(writer, f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await writer.drain()
+        chunk = {"id": f"mock-{self.request_count}", "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self._write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        self._write_chunk(writer, b"")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                self.request_count += 1
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    data = json.loads(body or b"{}")
+                    model = data.get("model", "mock")
+                    if data.get("stream"):
+                        await self._stream_completion(writer, model)
+                    else:
+                        message = await self.provider.acomplete(model, data.get("messages", []))
+                        self._write_json(writer, "200 OK", {
+                            "id": f"mock-{self.request_count}", "object": "chat.completion", "model": model,
+                            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+                elif method == "GET" and path.rstrip("/").endswith("/models"):
+                    self._write_json(writer, "200 OK", {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+                else:
+                    self._write_json(writer, "404 Not Found", {"error": {"message": f"Unknown path {path}"}})
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logger.error(f"Mock LLM server error: {e}")
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        logger.info(f"Mock LLM server started on http://{self.host}:{self.port}/v1")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--first-token-delay-ms", type=float, default=None, help="首 token 延迟 (毫秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="token 速率")
+    parser.add_argument("--response", default=None, help="流式回复的文本")
+    parser.add_argument("--completion", default=None, help="非流式调用的回复 (意图识别 JSON)")
+    args = parser.parse_args()
+
+    provider = MockProvider(response=args.response, completion=args.completion,
+                            first_token_delay_ms=args.first_token_delay_ms, tokens_per_second=args.tokens_per_second)
+    try:
+        asyncio.run(MockLLMServer(provider, args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Mock LLM server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,28 @@ class FunctionRegistry:
     def __init__(self):
         self.registered_functions = {}  # 存储已注册函数信息
         self.real_functions = {}       # 存储真实可调用函数对象
+        self.listeners = []            # 函数注册时的回调, 用于增量更新索引
+        self.version = 0               # 注册的函数定义变化时递增, 用于使依赖工具列表的缓存失效
 
-    def register_function(self, function_name: str, description: str, parameters: Dict[str, str], impl: Callable = None):
+    def add_listener(self, callback: Callable):
+        """
+        添加函数注册回调, 并对已注册的函数立即回调一次
+        :param callback: callback(function_name, info), info 为 registered_functions 中的条目
+        """
+        self.listeners.append(callback)
+        for name, info in list(self.registered_functions.items()):
+            callback(name, info)
+
+    def register_function(self, function_name: str, description: str, parameters: Dict[str, str], impl: Callable = None,
+                          examples: List = None):
         """
         注册函数到系统
         :param function_name: 函数名称
         :param description: 功能描述
         :param parameters: 参数结构 {字段名: 描述}
         :param impl: 实际实现的函数对象（可选）
+        :param examples: 示例语句（可选）, 每项为字符串或 {"text": ..., "arguments": {...}}, 用于本地意图匹配
+        重复注册相同的定义 (设备每次连接都会发送 functions_register) 只更新实现, 不递增版本、不通知监听者
         """
         if not isinstance(parameters, dict):
             raise ValueError("参数结构必须是字典")
@@ -21,6 +35,14 @@ class FunctionRegistry:
             if not isinstance(param_description, str):
                 raise ValueError(f"参数类型必须是str对象，当前{param_name}描述为{param_description}")
 
+        examples = examples or []
+        current = self.registered_functions.get(function_name)
+        if current is not None and (current['description'], current['arguments'], current['examples']) == \
+                (description, parameters, examples):
+            if impl:
+                self.real_functions[function_name] = impl
+            return
+
         # 创建 Pydantic 模型用于参数校验
         params_model = create_model(
             function_name + 'Params',
@@ -30,10 +52,15 @@ class FunctionRegistry:
         self.registered_functions[function_name] = {
             'description': description,
             'arguments': parameters,
-            'params_model': params_model
+            'params_model': params_model,
+            'examples': examples
         }
         if impl:
             self.real_functions[function_name] = impl
+        self.version += 1
+
+        for callback in self.listeners:
+            callback(function_name, self.registered_functions[function_name])
 
     def get_registered_tools(self) -> List[Dict]:
         """获取所有已注册工具信息，并将参数类型转为字符串"""
@@ -49,6 +76,28 @@ class FunctionRegistry:
             for name, info in self.registered_functions.items()
         ]
 
+    def get_openai_tools(self, exclude: List[str] = None) -> List[Dict]:
+        """
+        获取 OpenAI/DashScope 原生 tools 格式的工具列表, 用于单次调用的工具调用模式
+        :param exclude: 不作为工具提供的函数名 (例如默认意图 continue_chat)
+        """
+        exclude = exclude or []
+        return [
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": info["description"],
+                    "parameters": {
+                        "type": "object",
+                        "properties": {k: {"type": "string", "description": v} for k, v in info["arguments"].items()},
+                    }
+                }
+            }
+            for name, info in self.registered_functions.items()
+            if name not in exclude
+        ]
+
     def execute_function(self, function_call: Dict[str, Any]) -> Any:
         """
         执行注册的函数
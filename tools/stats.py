@@ -0,0 +1,251 @@
+import bisect
+import threading
+import time
+
+# 上行帧序列号为 32 位无符号整数, 溢出后从 0 重新开始
+SEQ_MODULUS = 1 << 32
+
+# 默认延迟直方图的桶上界 (毫秒)
+DEFAULT_LATENCY_BUCKETS_MS = (5, 10, 20, 30, 40, 60, 80, 100, 150, 200, 300, 400, 500,
+                              750, 1000, 1500, 2000, 3000, 5000, 10000)
+
+
+class Histogram:
+    """
+    固定桶直方图，用于统计延迟分布
+    特点：
+    - observe 为 O(log n)，内存固定，不保存原始样本
+    - 百分位数在桶内线性插值，精度取决于桶的划分
+    - 支持 merge，便于多个直方图汇总
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        """
+        记录一个样本
+        :param value: 样本值
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        """
+        合并另一个相同桶划分的直方图
+        :param other: 另一个直方图
+        """
+        if other.buckets != self.buckets:
+            raise ValueError("只能合并桶划分相同的直方图")
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, p):
+        """
+        估算百分位数
+        :param p: 百分位 (0-100)
+        :return: 估算值，无样本时返回 None
+        """
+        if self.count == 0:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c == 0:
+                continue
+            if seen + c >= rank:
+                lower = self.buckets[i - 1] if i > 0 else (self.min or 0)
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower = max(lower, self.min)
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.max
+
+    def snapshot(self) -> dict:
+        """
+        获取直方图摘要
+        :return: 包含 count/avg/min/max/p50/p95/p99 的字典
+        """
+        def _round(v):
+            return None if v is None else round(v, 1)
+
+        return {
+            "count": self.count,
+            "avg": _round(self.sum / self.count) if self.count else None,
+            "min": _round(self.min),
+            "max": _round(self.max),
+            "p50": _round(self.percentile(50)),
+            "p95": _round(self.percentile(95)),
+            "p99": _round(self.percentile(99)),
+        }
+
+
+def now_ms() -> float:
+    """单调时钟的毫秒值，用于计算时间间隔"""
+    return time.monotonic() * 1000
+
+
+class StreamStats:
+    """
+    单个会话的音频流统计 (协议 v3)
+    - 上行: 根据序列号统计丢包/乱序，根据设备采集时间戳计算单向抖动 (RFC 3550)
+    - 轮次: 语音结束 -> 首个下行音频帧发出的服务端延迟
+    - 端到端: 设备采集的语音结束时间 -> 设备回报的首帧播放时间 (同一设备时钟)
+    - 合成: LLM 首个 token -> TTS 返回首个音频块
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 上行统计
+        self.received = 0
+        self.base_seq = None
+        self.highest_seq = None     # 扩展序列号 (含回绕次数), 与 base_seq 之差即为期望收到的帧数 - 1
+        self.reordered = 0
+        self.duplicated = 0
+        self.jitter_ms = 0.0
+        self._last_transit = None
+        self._min_transit = None
+        self.delay_variation = Histogram()  # 单向延迟相对最小值的变化量
+        # 轮次统计
+        self.turn_server_latency = Histogram()
+        self.turn_e2e_latency = Histogram()
+        self._speech_end_capture_ts = None  # 设备时钟 (毫秒)
+        self._speech_end_arrival = None     # 服务端单调时钟 (毫秒)
+        self._last_capture_ts = None
+        self._turn_first_seq = None
+        self._waiting_first_sent = False
+        self.first_token_to_audio = Histogram()
+        self._first_token_ts = None         # 服务端单调时钟 (毫秒)
+
+    def on_uplink_frame(self, seq, capture_ts, arrival=None):
+        """
+        记录一个上行音频帧
+        :param seq: 帧序列号
+        :param capture_ts: 设备采集时间戳 (毫秒)
+        :param arrival: 到达时间 (服务端单调时钟毫秒)，默认取当前时间
+        """
+        arrival = now_ms() if arrival is None else arrival
+        with self._lock:
+            self.received += 1
+            if self.highest_seq is None:
+                self.base_seq = self.highest_seq = seq
+            else:
+                # 序列号算术 (RFC 1982): 相对最高序列号前进不到半个空间的视为新帧, 否则为迟到的旧帧
+                delta = (seq - self.highest_seq) % SEQ_MODULUS
+                if delta == 0:
+                    self.duplicated += 1
+                elif delta < SEQ_MODULUS // 2:
+                    self.highest_seq += delta
+                else:
+                    self.reordered += 1
+
+            # RFC 3550 到达间隔抖动: J += (|D| - J) / 16
+            transit = arrival - capture_ts
+            if self._last_transit is not None:
+                d = abs(transit - self._last_transit)
+                self.jitter_ms += (d - self.jitter_ms) / 16.0
+            self._last_transit = transit
+            if self._min_transit is None or transit < self._min_transit:
+                self._min_transit = transit
+            self.delay_variation.observe(transit - self._min_transit)
+            self._last_capture_ts = capture_ts
+
+    @property
+    def lost(self) -> int:
+        """根据序列号估算的丢包数"""
+        if self.highest_seq is None:
+            return 0
+        expected = self.highest_seq - self.base_seq + 1
+        return max(0, expected - (self.received - self.duplicated))
+
+    def on_speech_end(self, capture_ts=None):
+        """
+        标记一轮用户语音结束 (VAD 端点)
+        :param capture_ts: 最后一帧的设备采集时间戳，v2 协议为 None
+        """
+        with self._lock:
+            self._speech_end_capture_ts = capture_ts if capture_ts is not None else self._last_capture_ts
+            self._speech_end_arrival = now_ms()
+            self._turn_first_seq = None
+            self._waiting_first_sent = True
+
+    def on_downlink_frame(self, seq):
+        """
+        记录打包的下行音频帧，用于匹配设备的播放回报
+        :param seq: 下行帧序列号
+        """
+        with self._lock:
+            if self._waiting_first_sent and self._turn_first_seq is None:
+                self._turn_first_seq = seq
+
+    def on_downlink_sent(self):
+        """下行音频帧实际发送，记录本轮的服务端延迟"""
+        with self._lock:
+            if self._waiting_first_sent and self._speech_end_arrival is not None:
+                self.turn_server_latency.observe(now_ms() - self._speech_end_arrival)
+                self._waiting_first_sent = False
+
+    def on_llm_first_token(self):
+        """本轮 LLM 输出了第一个文字"""
+        with self._lock:
+            self._first_token_ts = now_ms()
+
+    def on_tts_audio(self):
+        """
+        TTS 返回音频块, 本轮的第一个音频块记录首 token 到首音频的延迟
+        :return: 本轮首 token 到首音频的延迟 (毫秒), 不是本轮第一个音频块时返回 None
+        """
+        with self._lock:
+            if self._first_token_ts is None:
+                return None
+            latency = now_ms() - self._first_token_ts
+            self._first_token_ts = None
+            self.first_token_to_audio.observe(latency)
+            return latency
+
+    def on_playback_report(self, seq, playback_ts):
+        """
+        设备回报某个下行帧的播放时间
+        :param seq: 下行帧序列号
+        :param playback_ts: 设备播放时间戳 (毫秒)
+        """
+        with self._lock:
+            if seq == self._turn_first_seq and self._speech_end_capture_ts is not None:
+                self.turn_e2e_latency.observe(playback_ts - self._speech_end_capture_ts)
+                self._turn_first_seq = None
+                self._speech_end_capture_ts = None
+
+    def summary(self) -> dict:
+        """
+        获取统计摘要
+        :return: 统计字典
+        """
+        with self._lock:
+            return {
+                "received": self.received,
+                "lost": self.lost,
+                "reordered": self.reordered,
+                "duplicated": self.duplicated,
+                "jitter_ms": round(self.jitter_ms, 1),
+                "delay_variation_ms": self.delay_variation.snapshot(),
+                "turn_server_ms": self.turn_server_latency.snapshot(),
+                "turn_e2e_ms": self.turn_e2e_latency.snapshot(),
+                "first_token_to_audio_ms": self.first_token_to_audio.snapshot(),
+            }
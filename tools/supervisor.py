@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from collections import deque
+import sys
+sys.path.append("..")
+from tools.logger import logger
+
+try:
+    import psutil  # 可选: 非 Linux 平台读取进程内存和 CPU
+except ImportError:
+    psutil = None
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def sample_process(pid: int):
+    """
+    读取进程的内存和 CPU 占用
+    :return: (当前 RSS 字节数, 峰值 RSS 字节数, 累计 CPU 秒数), 进程不存在或平台不支持时返回 None
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            # comm 字段可能包含空格, 从最后一个 ')' 之后开始按空格切分
+            fields = f.read().rsplit(b")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS   # utime + stime
+        rss = int(fields[21]) * _PAGE_SIZE
+        peak = rss
+        with open(f"/proc/{pid}/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+                    break
+        return rss, peak, cpu
+    except (OSError, IndexError, ValueError):
+        pass
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            memory = process.memory_info()
+            times = process.cpu_times()
+            return memory.rss, max(memory.rss, getattr(memory, "peak_wset", 0)), times.user + times.system
+        except psutil.Error:
+            pass
+    return None
+
+
+class RunRecord:
+    """主服务一次运行的记录"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.started_at = time.time()
+        self.ended_at = None
+        self.exit_code = None
+        self.reason = "running"   # running / crashed / stopped / replaced / memory_limit
+        self.rss = 0
+        self.peak_rss = 0
+        self.cpu_seconds = 0.0
+
+    def update(self, sample):
+        rss, peak, cpu = sample
+        self.rss = rss
+        self.peak_rss = max(self.peak_rss, peak, rss)
+        self.cpu_seconds = cpu
+
+    def finish(self, exit_code, reason: str):
+        self.ended_at = time.time()
+        self.exit_code = exit_code
+        self.reason = reason
+
+    @property
+    def uptime(self) -> float:
+        return (self.ended_at or time.time()) - self.started_at
+
+    def to_dict(self) -> dict:
+        uptime = self.uptime
+        return {
+            "pid": self.pid,
+            "started_at": round(self.started_at, 3),
+            "ended_at": round(self.ended_at, 3) if self.ended_at else None,
+            "uptime_s": round(uptime, 1),
+            "exit_code": self.exit_code,
+            "reason": self.reason,
+            "rss_mb": round(self.rss / 1048576, 1),
+            "peak_rss_mb": round(self.peak_rss / 1048576, 1),
+            "cpu_seconds": round(self.cpu_seconds, 2),
+            "cpu_percent": round(self.cpu_seconds / uptime * 100, 1) if uptime > 0 else None,
+        }
+
+
+class ServiceSupervisor:
+    """
+    主服务守护线程
+    - 主服务意外退出时自动重启, 连续崩溃时按指数退避延长等待 (运行超过 stable_after 秒后重置)
+    - crash_window 秒内崩溃 crash_limit 次判定为崩溃循环, 停止自动重启, 直到用户手动启动
+    - 记录每次运行的时长、退出码、峰值 RSS 和 CPU 时间
+    - 设置了内存上限时, RSS 连续多次超过上限则主动重启, 而不是等待被系统 OOM 杀掉
+    检查时只尝试获取服务锁, 启动/停止/重启进行中时跳过本次检查
+    """
+
+    def __init__(self, lock: threading.Lock, get_process, start, restart, interval: float = 1.0,
+                 backoff_initial: float = 1.0, backoff_max: float = 60.0, stable_after: float = 60.0,
+                 crash_window: float = 300.0, crash_limit: int = 5, memory_limit_mb: float = 0,
+                 memory_limit_samples: int = 3, history_size: int = 50):
+        """
+        :param lock: 服务锁 (与 config_ui 的启动/停止/重启共用)
+        :param get_process: 返回当前的服务进程 (subprocess.Popen 或 None)
+        :param start: 启动服务 (调用时已持有锁)
+        :param restart: 受控重启服务 restart(blue_green) (调用时已持有锁), 内存超限时传入 False:
+                        旧进程已经超过上限, 不能再同时运行一个完整的新进程
+        :param interval: 检查间隔 (秒)
+        :param backoff_initial: 第一次崩溃后的重启等待 (秒), 之后每次翻倍
+        :param backoff_max: 重启等待的上限 (秒)
+        :param stable_after: 运行超过该时长后, 之后的崩溃重新从 backoff_initial 开始计算
+        :param crash_window: 崩溃循环的统计窗口 (秒)
+        :param crash_limit: 窗口内崩溃多少次判定为崩溃循环
+        :param memory_limit_mb: 内存上限 (MB), <= 0 表示不限制
+        :param memory_limit_samples: 连续多少次检查超过上限才重启, 避免瞬时峰值触发
+        :param history_size: 保留的运行记录数
+        """
+        self.lock = lock
+        self.get_process = get_process
+        self.start_service = start
+        self.restart_service = restart
+        self.interval = interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.crash_window = crash_window
+        self.crash_limit = crash_limit
+        self.memory_limit = memory_limit_mb * 1048576
+        self.memory_limit_samples = memory_limit_samples
+
+        self.wanted = False            # 用户希望服务运行 (启动后为 True, 停止后为 False)
+        self.state = "idle"            # idle / running / backoff / crash_loop
+        self.history = deque(maxlen=history_size)
+        self.current = None            # 当前运行的 RunRecord
+        self._process = None
+        self._consecutive_crashes = 0
+        self._crash_times = deque()
+        self._restart_at = None
+        self._over_limit = 0
+        self._replace_reason = None    # 主动重启时, 被替换的运行记录的结束原因
+        self._limit_suspended = False  # 内存上限导致频繁重启时暂停检查 (上限低于正常占用)
+        self._thread = threading.Thread(target=self._run, name="service-supervisor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def set_wanted(self, wanted: bool):
+        """
+        用户启动 (True) 或停止 (False) 服务时调用 (需持有服务锁)
+        手动启动会清除崩溃循环状态
+        """
+        self.wanted = wanted
+        self._restart_at = None
+        if wanted:
+            self._consecutive_crashes = 0
+            self._crash_times.clear()
+            self._limit_suspended = False
+            self.state = "running"
+        else:
+            self.state = "idle"
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.lock.acquire(blocking=False):
+                continue
+            try:
+                self._check()
+            except Exception as e:
+                logger.error(f"Supervisor check failed: {e}")
+            finally:
+                self.lock.release()
+
+    def _track(self, process):
+        """服务进程变化 (启动、重启) 时结束上一条记录, 开始新的记录"""
+        if self.current is not None and self.current.ended_at is None:
+            old = self._process
+            code = old.poll() if old is not None else None
+            reason = "replaced" if self.wanted and process is not None else "stopped"
+            self.current.finish(code, self._replace_reason or reason)
+        self._replace_reason = None
+        self._process = process
+        self.current = None
+        self._over_limit = 0
+        if process is not None:
+            self.current = RunRecord(process.pid)
+            self.history.append(self.current)
+
+    def _check(self):
+        process = self.get_process()
+        if process is not self._process:
+            self._track(process)
+        if process is not None and self.current is not None and self.current.ended_at is None:
+            code = process.poll()
+            if code is None:
+                self._sample(process)
+                return
+            self._on_exit(code)
+        if self.wanted and self._restart_at is not None and time.time() >= self._restart_at:
+            self._restart_at = None
+            logger.info("Supervisor restarting AIChat service...")
+            self.state = "running"
+            self.start_service()
+
+    def _sample(self, process):
+        sample = sample_process(process.pid)
+        if sample is None:
+            return
+        self.current.update(sample)
+        if self.memory_limit <= 0 or self._limit_suspended:
+            return
+        if sample[0] <= self.memory_limit:
+            self._over_limit = 0
+            return
+        self._over_limit += 1
+        if self._over_limit < self.memory_limit_samples:
+            return
+        self._over_limit = 0
+        if self._record_crash():
+            # 内存上限可能低于服务的正常占用, 不再因内存重启
+            self._limit_suspended = True
+            logger.error(f"AIChat service hit the memory limit {len(self._crash_times)} times within "
+                         f"{self.crash_window:.0f}s, memory limit suspended until it is started manually")
+            return
+        logger.warning(f"AIChat service RSS {sample[0] / 1048576:.0f}MB exceeds limit "
+                       f"{self.memory_limit / 1048576:.0f}MB, restarting it")
+        self._replace_reason = "memory_limit"
+        self.restart_service(blue_green=False)
+
+    def _record_crash(self) -> bool:
+        """记录一次崩溃或内存超限重启, 返回是否已进入崩溃循环"""
+        now = time.time()
+        self._crash_times.append(now)
+        while self._crash_times and now - self._crash_times[0] > self.crash_window:
+            self._crash_times.popleft()
+        return len(self._crash_times) >= self.crash_limit
+
+    def _on_exit(self, code):
+        record = self.current
+        record.finish(code, "crashed" if self.wanted else "stopped")
+        if not self.wanted:
+            return
+        if record.uptime >= self.stable_after:
+            self._consecutive_crashes = 0
+        self._consecutive_crashes += 1
+        logger.error(f"AIChat service exited unexpectedly (PID: {record.pid}, code: {code}, "
+                     f"uptime: {record.uptime:.1f}s, peak RSS: {record.peak_rss / 1048576:.0f}MB)")
+        if self._record_crash():
+            self.state = "crash_loop"
+            self._restart_at = None
+            logger.error(f"AIChat service crashed {len(self._crash_times)} times within {self.crash_window:.0f}s, "
+                         f"auto restart disabled until it is started manually")
+            return
+        delay = min(self.backoff_initial * 2 ** (self._consecutive_crashes - 1), self.backoff_max)
+        self.state = "backoff"
+        self._restart_at = time.time() + delay
+        logger.info(f"Restarting AIChat service in {delay:.1f}s")
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "wanted": self.wanted,
+            "restart_in": round(max(0.0, self._restart_at - time.time()), 1) if self._restart_at else None,
+            "consecutive_crashes": self._consecutive_crashes,
+            "memory_limit_mb": round(self.memory_limit / 1048576) if self.memory_limit > 0 else None,
+            "memory_limit_suspended": self._limit_suspended,
+            "current": self.current.to_dict() if self.current is not None else None,
+        }
+
+    def runs(self) -> list:
+        """最近的运行记录, 最新的在前"""
+        return [record.to_dict() for record in reversed(self.history)]
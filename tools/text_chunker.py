@@ -0,0 +1,96 @@
+from typing import List
+
+# 句末标点和分句标点, 中文标点到达即可切分
+SENTENCE_PUNCTUATION = "。！？!?…\n"
+CLAUSE_PUNCTUATION = "，；、：,;:"
+# 英文标点只有在后面跟着非字母数字时才算断句 (避免切开 3.14、1,000、e.g)
+ASCII_PUNCTUATION = ".!?,;:"
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and (ch.isalnum() or ch in "_'")
+
+
+class TextChunker:
+    """
+    LLM 流式文本分段器, 位于 LLM 输出和 TTS 之间
+    特点：
+    - 第一段在遇到任意标点且长度达到 first_min_chars 时立即送出, 尽早开始合成
+    - 之后的文本在句末/分句标点处聚合, 每段至少 min_chars 个字符, 减少 TTS 调用次数
+    - 超过 max_chars 仍没有标点时强制切分, 但不会切开数字和英文单词
+    """
+
+    def __init__(self, first_min_chars: int = 4, min_chars: int = 16, max_chars: int = 80):
+        """
+        :param first_min_chars: 第一段的最小长度
+        :param min_chars: 之后每段的最小长度
+        :param max_chars: 没有标点时的最大长度
+        """
+        self.first_min_chars = first_min_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.reset()
+
+    def reset(self):
+        """开始新的一轮"""
+        self._buffer = ""
+        self._first = True
+
+    def _is_boundary(self, i: int) -> bool:
+        """buffer[i] 之后是否可以切分"""
+        ch = self._buffer[i]
+        if ch in ASCII_PUNCTUATION:
+            # 需要看到下一个字符才能判断
+            if i + 1 >= len(self._buffer):
+                return False
+            return not _is_word_char(self._buffer[i + 1])
+        return ch in SENTENCE_PUNCTUATION or ch in CLAUSE_PUNCTUATION
+
+    def _safe_split(self, limit: int) -> int:
+        """在 limit 之前找一个不会切开单词/数字的位置, 返回切分后第一段的长度"""
+        for end in range(limit, 0, -1):
+            if not (_is_word_char(self._buffer[end - 1]) and end < len(self._buffer)
+                    and _is_word_char(self._buffer[end])):
+                return end
+        return limit
+
+    def _next_split(self) -> int:
+        """返回可以送出的长度, 0 表示继续等待"""
+        min_chars = self.first_min_chars if self._first else self.min_chars
+        end = 0
+        for i in range(len(self._buffer)):
+            if i + 1 >= min_chars and self._is_boundary(i):
+                end = i + 1
+                if self._first:
+                    break
+        if end:
+            return end
+        if len(self._buffer) >= self.max_chars:
+            return self._safe_split(self.max_chars)
+        return 0
+
+    def feed(self, text: str) -> List[str]:
+        """
+        输入一段 LLM 输出
+        :param text: 文本片
+        :return: 可以送入 TTS 的文本段列表
+        """
+        segments = []
+        self._buffer += text
+        while self._buffer:
+            end = self._next_split()
+            if not end:
+                break
+            segment, self._buffer = self._buffer[:end], self._buffer[end:]
+            if segment.strip():
+                segments.append(segment)
+                self._first = False
+        return segments
+
+    def flush(self) -> List[str]:
+        """
+        LLM 输出结束, 送出剩余文本
+        :return: 文本段列表
+        """
+        segment, self._buffer = self._buffer, ""
+        return [segment] if segment.strip() else []
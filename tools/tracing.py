@@ -0,0 +1,203 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import sys
+sys.path.append("..")
+from tools.logger import logger
+from tools.stats import Histogram, now_ms
+
+# 一轮对话中依次记录的时间点, 从语音结束到第一个音频帧发出
+STAGES = (
+    "vad_end",            # AudioHandler 检测到语音结束
+    "asr_start",
+    "asr_end",
+    "intent_start",
+    "intent_end",
+    "llm_request",        # 发起对话请求
+    "llm_first_token",
+    "tts_first_text",     # 第一段文本送入 TTS (或命中短语缓存)
+    "tts_first_pcm",      # _tts_on_data 收到第一块 PCM
+    "opus_first_queued",  # 第一个 Opus 帧放入发送队列
+    "first_frame_sent",   # process_send_queue 发出第一个音频帧
+)
+FINAL_STAGE = STAGES[-1]
+
+
+class TurnTrace:
+    """
+    单轮对话的追踪记录
+    - 每个时间点只记录第一次出现的时间 (服务端单调时钟, 毫秒)
+    - 可以在任意线程中调用 mark
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.wall_start = time.time()
+        self.marks = {}
+        self.finished = False
+
+    def mark(self, stage: str, ts: float = None) -> bool:
+        """
+        记录一个时间点
+        :param stage: 时间点名称, 见 STAGES
+        :param ts: 时间 (毫秒), 默认取当前时间
+        :return: 是否是第一次记录
+        """
+        if stage in self.marks:
+            return False
+        self.marks.setdefault(stage, now_ms() if ts is None else ts)
+        return True
+
+    def offsets(self) -> dict:
+        """各时间点相对第一个时间点的偏移 (毫秒), 按 STAGES 顺序"""
+        if not self.marks:
+            return {}
+        start = min(self.marks.values())
+        return {stage: round(self.marks[stage] - start, 1) for stage in STAGES if stage in self.marks}
+
+
+class Tracer:
+    """
+    每轮对话的延迟追踪
+    特点：
+    - 每轮结束时向 trace_YYYYMMDD.log 写一行紧凑的 JSON: 追踪 ID 和各时间点的偏移
+    - 按阶段 (相邻两个已记录的时间点之间) 累计直方图, 定期输出 p50/p95/p99
+    - 可选导出 Chrome trace-event JSON (chrome://tracing 或 Perfetto 打开), 每轮一行, 每个阶段一段
+    - finish 可能在事件循环中被调用 (发出第一个音频帧时), 只做统计并放入有界队列 (满时丢弃);
+      文件写入和 Chrome 导出在后台线程中进行, 导出最多每 chrome_interval 秒一次
+    """
+
+    def __init__(self, log_dir: str = None, summary_every: int = 20, chrome_path: str = None, chrome_max_turns: int = 200,
+                 chrome_interval: float = 5.0, queue_size: int = 1000):
+        """
+        :param log_dir: 追踪日志目录, 默认与普通日志相同
+        :param summary_every: 每隔多少轮输出一次统计, <= 0 表示不输出
+        :param chrome_path: Chrome trace JSON 导出路径, 为空时不导出
+        :param chrome_max_turns: 导出文件中保留的最近轮数
+        :param chrome_interval: 两次 Chrome 导出之间的最短间隔 (秒)
+        :param queue_size: 等待写入的轮数上限
+        """
+        self.log_dir = log_dir or os.environ.get("LOG_DIR", "./logs")
+        self.summary_every = summary_every
+        self.chrome_path = chrome_path or None
+        self.chrome_interval = chrome_interval
+        self.stage_latency = {stage: Histogram() for stage in STAGES[1:]}
+        self.total_latency = Histogram()
+        self.turns = 0
+        self.dropped = 0
+        self._chrome_turns = deque(maxlen=chrome_max_turns)  # 只在写入线程中访问
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_date = None
+        self._pending = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name="tracer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _write_line(self, line: str):
+        today = datetime.now().strftime('%Y%m%d')
+        if self._file is None or self._file_date != today:
+            if self._file is not None:
+                self._file.close()
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._file = open(os.path.join(self.log_dir, f"trace_{today}.log"), "a", encoding="utf-8", buffering=1)
+            self._file_date = today
+        self._file.write(line + "\n")
+
+    def finish(self, trace: TurnTrace):
+        """
+        结束一轮追踪 (可重复调用, 只处理一次)
+        :param trace: 追踪记录
+        """
+        with self._lock:
+            if trace is None or trace.finished or not trace.marks:
+                return
+            trace.finished = True
+            offsets = trace.offsets()
+            previous = None
+            for stage, offset in offsets.items():
+                if previous is not None:
+                    self.stage_latency[stage].observe(offset - offsets[previous])
+                previous = stage
+            if "vad_end" in offsets and FINAL_STAGE in offsets:
+                self.total_latency.observe(offsets[FINAL_STAGE] - offsets["vad_end"])
+            self.turns += 1
+            report = self.summary_every > 0 and self.turns % self.summary_every == 0
+        try:
+            self._pending.put_nowait((trace.trace_id, trace.wall_start, offsets))
+        except queue.Full:
+            self.dropped += 1
+        if report:
+            logger.info(f"Turn latency ({self.turns} turns): {json.dumps(self.summary())}")
+
+    def _run(self):
+        """写入线程: 追加追踪日志, 合并短时间内的多轮后再导出 Chrome trace"""
+        last_export = 0.0
+        dirty = False
+        while True:
+            timeout = max(0.0, last_export + self.chrome_interval - time.monotonic()) if dirty else None
+            try:
+                item = self._pending.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                trace_id, wall_start, offsets = item
+                try:
+                    self._write_line(json.dumps({"trace": trace_id, "t": round(wall_start, 3), "ms": offsets},
+                                                separators=(",", ":")))
+                except OSError as e:
+                    logger.warning(f"写入追踪日志失败: {e}")
+                if self.chrome_path:
+                    self._chrome_turns.append(item)
+                    dirty = True
+            if dirty and time.monotonic() - last_export >= self.chrome_interval:
+                self._export_chrome()
+                dirty = False
+                last_export = time.monotonic()
+        if dirty:
+            self._export_chrome()
+
+    def stop(self, timeout: float = 2.0):
+        """写完队列中剩余的追踪记录 (进程退出时调用)"""
+        if self._thread.is_alive():
+            try:
+                self._pending.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+    def summary(self) -> dict:
+        """
+        各阶段延迟统计
+        :return: {"total": {...}, "stages": {阶段: {"count", "p50", "p95", "p99", ...}}}
+        """
+        return {
+            "total": self.total_latency.snapshot(),
+            "stages": {stage: hist.snapshot() for stage, hist in self.stage_latency.items() if hist.count},
+        }
+
+    def _export_chrome(self):
+        """把最近的轮次写成 Chrome trace-event JSON (在写入线程中调用)"""
+        events = []
+        for tid, (trace_id, wall_start, offsets) in enumerate(self._chrome_turns, start=1):
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": trace_id}})
+            start_us = wall_start * 1e6
+            stages = list(offsets.items())
+            for (stage, offset), (next_stage, next_offset) in zip(stages, stages[1:]):
+                events.append({"name": next_stage, "cat": "turn", "ph": "X", "pid": 1, "tid": tid,
+                               "ts": round(start_us + offset * 1000), "dur": round((next_offset - offset) * 1000),
+                               "args": {"from": stage}})
+        try:
+            tmp_path = self.chrome_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+            os.replace(tmp_path, self.chrome_path)
+        except OSError as e:
+            logger.warning(f"导出 Chrome trace 失败: {e}")
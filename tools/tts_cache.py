@@ -0,0 +1,141 @@
+import hashlib
+import os
+import struct
+import threading
+import sys
+sys.path.append("..")
+from tools.logger import logger
+from tools.lru_cache import LRUCache
+from tools.intent_matcher import normalize_text
+
+# 磁盘文件格式: 魔数 + 包数量, 之后每个 Opus 包为 2 字节长度 + 数据
+DISK_MAGIC = b"OPC1"
+DISK_HEADER_FORMAT = "!4sI"
+DISK_PACKET_FORMAT = "!H"
+
+
+class TTSPhraseCache:
+    """
+    短语级 TTS 音频缓存, 缓存已编码好的 Opus 包序列
+    特点：
+    - 以 (模型, 音色, 帧长, 归一化文本) 为键, 命中时跳过 TTS 请求和 Opus 编码
+    - 内存 LRU 为第一级, 可选的磁盘目录为第二级 (进程重启后仍可命中)
+    - 磁盘文件格式紧凑: 包长度 + 包数据依次排列
+    """
+
+    def __init__(self, maxsize: int = 256, max_chars: int = 20, disk_dir: str = None, disk_max_entries: int = 2000):
+        """
+        :param maxsize: 内存中缓存的短语数
+        :param max_chars: 只缓存不超过该长度的短语
+        :param disk_dir: 磁盘缓存目录, 为空时不使用磁盘
+        :param disk_max_entries: 磁盘中最多保留的短语数
+        """
+        self.memory = LRUCache(maxsize)
+        self.max_chars = max_chars
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self._disk_lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def cacheable(self, text: str) -> bool:
+        """文本是否适合缓存 (短语)"""
+        norm = normalize_text(text)
+        return 0 < len(norm) <= self.max_chars
+
+    @staticmethod
+    def make_key(model: str, voice: str, frame_duration_ms, text: str) -> str:
+        raw = f"{model}|{voice}|{frame_duration_ms}|{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.opc")
+
+    def get(self, key: str):
+        """
+        查询缓存
+        :param key: make_key 生成的键
+        :return: Opus 包列表, 未命中时返回 None
+        """
+        packets = self.memory.get(key)
+        if packets is not None or not self.disk_dir:
+            return packets
+        packets = self._read_disk(key)
+        if packets is not None:
+            self.disk_hits += 1
+            self.memory.put(key, packets)
+        return packets
+
+    def put(self, key: str, packets: list):
+        """
+        写入缓存
+        :param key: make_key 生成的键
+        :param packets: Opus 包列表
+        """
+        if not packets:
+            return
+        self.memory.put(key, packets)
+        if self.disk_dir:
+            self._write_disk(key, packets)
+
+    def _read_disk(self, key: str):
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"读取 TTS 磁盘缓存失败: {e}")
+            return None
+        try:
+            magic, count = struct.unpack_from(DISK_HEADER_FORMAT, data)
+            if magic != DISK_MAGIC:
+                return None
+            offset = struct.calcsize(DISK_HEADER_FORMAT)
+            packets = []
+            for _ in range(count):
+                (size,) = struct.unpack_from(DISK_PACKET_FORMAT, data, offset)
+                offset += struct.calcsize(DISK_PACKET_FORMAT)
+                packets.append(data[offset:offset + size])
+                offset += size
+            return packets
+        except struct.error:
+            logger.warning(f"TTS 磁盘缓存文件损坏: {key}")
+            return None
+
+    def _write_disk(self, key: str, packets: list):
+        data = [struct.pack(DISK_HEADER_FORMAT, DISK_MAGIC, len(packets))]
+        for packet in packets:
+            data.append(struct.pack(DISK_PACKET_FORMAT, len(packet)))
+            data.append(packet)
+        path = self._disk_path(key)
+        with self._disk_lock:
+            try:
+                # 先写临时文件再改名, 避免读到写了一半的文件
+                with open(path + ".tmp", "wb") as f:
+                    f.write(b"".join(data))
+                os.replace(path + ".tmp", path)
+                self.disk_writes += 1
+                if self.disk_writes % 50 == 0:
+                    self._prune_disk()
+            except OSError as e:
+                logger.warning(f"写入 TTS 磁盘缓存失败: {e}")
+
+    def _prune_disk(self):
+        """删除最久未修改的文件, 使磁盘缓存不超过 disk_max_entries"""
+        entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".opc")]
+        if len(entries) <= self.disk_max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.disk_max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats.update({"disk_hits": self.disk_hits, "disk_writes": self.disk_writes})
+        return stats
@@ -6,6 +6,7 @@ let configData = {};
 let originalApiKey = '';
 let ws;
 let retryTimeout = 1000;
+const MAX_LOG_CHARS = 500000;  // 日志面板最多保留的字符数
 
 // === Initialize on page load ===
 document.addEventListener('DOMContentLoaded', function() {
@@ -20,9 +21,11 @@ function setupTopNavigation() {
     const navItems = document.querySelectorAll('.navbar-item');
     navItems.forEach(item => {
         item.addEventListener('click', function(e) {
-            e.preventDefault();
             const section = this.dataset.section;
-            if (section) switchSection(section);
+            if (section) {
+                e.preventDefault();
+                switchSection(section);
+            }
         });
     });
 }
@@ -79,11 +82,15 @@ function connectLogs() {
         console.log('Log WebSocket connected');
         updateLogStatus('已连接', 'connected');
         retryTimeout = 1000;
+        // 服务端会先重放最近的历史日志, 重连时清空避免重复
+        document.getElementById('log-output').textContent = '';
     };
     
     ws.onmessage = function(event) {
         const logOutput = document.getElementById('log-output');
-        logOutput.textContent += event.data;
+        const text = logOutput.textContent + event.data;
+        // 只保留末尾部分, 避免长时间运行后页面变慢
+        logOutput.textContent = text.length > MAX_LOG_CHARS ? text.slice(text.length - MAX_LOG_CHARS) : text;
         
         const autoscrollChk = document.getElementById('autoscroll-chk');
         if (autoscrollChk && autoscrollChk.checked) {
@@ -255,10 +262,20 @@ async function saveConfig() {
         const result = await response.json();
         
         if (response.ok && result.success) {
-            // 显示成功的模态框
-            showSuccessModal('✅ 配置已保存成功！\n\n所有设置已更新并保存到系统。');
             originalApiKey = apiKeyInput.value;
             configData = config;
+            const restartRequired = result.restart_required || [];
+            if (result.service_running && restartRequired.length > 0) {
+                // 只有修改了需要重启的配置 (如模型设备) 时才重启服务
+                if (confirm('配置已保存。以下配置需要重启服务才能生效：\n' + restartRequired.join(', ') + '\n\n现在重启吗？')) {
+                    restartService(true);
+                }
+            } else if (result.service_running && result.reloaded && result.reloaded.length > 0) {
+                showSuccessModal('✅ 配置已保存并已热加载！\n\n无需重启服务，新的对话轮次将使用新配置。');
+            } else {
+                // 显示成功的模态框
+                showSuccessModal('✅ 配置已保存成功！\n\n所有设置已更新并保存到系统。');
+            }
         } else {
             showNotification('保存失败：' + (result.error || result.detail || '未知错误'), 'error');
         }
@@ -557,13 +574,13 @@ function showSuccessModal(message) {
 }
 
 // === Service Restart ===
-async function restartService() {
+async function restartService(confirmed) {
     const restartBtn = document.getElementById('restartBtn');
     if (!restartBtn) return;
     
     const originalText = restartBtn.textContent;
     
-    if (!confirm('确定要重启 AI 聊天服务吗？WebSocket 连接将保持。')) {
+    if (confirmed !== true && !confirm('确定要重启 AI 聊天服务吗？WebSocket 连接将保持。')) {
         return;
     }
     
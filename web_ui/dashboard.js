@@ -0,0 +1,181 @@
+// ============ 性能仪表盘 ============
+// 通过 /ws/metrics 接收主服务每秒发布几次的紧凑快照 (见 tools/dashboard.py)
+
+const CPU_SERIES = {
+    process: '#3b82f6',
+    vad: '#10b981',
+    asr: '#f59e0b',
+    opus: '#a855f7'
+};
+const HISTORY_SIZE = 240;     // 保留的快照数 (约 1 分钟)
+const STALE_AFTER_MS = 3000;  // 超过该时间没有快照时提示数据过期
+
+let ws = null;
+let retryTimeout = 1000;
+let lastSnapshotAt = 0;
+const cpuHistory = [];
+
+document.addEventListener('DOMContentLoaded', function() {
+    renderLegend();
+    connectMetrics();
+    setInterval(checkStale, 1000);
+});
+
+function connectMetrics() {
+    const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const wsUrl = wsProtocol + '//' + window.location.host + '/ws/metrics';
+
+    updateStatus('连接中...', '');
+    try {
+        ws = new WebSocket(wsUrl);
+    } catch (e) {
+        console.error('WebSocket connection failed:', e);
+        updateStatus('连接失败', 'disconnected');
+        return;
+    }
+
+    ws.onopen = function() {
+        updateStatus('等待数据...', 'connected');
+        retryTimeout = 1000;
+    };
+
+    ws.onmessage = function(event) {
+        let snapshot;
+        try {
+            snapshot = JSON.parse(event.data);
+        } catch (e) {
+            return;
+        }
+        lastSnapshotAt = Date.now();
+        updateStatus('实时', 'connected');
+        render(snapshot);
+    };
+
+    ws.onclose = function() {
+        updateStatus('已断开', 'disconnected');
+        setTimeout(function() {
+            retryTimeout = Math.min(retryTimeout * 2, 10000);
+            connectMetrics();
+        }, retryTimeout);
+    };
+
+    ws.onerror = function(error) {
+        console.error('WebSocket error:', error);
+    };
+}
+
+function updateStatus(text, cls) {
+    const el = document.getElementById('metrics-status');
+    el.textContent = text;
+    el.className = 'metrics-status ' + cls;
+}
+
+function checkStale() {
+    if (ws && ws.readyState === WebSocket.OPEN && lastSnapshotAt && Date.now() - lastSnapshotAt > STALE_AFTER_MS) {
+        updateStatus('主服务无数据', 'stale');
+    }
+}
+
+function fmt(value, digits) {
+    if (value === null || value === undefined) return '-';
+    return typeof value === 'number' ? value.toFixed(digits === undefined ? 0 : digits) : String(value);
+}
+
+function fmtUptime(seconds) {
+    if (seconds === null || seconds === undefined) return '-';
+    const h = Math.floor(seconds / 3600);
+    const m = Math.floor((seconds % 3600) / 60);
+    return h > 0 ? h + 'h' + m + 'm' : m + 'm' + (seconds % 60) + 's';
+}
+
+function setText(id, text) {
+    document.getElementById(id).textContent = text;
+}
+
+function render(s) {
+    setText('stat-sessions', fmt(s.sessions));
+    setText('stat-sessions-total', fmt(s.sessions_total));
+    setText('stat-turn-p95', s.turn ? fmt(s.turn.p95) : '-');
+    setText('stat-loop-lag', fmt(s.loop_lag_ms, 1));
+    setText('stat-lost', s.uplink ? fmt(s.uplink.lost) : '-');
+    setText('stat-bytes-in', s.traffic && s.traffic.bytes_in !== null ? fmt(s.traffic.bytes_in / 1024, 1) : '-');
+    setText('stat-bytes-out', s.traffic && s.traffic.bytes_out !== null ? fmt(s.traffic.bytes_out / 1024, 1) : '-');
+    setText('stat-uptime', fmtUptime(s.uptime));
+
+    renderQueues(s.queues || {});
+    renderPercentiles('stage-table', s.stages || {}, s.turn ? {total: s.turn} : {});
+    renderPercentiles('component-table', s.components || {}, {});
+
+    if (s.cpu && s.cpu.process !== null) {
+        cpuHistory.push(s.cpu);
+        if (cpuHistory.length > HISTORY_SIZE) cpuHistory.shift();
+        drawCpuChart();
+    }
+}
+
+function renderQueues(queues) {
+    const rows = Object.keys(queues).map(function(name) {
+        const q = queues[name];
+        const ratio = q.max > 0 ? Math.min(q.size / q.max, 1) : 0;
+        const level = ratio >= 0.9 ? 'danger' : (ratio >= 0.6 ? 'warn' : '');
+        return '<tr><td>' + name + '</td><td>' + q.size + '</td><td>' + (q.max > 0 ? q.max : '∞') + '</td>' +
+            '<td><div class="bar ' + level + '"><div style="width:' + (ratio * 100).toFixed(0) + '%"></div></div></td>' +
+            '<td>' + q.dropped + '</td></tr>';
+    });
+    document.getElementById('queue-table').innerHTML = rows.join('');
+}
+
+function renderPercentiles(tableId, rows, extra) {
+    const all = Object.assign({}, extra, rows);
+    const html = Object.keys(all).filter(function(name) { return all[name]; }).map(function(name) {
+        const r = all[name];
+        const digits = name.indexOf('rtf') >= 0 ? 3 : 1;
+        return '<tr><td>' + name + '</td><td>' + r.n + '</td><td>' + fmt(r.p50, digits) + '</td><td>' +
+            fmt(r.p95, digits) + '</td><td>' + fmt(r.p99, digits) + '</td></tr>';
+    });
+    document.getElementById(tableId).innerHTML = html.join('');
+}
+
+function renderLegend() {
+    document.getElementById('cpu-legend').innerHTML = Object.keys(CPU_SERIES).map(function(name) {
+        return '<span style="--c:' + CPU_SERIES[name] + '">' + name + '</span>';
+    }).join('');
+}
+
+function drawCpuChart() {
+    const canvas = document.getElementById('cpu-chart');
+    const ctx = canvas.getContext('2d');
+    const w = canvas.width;
+    const h = canvas.height;
+    ctx.clearRect(0, 0, w, h);
+
+    let max = 100;
+    cpuHistory.forEach(function(point) {
+        Object.keys(CPU_SERIES).forEach(function(name) {
+            if (point[name] !== null && point[name] > max) max = point[name];
+        });
+    });
+
+    ctx.strokeStyle = '#e2e8f0';
+    ctx.fillStyle = '#94a3b8';
+    ctx.font = '20px sans-serif';
+    ctx.beginPath();
+    ctx.moveTo(0, h - 1);
+    ctx.lineTo(w, h - 1);
+    ctx.stroke();
+    ctx.fillText(max.toFixed(0) + '%', 4, 20);
+
+    const step = w / (HISTORY_SIZE - 1);
+    Object.keys(CPU_SERIES).forEach(function(name) {
+        ctx.strokeStyle = CPU_SERIES[name];
+        ctx.lineWidth = 2;
+        ctx.beginPath();
+        cpuHistory.forEach(function(point, i) {
+            const value = point[name] || 0;
+            const x = (HISTORY_SIZE - cpuHistory.length + i) * step;
+            const y = h - (value / max) * (h - 4) - 2;
+            if (i === 0) ctx.moveTo(x, y); else ctx.lineTo(x, y);
+        });
+        ctx.stroke();
+    });
+}
@@ -2,6 +2,8 @@ import asyncio
 import websockets
 import json
 import queue
+import struct
+import time
 from handle.text_handler import TextHandler
 from handle.audio_handler import AudioHandler
 from handle.auth_handler import AuthHandler
@@ -10,11 +12,33 @@ from service_manager import ServiceManager
 import sys
 sys.path.append("..")
 from tools.logger import logger
+from config.settings import global_settings
+from tools.metrics import global_metrics
+from tools.audio_processor import AudioProcessor
+
+ACTIVE_SESSIONS = global_metrics.gauge("active_sessions", "当前已鉴权的连接数")
+SESSIONS_TOTAL = global_metrics.counter("sessions_total", "累计已鉴权的连接数")
+BYTES_IN = global_metrics.counter("ws_bytes_in_total", "WebSocket 接收的字节数")
+BYTES_OUT = global_metrics.counter("ws_bytes_out_total", "WebSocket 发送的字节数")
+
+# 容器消息中每个条目的头部大小 (类型 + 长度)
+BATCH_ITEM_HEADER_SIZE = struct.calcsize(AudioProcessor.BATCH_ITEM_FORMAT)
+
+
+def _payload_size(data) -> int:
+    return len(data) if isinstance(data, bytes) else len(data.encode("utf-8"))
 
 class WebSocketServer:
-    def __init__(self, host="0.0.0.0", port=8000, access_token="123456", device_id="00:11:22:33:44:55", protocol_version=2, service_manager: ServiceManager = None):
+    def __init__(self, host="0.0.0.0", port=8000, access_token="123456", device_id="00:11:22:33:44:55", protocol_version=2,
+                 service_manager: ServiceManager = None, supported_protocol_versions: list = None, reuse_port: bool = False):
         self.host = host
         self.port = port
+        # 使用 SO_REUSEPORT 监听, 蓝绿重启时新进程可以在旧进程退出前绑定同一端口
+        self.reuse_port = reuse_port
+        self.server = None
+        self.connections = set()   # 当前的客户端连接
+        self.draining = False      # 已停止接受新连接, 等待退出
+        self._stopped = None
 
         # 初始化vad asr chat intent tts等服务
         self.service_manager = service_manager
@@ -22,20 +46,30 @@ class WebSocketServer:
         self.text_handler = TextHandler(self.service_manager)
         self.audio_handler = AudioHandler(self.service_manager)
         # 初始化鉴权处理器
-        self.auth_handler = AuthHandler(access_token, device_id, protocol_version)
+        self.auth_handler = AuthHandler(access_token, device_id, protocol_version, supported_protocol_versions)
 
-    async def process_send_queue(self, websocket):
+    async def process_send_queue(self, websocket, batching: bool = False):
         """
         异步任务：从发送队列中取出数据并发送
+        :param websocket: 客户端连接
+        :param batching: 是否将队列中的多条消息合并为一个容器消息发送
         """
+        carry = None  # 超出上一个容器消息大小上限, 留到下一次发送的消息
         while True:
             try:
                 # 检查队列是否为空
-                if not self.service_manager.ws_send_queue.empty():
+                if carry is not None or not self.service_manager.ws_send_queue.empty():
+                    if batching:
+                        carry = await self._send_batch(websocket, carry)
+                        continue
                     # 队列不为空时获取数据
                     data = self.service_manager.ws_send_queue.get_nowait()  # 非阻塞获取数据
                     # 通过 WebSocket 发送数据
                     await websocket.send(data)
+                    BYTES_OUT.inc(_payload_size(data))
+                    if isinstance(data, bytes):
+                        self.service_manager.stream_stats.on_downlink_sent()
+                        self.service_manager.trace_mark("first_frame_sent")
                     # logger.info(f"发送数据到客户端: {len(data)} bytes")
                 else:
                     # 如果队列为空，稍作等待
@@ -43,17 +77,75 @@ class WebSocketServer:
             except Exception as e:
                 logger.error(f"发送队列处理错误: {e}")
 
+    @staticmethod
+    def _batch_item_size(data) -> int:
+        """消息在容器负载中占用的字节数: 条目头 + 数据 (文本按 UTF-8 计算)"""
+        return BATCH_ITEM_HEADER_SIZE + (len(data.encode("utf-8")) if isinstance(data, str) else len(data))
+
+    async def _send_batch(self, websocket, carry=None):
+        """
+        取出队列中当前的所有消息 (受大小和等待时间上限约束), 合并为一次发送
+        负载不超过 WS_BATCH_MAX_BYTES (鉴权响应中告知客户端的上限), 放不下的消息留到下一次;
+        单条消息本身超过上限时不合并, 按原格式单独发送
+        :param carry: 上一次留下的消息
+        :return: 这一次放不下、留到下一次的消息
+        """
+        send_queue = self.service_manager.ws_send_queue
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + global_settings.WS_BATCH_MAX_DELAY_MS / 1000
+        items = []
+        size = 0
+        while True:
+            if carry is not None:
+                data, carry = carry, None
+            else:
+                try:
+                    data = send_queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    await asyncio.sleep(min(remaining, 0.005))
+                    continue
+            item_size = self._batch_item_size(data)
+            if items and size + item_size > global_settings.WS_BATCH_MAX_BYTES:
+                carry = data
+                break
+            items.append(data)
+            size += item_size
+            if size >= global_settings.WS_BATCH_MAX_BYTES:
+                break
+        if not items:
+            return carry
+
+        if len(items) == 1:
+            # 只有一条消息时按原格式发送, 省去容器开销
+            await websocket.send(items[0])
+            BYTES_OUT.inc(_payload_size(items[0]))
+        else:
+            batch = self.service_manager.audio_processor.pack_batch_frame(
+                self.service_manager.protocol_version, items, timestamp=time.time() * 1000)
+            await websocket.send(batch)
+            BYTES_OUT.inc(len(batch))
+        if any(isinstance(item, bytes) for item in items):
+            self.service_manager.stream_stats.on_downlink_sent()
+            self.service_manager.trace_mark("first_frame_sent")
+        return carry
+
     async def handle_client(self, websocket, path):
         """
         处理客户端连接
         """
         # connected
         logger.info("Client connected")
+        if self.draining:
+            # 监听已关闭前接入的连接, 让客户端重连到新进程
+            await websocket.close(code=1012, reason="Service restarting")
+            return
+        self.connections.add(websocket)
         process_task = None
+        authenticated = False
         try:
-            # 启动发送队列处理任务
-            process_task = asyncio.create_task(self.process_send_queue(websocket))
-
             # 获取连接时的请求头
             headers = websocket.request_headers
 
@@ -64,15 +156,32 @@ class WebSocketServer:
                 logger.error("Authentication failed for client")
                 return
 
-            # 鉴权通过后，向客户端发送成功响应
+            # 鉴权通过后，记录协商的协议版本，向客户端发送成功响应
+            protocol_version = self.auth_handler.negotiate_protocol_version(headers)
+            batching = self.auth_handler.batching_requested(headers)
+            self.service_manager.start_session(protocol_version)
+            authenticated = True
+            ACTIVE_SESSIONS.inc()
+            SESSIONS_TOTAL.inc()
             response = {
                 "type": "auth",
                 "message": "Client authenticated",
+                "protocol_version": protocol_version,
             }
+            if batching:
+                # 确认开启合并发送, 告知客户端容器的大小和等待上限
+                response["batching"] = {
+                    "max_bytes": global_settings.WS_BATCH_MAX_BYTES,
+                    "max_delay_ms": global_settings.WS_BATCH_MAX_DELAY_MS,
+                }
             await websocket.send(json.dumps(response))
 
+            # 启动发送队列处理任务
+            process_task = asyncio.create_task(self.process_send_queue(websocket, batching))
+
             # 开始接收和处理客户端消息
             async for message in websocket:
+                BYTES_IN.inc(_payload_size(message))
                 if isinstance(message, bytes):
                     # 处理音频消息
                     await self.audio_handler.handle_audio_message(message)
@@ -87,15 +196,63 @@ class WebSocketServer:
             logger.warning(f"Connection closed: {e}")
             self.service_manager.reset_services()
         finally:
+            self.connections.discard(websocket)
             if process_task:
                 process_task.cancel()
-            logger.info("Client disconnected")
+            if authenticated:
+                ACTIVE_SESSIONS.dec()
+            logger.info(f"Client disconnected, stream stats: {json.dumps(self.service_manager.stream_stats.summary(), ensure_ascii=False)}, "
+                        f"queue stats: {json.dumps(self.service_manager.queue_stats(), ensure_ascii=False)}, "
+                        f"intent cache stats: {json.dumps(self.service_manager.intent_service.cache_stats(), ensure_ascii=False)}, "
+                        f"tts cache stats: {json.dumps(self.service_manager.tts_cache.stats() if self.service_manager.tts_cache else None)}")
+            self.service_manager.end_trace()
+            if self.service_manager.tracer is not None:
+                logger.info(f"Turn latency: {json.dumps(self.service_manager.tracer.summary())}")
             self.service_manager.reset_services()
 
-    async def start_server(self):
+    async def start_server(self, on_ready=None):
         """
-        启动 WebSocket 服务器
+        启动 WebSocket 服务器, 运行到 drain 完成
+        :param on_ready: 开始监听后调用 (通知 config_ui 新进程已就绪)
         """
-        async with websockets.serve(self.handle_client, self.host, self.port):
+        self._stopped = asyncio.get_running_loop().create_future()
+        async with websockets.serve(self.handle_client, self.host, self.port,
+                                    reuse_port=self.reuse_port) as server:
+            self.server = server
             logger.info(f"WebSocket server started on {self.host}:{self.port}")
-            await asyncio.Future()  # 保持服务器运行
+            if on_ready is not None:
+                on_ready()
+            await self._stopped  # 保持服务器运行
+
+    async def drain(self, timeout: float):
+        """
+        优雅退出: 停止接受新连接, 等待当前轮次结束后关闭已有连接, 然后结束 start_server
+        客户端收到 1012 (Service Restart) 后重连, 由共用端口的新进程接受
+        :param timeout: 等待当前轮次结束的最长时间 (秒)
+        """
+        if self.draining or self.server is None:
+            return
+        self.draining = True
+        # 只关闭监听 socket, 已有连接不受影响
+        self.server.server.close()
+        logger.info(f"Draining: stopped accepting new connections, {len(self.connections)} client(s) connected")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        sm = self.service_manager
+        while self.connections and loop.time() < deadline:
+            # 用户没有说到一半, 没有进行中的轮次, 并且已生成的音频都已发出
+            if (not sm.user_speaking and not sm.turn_active
+                    and sm.audio_queue.empty() and sm.ws_send_queue.empty()):
+                break
+            await asyncio.sleep(0.1)
+        else:
+            if self.connections:
+                logger.warning(f"Drain timeout after {timeout}s, closing connections with a turn in progress")
+        for websocket in list(self.connections):
+            try:
+                await websocket.close(code=1012, reason="Service restarting")
+            except Exception:
+                pass
+        logger.info("Drain complete, shutting down")
+        if not self._stopped.done():
+            self._stopped.set_result(None)